@@ -0,0 +1,165 @@
+import atexit
+import datetime
+import json
+import os
+import queue
+import threading
+import time
+
+INSERT_ACTIVITY = "INSERT INTO activities (user_id, user_name, activity_type, details, timestamp, day) VALUES (?, ?, ?, ?, ?, ?)"
+
+# Politiche in caso di coda piena
+DROP_NEWEST = 'drop_newest'   # scarta l'evento appena arrivato
+DROP_OLDEST = 'drop_oldest'   # scarta l'evento più vecchio in coda
+BLOCK = 'block'               # attende (al più block_timeout) che si liberi spazio
+
+
+# Logger delle attività in background: le richieste accodano gli eventi in memoria
+# e un thread dedicato li scrive con executemany in un'unica transazione,
+# ogni batch_size eventi oppure ogni flush_interval_ms millisecondi
+class ActivityLogger:
+    def __init__(self, get_connection, batch_size=100, flush_interval_ms=500,
+                 max_queue=10000, drop_policy=DROP_NEWEST, block_timeout=0.1):
+        self.get_connection = get_connection
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self.drop_policy = drop_policy
+        self.block_timeout = block_timeout
+        self._coda = queue.Queue(maxsize=max_queue)
+        self._scrittura = threading.Lock()
+        self._avvio = threading.Lock()
+        self._contatori = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._pid = None
+        self.scritti = 0
+        self.scartati = 0
+        self.errori = 0
+        atexit.register(self.chiudi)
+
+    # Il thread parte al primo evento (e riparte nei worker dopo un fork)
+    def _assicura_writer(self):
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._avvio:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._loop, name='activity-logger', daemon=True)
+            self._thread.start()
+
+    def log(self, user_id, user_name, activity_type, details=None):
+        timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        details_json = json.dumps(details) if details else None
+        evento = (user_id, user_name, activity_type, details_json, timestamp, timestamp[:10])
+
+        self._assicura_writer()
+
+        try:
+            if self.drop_policy == BLOCK:
+                self._coda.put(evento, timeout=self.block_timeout)
+            else:
+                self._coda.put_nowait(evento)
+            return True
+        except queue.Full:
+            pass
+
+        if self.drop_policy == DROP_OLDEST:
+            try:
+                self._coda.get_nowait()
+                self._coda.task_done()
+                self._conta('scartati')
+                self._coda.put_nowait(evento)
+                return True
+            except (queue.Empty, queue.Full):
+                pass
+
+        self._conta('scartati')
+        return False
+
+    # I contatori sono aggiornati dal writer, da flush() e dalle richieste
+    def _conta(self, contatore, n=1):
+        with self._contatori:
+            setattr(self, contatore, getattr(self, contatore) + n)
+
+    def _preleva(self, attesa):
+        batch = []
+        try:
+            batch.append(self._coda.get(timeout=attesa))
+        except queue.Empty:
+            return batch
+
+        scadenza = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            restante = scadenza - time.monotonic()
+            if restante <= 0:
+                break
+            try:
+                batch.append(self._coda.get(timeout=restante))
+            except queue.Empty:
+                break
+        return batch
+
+    def _scrivi(self, batch):
+        if not batch:
+            return
+        with self._scrittura:
+            conn = None
+            try:
+                # Anche l'attesa di una connessione (pool esaurito) può fallire:
+                # gli eventi vanno comunque segnati come elaborati
+                conn = self.get_connection()
+                conn.executemany(INSERT_ACTIVITY, batch)
+                conn.commit()
+                self._conta('scritti', len(batch))
+            except Exception as e:
+                self._conta('errori', len(batch))
+                print(f"Errore durante il log delle attività ({len(batch)} eventi persi): {e}")
+            finally:
+                try:
+                    if conn is not None:
+                        conn.close()
+                finally:
+                    for _ in batch:
+                        self._coda.task_done()
+
+    # Un errore imprevisto non deve fermare il writer: gli eventi successivi
+    # andrebbero persi e flush() resterebbe in attesa per sempre
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self._scrivi(self._preleva(self.flush_interval))
+            except Exception as e:
+                print(f"Errore nel thread di log delle attività: {e}")
+                time.sleep(self.flush_interval)
+
+    # Scrive subito tutti gli eventi in coda e attende il batch eventualmente
+    # già in mano al writer (usato allo spegnimento e nei benchmark)
+    def flush(self):
+        while True:
+            batch = []
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._coda.get_nowait())
+                except queue.Empty:
+                    break
+            if not batch:
+                break
+            self._scrivi(batch)
+        self._coda.join()
+
+    def chiudi(self):
+        self._stop.set()
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join(timeout=self.flush_interval * 2 + 1)
+        self.flush()
+
+    def statistiche(self):
+        with self._contatori:
+            return {
+                'in_coda': self._coda.qsize(),
+                'scritti': self.scritti,
+                'scartati': self.scartati,
+                'errori': self.errori,
+            }
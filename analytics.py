@@ -0,0 +1,275 @@
+import math
+
+from observation_codes import LIVELLI as SCALA_LIVELLI
+
+# Analisi dei progressi degli allievi: le osservazioni sono prima aggregate da
+# SQLite per (classe, allievo, dimensione, livello, mese) e poi elaborate in
+# blocco con NumPy (bincount sulle chiavi dei gruppi), così pagelle, andamenti
+# e confronti tra classi si calcolano per tutta la scuola senza una query per allievo
+
+LIVELLI = [nome for _, nome, _ in SCALA_LIVELLI]
+
+# Valore numerico dei livelli, lo stesso di livello_numerico delle rubriche
+# (data/create_database.py): medie e tendenze sono espresse su questa scala
+VALORI_LIVELLO = {nome.lower(): valore for _, nome, valore in SCALA_LIVELLI}
+
+GRUPPI_ANDAMENTO = ('scuola', 'classe', 'allievo')
+
+# Raggruppa sui codici interi di dimensione e livello (migrazione 7): senza filtri
+# o per classe la query legge solo l'indice coprente idx_osservazioni_analisi,
+# già nell'ordine dei gruppi (l'ORDER BY li ripete per intero, così non serve un
+# ordinamento in più). Il mese è restituito come anno * 12 + mese - 1
+QUERY_AGGREGATA = """
+    SELECT classe, allievo, COALESCE(dimensione_id, 0) AS dimensione, COALESCE(livello_id, 0) AS livello,
+           COALESCE(CAST(substr(data_creazione, 1, 4) AS INTEGER) * 12
+                    + CAST(substr(data_creazione, 6, 2) AS INTEGER) - 1, -1) AS mese,
+           COUNT(*) AS n, MAX(data_creazione) AS ultima
+    FROM osservazioni
+    WHERE 1=1 {condizioni}
+    GROUP BY classe, allievo, dimensione_id, livello_id, substr(data_creazione, 1, 7)
+    ORDER BY classe, allievo, dimensione_id, livello_id, substr(data_creazione, 1, 7)
+"""
+
+# Cambia a ogni nuova osservazione (id massimo) e a ogni modifica o cancellazione
+# (versione mantenuta dai trigger della migrazione 6): chiave delle cache delle analisi
+FIRMA_QUERY = """
+    SELECT (SELECT COALESCE(MAX(id), 0) FROM osservazioni),
+           (SELECT versione FROM meta_versioni WHERE nome = 'osservazioni')
+"""
+
+
+def firma_osservazioni(conn):
+    return tuple(conn.execute(FIRMA_QUERY).fetchone())
+
+
+def carica(conn, disciplina='', classe='', allievo='', dal='', al=''):
+    condizioni, params = '', []
+    for colonna, valore in (('disciplina', disciplina), ('classe', classe), ('allievo', allievo)):
+        if valore:
+            condizioni += f" AND {colonna} = ?"
+            params.append(valore)
+    if dal:
+        condizioni += " AND data_creazione >= ?"
+        params.append(dal)
+    if al:
+        condizioni += " AND data_creazione < date(?, '+1 day')"
+        params.append(al)
+
+    righe = conn.execute(QUERY_AGGREGATA.format(condizioni=condizioni), params).fetchall()
+    return CuboOsservazioni(righe, dict(conn.execute("SELECT id, nome FROM dimensioni").fetchall()))
+
+
+def _numero(valore, cifre=2):
+    valore = float(valore)
+    return None if math.isnan(valore) else round(valore, cifre)
+
+
+# Codici consecutivi delle chiavi di righe già ordinate: il codice cambia quando
+# la chiave è diversa da quella della riga precedente
+def _codici_ordinati(chiavi):
+    distinte, codici = [], []
+    for chiave in chiavi:
+        if not distinte or chiave != distinte[-1]:
+            distinte.append(chiave)
+        codici.append(len(distinte) - 1)
+    return distinte, codici
+
+
+# Osservazioni aggregate come vettori NumPy paralleli (una posizione per gruppo
+# classe/allievo/dimensione/livello/mese) con codici interi per ogni categoria.
+# Le righe arrivano ordinate per classe e allievo e con i codici numerici di
+# dimensione e livello (0 se assenti); nomi_dimensioni traduce dimensione_id
+class CuboOsservazioni:
+    def __init__(self, righe, nomi_dimensioni=None):
+        import numpy as np
+
+        righe = [tuple(r) for r in righe]
+        classi, allievi, dimensioni, livelli, mesi, conteggi, ultime = (
+            zip(*righe) if righe else ((),) * 7
+        )
+        nomi_dimensioni = nomi_dimensioni or {}
+
+        self.n = np.array(conteggi, dtype=np.float64)
+        self.totale = int(self.n.sum())
+
+        # Allievo identificato da classe e nome
+        studenti, codici = _codici_ordinati(zip(classi, allievi))
+        self.studenti = [f"{c}\x1f{a}" for c, a in studenti]
+        self.codice_studente = np.array(codici, dtype=np.int64)
+        self.classi, codici = _codici_ordinati(classi)
+        self.codice_classe = np.array(codici, dtype=np.int64)
+
+        # Dimensioni nell'ordine dei codici (le canoniche hanno i primi), quelle
+        # senza codice per ultime
+        dimensione_id = np.array(dimensioni, dtype=np.int64)
+        presenti = np.unique(dimensione_id)
+        presenti = np.concatenate([presenti[presenti > 0], presenti[presenti == 0]])
+        self.dimensioni = [nomi_dimensioni.get(int(d), '') for d in presenti]
+        posizione = np.zeros(int(presenti.max()) + 1 if len(presenti) else 1, dtype=np.int64)
+        posizione[presenti] = np.arange(len(presenti))
+        self.codice_dimensione = posizione[dimensione_id]
+
+        # livello_id da 1 a 4 come la scala: codice 0-3, -1 senza livello
+        valori = np.full(len(SCALA_LIVELLI) + 1, np.nan)
+        for id_livello, _, valore in SCALA_LIVELLI:
+            valori[id_livello] = valore
+        livello_id = np.array(livelli, dtype=np.int64)
+        self.valore = valori[livello_id]
+        self.codice_livello = livello_id - 1
+
+        self.mese = np.array(mesi, dtype=np.int64)
+        validi = self.mese[self.mese >= 0]
+        self.primo_mese = int(validi.min()) if len(validi) else 0
+        self.n_mesi = int(validi.max()) - self.primo_mese + 1 if len(validi) else 0
+        self.ultima = np.array(ultime, dtype=str)
+
+        # Righe utilizzabili per medie e tendenze (livello riconosciuto)
+        self.con_livello = ~np.isnan(self.valore)
+
+    @property
+    def n_dimensioni(self):
+        return len(self.dimensioni)
+
+    # Somme pesate per gruppo: conteggi, somma dei livelli e termini della regressione
+    # lineare pesata livello ~ mese, restituite come matrici (gruppi, dimensioni)
+    def _statistiche(self, gruppo, n_gruppi):
+        import numpy as np
+
+        D = self.n_dimensioni
+        m = self.con_livello & (self.mese >= 0)
+        chiave = gruppo[m] * D + self.codice_dimensione[m]
+        w = self.n[m]
+        y = self.valore[m]
+        x = (self.mese[m] - self.primo_mese).astype(np.float64)
+
+        def somma(pesi):
+            return np.bincount(chiave, weights=pesi, minlength=n_gruppi * D).reshape(n_gruppi, D)
+
+        sw, sy, sx, sxx, sxy = somma(w), somma(w * y), somma(w * x), somma(w * x * x), somma(w * x * y)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            media = sy / sw
+            denominatore = sw * sxx - sx * sx
+            tendenza = np.where(denominatore > 0, (sw * sxy - sx * sy) / denominatore, np.nan)
+        return sw, media, tendenza
+
+    def _distribuzione(self, gruppo, n_gruppi):
+        import numpy as np
+
+        D, L = self.n_dimensioni, len(LIVELLI)
+        m = self.codice_livello >= 0
+        chiave = (gruppo[m] * D + self.codice_dimensione[m]) * L + self.codice_livello[m]
+        return np.bincount(chiave, weights=self.n[m], minlength=n_gruppi * D * L).reshape(n_gruppi, D, L)
+
+    # Livello dell'osservazione più recente per gruppo e dimensione (-1 se assente)
+    def _ultimo_livello(self, gruppo, n_gruppi):
+        import numpy as np
+
+        D = self.n_dimensioni
+        ultimo = np.full(n_gruppi * D, -1, dtype=np.int64)
+        m = np.flatnonzero(self.codice_livello >= 0)
+        if len(m):
+            chiave = gruppo[m] * D + self.codice_dimensione[m]
+            ordine = np.lexsort((self.ultima[m], chiave))
+            chiave_ordinata = chiave[ordine]
+            fine = np.flatnonzero(np.append(chiave_ordinata[1:] != chiave_ordinata[:-1], True))
+            ultimo[chiave_ordinata[fine]] = self.codice_livello[m][ordine][fine]
+        return ultimo.reshape(n_gruppi, D)
+
+    def _per_dimensione(self, conteggi, media, tendenza, distribuzione, ultimo=None):
+        risultato = {}
+        for d, nome in enumerate(self.dimensioni):
+            if not distribuzione[d].any() and not conteggi[d]:
+                continue
+            voce = {
+                'osservazioni': int(distribuzione[d].sum()),
+                'media': _numero(media[d]),
+                'tendenza_mensile': _numero(tendenza[d], 3),
+                'distribuzione': {livello: int(c) for livello, c in zip(LIVELLI, distribuzione[d])},
+            }
+            if ultimo is not None:
+                voce['ultimo_livello'] = LIVELLI[ultimo[d]] if ultimo[d] >= 0 else None
+            risultato[nome] = voce
+        return risultato
+
+    # Pagella di ogni allievo: per dimensione numero di osservazioni, livello medio,
+    # tendenza (variazione media del livello al mese), distribuzione e ultimo livello
+    def pagelle(self):
+        import numpy as np
+
+        S = len(self.studenti)
+        conteggi, media, tendenza = self._statistiche(self.codice_studente, S)
+        distribuzione = self._distribuzione(self.codice_studente, S)
+        ultimo = self._ultimo_livello(self.codice_studente, S)
+        totali = np.bincount(self.codice_studente, weights=self.n, minlength=S)
+
+        pagelle = []
+        for s, chiave in enumerate(self.studenti):
+            classe, allievo = chiave.split('\x1f', 1)
+            pagelle.append({
+                'allievo': allievo,
+                'classe': classe,
+                'osservazioni': int(totali[s]),
+                'dimensioni': self._per_dimensione(conteggi[s], media[s], tendenza[s], distribuzione[s], ultimo[s]),
+            })
+        return pagelle
+
+    # Confronto tra classi: statistiche per classe e dimensione e scarto dalla
+    # media di tutte le classi selezionate
+    def confronto_classi(self):
+        import numpy as np
+
+        C = len(self.classi)
+        conteggi, media, tendenza = self._statistiche(self.codice_classe, C)
+        distribuzione = self._distribuzione(self.codice_classe, C)
+        zero = np.zeros(len(self.n), dtype=np.int64)
+        conteggi_scuola, media_scuola, tendenza_scuola = self._statistiche(zero, 1)
+        distribuzione_scuola = self._distribuzione(zero, 1)
+
+        classi = []
+        for c, nome in enumerate(self.classi):
+            dimensioni = self._per_dimensione(conteggi[c], media[c], tendenza[c], distribuzione[c])
+            for d, dimensione in enumerate(self.dimensioni):
+                if dimensione in dimensioni:
+                    dimensioni[dimensione]['scarto_dalla_media'] = _numero(media[c, d] - media_scuola[0, d])
+            classi.append({
+                'classe': nome,
+                'allievi': int(len(np.unique(self.codice_studente[self.codice_classe == c]))),
+                'dimensioni': dimensioni,
+            })
+
+        return {
+            'scuola': self._per_dimensione(conteggi_scuola[0], media_scuola[0], tendenza_scuola[0], distribuzione_scuola[0]),
+            'classi': classi,
+        }
+
+    # Livello medio mese per mese di ogni gruppo (scuola, classe o allievo) e dimensione
+    def andamento(self, per='scuola'):
+        import numpy as np
+
+        if per == 'classe':
+            gruppo, nomi = self.codice_classe, list(self.classi)
+        elif per == 'allievo':
+            gruppo = self.codice_studente
+            nomi = [' - '.join(reversed(s.split('\x1f', 1))) for s in self.studenti]
+        else:
+            gruppo, nomi = np.zeros(len(self.n), dtype=np.int64), ['scuola']
+
+        G, D, M = len(nomi), self.n_dimensioni, self.n_mesi
+        m = self.con_livello & (self.mese >= 0)
+        chiave = (gruppo[m] * D + self.codice_dimensione[m]) * M + (self.mese[m] - self.primo_mese)
+        conteggi = np.bincount(chiave, weights=self.n[m], minlength=G * D * M).reshape(G, D, M)
+        somme = np.bincount(chiave, weights=self.n[m] * self.valore[m], minlength=G * D * M).reshape(G, D, M)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            medie = somme / conteggi
+
+        mesi = [f"{(self.primo_mese + i) // 12:04d}-{(self.primo_mese + i) % 12 + 1:02d}" for i in range(M)]
+        serie = []
+        for g, nome in enumerate(nomi):
+            serie.append({
+                'gruppo': nome,
+                'dimensioni': {
+                    dimensione: [_numero(v) for v in medie[g, d]]
+                    for d, dimensione in enumerate(self.dimensioni) if conteggi[g, d].any()
+                },
+            })
+        return {'mesi': mesi, 'serie': serie}
@@ -1,13 +1,42 @@
 import os
-import sqlite3
 import json
 import datetime
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for
+import hmac
+import io
+import time
+from flask import (
+    Flask, Response, render_template, request, jsonify, session, redirect, url_for, stream_template,
+    stream_with_context
+)
 from dotenv import load_dotenv
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-import numpy as np
-import openai
+import click
+from activity_logger import ActivityLogger, DROP_NEWEST
+from concurrency import LimiteConcorrenza
+import metrics
+from metrics import span
+from profiler import SamplingProfiler
+import analytics
+import descriptor_ranker
+from db import DatabaseManager
+from descriptor_index import DescriptorIndex
+from embedding_index import EmbeddingIndex, HashedEmbedder
+from group_commit import ScrittoreRaggruppato
+import observation_io
+from observation_codes import Normalizzatore
+import rollups
+from chatbot import (
+    CHATBOT_MERGED_PROMPT, CHATBOT_SUGGESTIONS_PROMPT, CHATBOT_SYSTEM_PROMPT, MODE_ASYNC, MODE_MERGED, MODE_SERIAL,
+    SuggerimentiAsincroni, evento_sse, genera_risposta, genera_risposta_e_suggerimenti, genera_risposta_stream,
+    genera_suggerimenti
+)
+from llm import CircuitBreaker, ResilientBackend, crea_backend
+from response_cache import ResponseCache, chiave_cache, normalizza_testo
+from observation_search import codifica_cursore, decodifica_cursore, pagina_osservazioni, tutte_le_osservazioni
+from migrations import (
+    ADMIN_MIGRAZIONI, QUERY_CRITICHE_ADMIN, QUERY_CRITICHE_RIZA, RIZA_MIGRAZIONI,
+    applica_migrazioni, verifica_piani
+)
+from text_analysis import TextAnalyzer, parse_char_ngrams
 
 # Carica le variabili d'ambiente
 load_dotenv()
@@ -16,30 +45,269 @@ app = Flask(__name__)
 app.secret_key = os.getenv('SECRET_KEY', 'chiave_segreta_predefinita')
 
 # Configurazione OpenAI
-openai.api_key = os.getenv('OPENAI_API_KEY')
+OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
 AI_MODEL = os.getenv('AI_MODEL', 'gpt-3.5-turbo')
 MAX_TOKENS = int(os.getenv('MAX_TOKENS', 1000))
 TEMPERATURE = float(os.getenv('TEMPERATURE', 0.3))
 ENABLE_AI = os.getenv('ENABLE_AI', 'True').lower() == 'true'
 
+# Motore locale per i suggerimenti dei descrittori (prefiltro dell'AI e fallback):
+# 'tfidf' oppure 'embedding' (vettori densi su file memory-mapped, senza rete)
+MATCHING_ENGINE = os.getenv('MATCHING_ENGINE', 'tfidf')
+EMBEDDING_DIM = int(os.getenv('EMBEDDING_DIM', 512))
+
+# Backend LLM ('openai' oppure 'fake' per sviluppo e test senza rete)
+LLM_BACKEND = os.getenv('LLM_BACKEND', 'openai')
+OPENAI_BASE_URL = os.getenv('OPENAI_BASE_URL', '')
+FAKE_LLM_LATENCY_MS = int(os.getenv('FAKE_LLM_LATENCY_MS', 0))
+FAKE_LLM_TOKEN_MS = int(os.getenv('FAKE_LLM_TOKEN_MS', 20))
+FAKE_LLM_ERROR_RATE = float(os.getenv('FAKE_LLM_ERROR_RATE', 0))
+LLM_TIMEOUT = float(os.getenv('LLM_TIMEOUT', 60))
+
+# Resilienza delle chiamate al modello: scadenza complessiva (secondi, tentativi
+# inclusi) per endpoint, tentativi ripetuti sugli errori temporanei e circuit
+# breaker che sospende il modello per un cooldown dopo errori consecutivi
+CHATBOT_LLM_DEADLINE = float(os.getenv('CHATBOT_LLM_DEADLINE', 30))
+SUGGESTIONS_LLM_DEADLINE = float(os.getenv('SUGGESTIONS_LLM_DEADLINE', 10))
+LLM_MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', 2))
+LLM_BREAKER_THRESHOLD = int(os.getenv('LLM_BREAKER_THRESHOLD', 5))
+LLM_BREAKER_COOLDOWN = float(os.getenv('LLM_BREAKER_COOLDOWN', 30))
+
+# Richieste contemporanee ammesse per gli endpoint che chiamano il modello e secondi
+# di attesa di un posto libero prima di rispondere 503 (vedi gunicorn.conf.py)
+CHATBOT_MAX_CONCURRENT = int(os.getenv('CHATBOT_MAX_CONCURRENT', 32))
+SUGGESTIONS_MAX_CONCURRENT = int(os.getenv('SUGGESTIONS_MAX_CONCURRENT', 16))
+LLM_QUEUE_TIMEOUT = float(os.getenv('LLM_QUEUE_TIMEOUT', 5))
+
+# Modalità del chatbot: 'serial' (risposta poi domande correlate), 'merged' (una sola
+# chiamata con output JSON) o 'async' (domande correlate generate in background)
+CHATBOT_MODE = os.getenv('CHATBOT_MODE', MODE_SERIAL)
+CHATBOT_SUGGESTIONS_WORKERS = int(os.getenv('CHATBOT_SUGGESTIONS_WORKERS', 4))
+
+# Suggerimenti AI in due fasi: candidati TF-IDF (tra minimo e massimo, finché il loro
+# testo rientra nel budget stimato di token) riordinati dal modello
+RANKER_MIN_CANDIDATES = int(os.getenv('RANKER_MIN_CANDIDATES', 5))
+RANKER_MAX_CANDIDATES = int(os.getenv('RANKER_MAX_CANDIDATES', 15))
+RANKER_TOKEN_BUDGET = int(os.getenv('RANKER_TOKEN_BUDGET', 1500))
+# Output strutturato (response_format json_object) per i modelli che lo supportano
+RANKER_JSON_MODE = os.getenv('RANKER_JSON_MODE', 'True').lower() == 'true'
+
+# Risposte del chatbot inviate token per token (Server-Sent Events su /chatbot_query_stream)
+CHATBOT_STREAMING = os.getenv('CHATBOT_STREAMING', 'True').lower() == 'true'
+
+# Cache delle risposte del chatbot (TTL in secondi, dimensione massima, file SQLite opzionale)
+CHATBOT_CACHE_ENABLED = os.getenv('CHATBOT_CACHE_ENABLED', 'True').lower() == 'true'
+CHATBOT_CACHE_TTL = int(os.getenv('CHATBOT_CACHE_TTL', 86400))
+CHATBOT_CACHE_SIZE = int(os.getenv('CHATBOT_CACHE_SIZE', 1000))
+CHATBOT_CACHE_PATH = os.getenv('CHATBOT_CACHE_PATH', '')
+
+# Cache dei suggerimenti dei descrittori (stessa osservazione normalizzata, disciplina e versione dei descrittori)
+SUGGESTIONS_CACHE_ENABLED = os.getenv('SUGGESTIONS_CACHE_ENABLED', 'True').lower() == 'true'
+SUGGESTIONS_CACHE_TTL = int(os.getenv('SUGGESTIONS_CACHE_TTL', 86400))
+SUGGESTIONS_CACHE_SIZE = int(os.getenv('SUGGESTIONS_CACHE_SIZE', 5000))
+SUGGESTIONS_CACHE_PATH = os.getenv('SUGGESTIONS_CACHE_PATH', '')
+
+# Cache delle analisi dei progressi (la chiave contiene la firma delle osservazioni,
+# quindi ogni nuovo salvataggio rende obsolete le voci calcolate prima)
+ANALYTICS_CACHE_ENABLED = os.getenv('ANALYTICS_CACHE_ENABLED', 'True').lower() == 'true'
+ANALYTICS_CACHE_TTL = int(os.getenv('ANALYTICS_CACHE_TTL', 3600))
+ANALYTICS_CACHE_SIZE = int(os.getenv('ANALYTICS_CACHE_SIZE', 200))
+
 # Percorsi database
 DB_PATH = os.path.join(os.path.dirname(__file__), 'data', 'riza.db')
 ADMIN_DB_PATH = os.path.join(os.path.dirname(__file__), 'data', 'admin.db')
 
+# Intervallo (secondi) tra due controlli di modifica della tabella descrittori
+DESCRIPTOR_INDEX_CHECK_INTERVAL = float(os.getenv('DESCRIPTOR_INDEX_CHECK_INTERVAL', 5))
+
+# Configurazione dell'analisi del testo (italiano) per il matcher dei descrittori
+TEXT_STEMMING = os.getenv('TEXT_STEMMING', 'True').lower() == 'true'
+TEXT_REMOVE_ACCENTS = os.getenv('TEXT_REMOVE_ACCENTS', 'True').lower() == 'true'
+TEXT_CHAR_NGRAMS = parse_char_ngrams(os.getenv('TEXT_CHAR_NGRAMS', ''))
+
+# Dimensione della pagina di /view_observations e limite massimo per /api/observations
+OBSERVATIONS_PAGE_SIZE = int(os.getenv('OBSERVATIONS_PAGE_SIZE', 50))
+OBSERVATIONS_MAX_PAGE_SIZE = int(os.getenv('OBSERVATIONS_MAX_PAGE_SIZE', 500))
+
+# Numero massimo di osservazioni accettate da /get_suggestions_batch e di
+# suggerimenti (top_k) restituiti per ciascuna
+BATCH_MAX_OBSERVATIONS = int(os.getenv('BATCH_MAX_OBSERVATIONS', 200))
+BATCH_MAX_TOP_K = 20
+
+# Righe per transazione nell'importazione in blocco e per frammento nell'esportazione
+IMPORT_BATCH_SIZE = int(os.getenv('IMPORT_BATCH_SIZE', 1000))
+EXPORT_BATCH_SIZE = int(os.getenv('EXPORT_BATCH_SIZE', 500))
+
+# Pool di connessioni SQLite (uno per database) con pragma ottimizzati. Le
+# connessioni sono create solo quando servono: il massimo predefinito è il numero
+# di thread per worker di gunicorn, così ogni richiesta ne trova una
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', os.getenv('GUNICORN_THREADS', 32)))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 10))
+DB_BUSY_TIMEOUT_MS = int(os.getenv('DB_BUSY_TIMEOUT_MS', 5000))
+
+db_manager = DatabaseManager(
+    max_size=DB_POOL_SIZE,
+    timeout=DB_POOL_TIMEOUT,
+    pragmas={'busy_timeout': DB_BUSY_TIMEOUT_MS}
+)
+db_manager.init_app(app)
+
+# Strumentazione delle richieste: istogrammi delle durate per endpoint e per fase
+# (span), esposti in formato Prometheus su /metrics (admin o token METRICS_TOKEN)
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+metrics.init_app(app)
+
+# Profiler a campionamento opzionale: salva gli stack delle richieste più lente di
+# PROFILER_SLOW_MS in PROFILER_DIR, in formato "folded" per i flame graph
+PROFILER_ENABLED = os.getenv('PROFILER_ENABLED', 'False').lower() == 'true'
+PROFILER_SLOW_MS = int(os.getenv('PROFILER_SLOW_MS', 1000))
+PROFILER_INTERVAL_MS = int(os.getenv('PROFILER_INTERVAL_MS', 5))
+PROFILER_DIR = os.getenv('PROFILER_DIR', os.path.join(os.path.dirname(__file__), 'profiles'))
+if PROFILER_ENABLED:
+    SamplingProfiler(PROFILER_DIR, soglia_ms=PROFILER_SLOW_MS, intervallo_ms=PROFILER_INTERVAL_MS).init_app(app)
+
+# Applica le migrazioni di schema (tabelle base, indici, colonne derivate)
+AUTO_MIGRATE = os.getenv('AUTO_MIGRATE', 'True').lower() == 'true'
+
+def init_databases():
+    for path, migrazioni in ((DB_PATH, RIZA_MIGRAZIONI), (ADMIN_DB_PATH, ADMIN_MIGRAZIONI)):
+        for versione, descrizione in applica_migrazioni(path, migrazioni):
+            print(f"Migrazione {versione} applicata a {os.path.basename(path)}: {descrizione}")
+
+@app.cli.command('migrate')
+def migrate_command():
+    init_databases()
+
+# Verifica che le query più frequenti usino gli indici (EXPLAIN QUERY PLAN)
+@app.cli.command('check-query-plans')
+def check_query_plans_command():
+    esito_globale = True
+    for path, query in ((DB_PATH, QUERY_CRITICHE_RIZA), (ADMIN_DB_PATH, QUERY_CRITICHE_ADMIN)):
+        with db_manager.pool(path).connessione() as conn:
+            for nome, (ok, piano) in verifica_piani(conn, query).items():
+                esito_globale = esito_globale and ok
+                print(f"{'OK ' if ok else 'KO '} {nome}: {' | '.join(piano)}")
+    if not esito_globale:
+        raise SystemExit(1)
+
+# Ricalcola da zero le statistiche della dashboard (--verify: solo confronto)
+@app.cli.command('rebuild-rollups')
+@click.option('--verify', is_flag=True, help='Confronta i riepiloghi con un ricalcolo senza modificarli')
+def rebuild_rollups_command(verify):
+    with db_manager.pool(ADMIN_DB_PATH).connessione() as conn:
+        if not verify:
+            rollups.ricostruisci(conn)
+            conn.commit()
+        differenze = rollups.verifica(conn)
+    
+    for tabella, righe in differenze.items():
+        for chiave, (presente, atteso) in sorted(righe.items()):
+            print(f"{tabella} {chiave}: {presente} invece di {atteso}")
+    if differenze:
+        raise SystemExit(1)
+    print("Statistiche della dashboard coerenti con activities e users")
+
+# Importa osservazioni da un file CSV o JSONL ('-' per lo standard input)
+@app.cli.command('import-observations')
+@click.argument('file', type=click.File('r', encoding='utf-8-sig'))
+@click.option('--format', 'formato', type=click.Choice(observation_io.FORMATI), help='Predefinito: dall\'estensione')
+@click.option('--assign-descriptors', is_flag=True, help='Assegna il descrittore più simile alle righe senza id_descrittore')
+@click.option('--min-similarity', default=0.0, help='Similarità minima per l\'assegnazione automatica')
+@click.option('--batch-size', default=None, type=int, help='Righe per transazione')
+@click.option('--dry-run', is_flag=True, help='Valida il file senza scrivere nel database')
+def import_observations_command(file, formato, assign_descriptors, min_similarity, batch_size, dry_run):
+    formato = observation_io.riconosci_formato(formato, file.name)
+    with db_manager.pool(DB_PATH).connessione() as conn:
+        esito = observation_io.importa(
+            conn, observation_io.leggi(file, formato),
+            blocco=batch_size or IMPORT_BATCH_SIZE,
+            matcher=matcher if assign_descriptors else None,
+            soglia=min_similarity,
+            simula=dry_run,
+            normalizzatore=normalizzatore_osservazioni
+        )
+    
+    for errore in esito['errori']:
+        print(f"Riga {errore['riga']}: {errore['errore']}")
+    print(
+        f"{'Validate' if dry_run else 'Importate'} {esito['importate']} osservazioni su {esito['lette']} "
+        f"({esito['scartate']} scartate, {esito['descrittori_assegnati']} descrittori assegnati) in {esito['durata_s']}s"
+    )
+    if esito['scartate']:
+        raise SystemExit(1)
+
+# Esporta le osservazioni (con gli stessi filtri di /view_observations) su file o standard output
+@app.cli.command('export-observations')
+@click.argument('file', type=click.File('w', encoding='utf-8'), default='-')
+@click.option('--format', 'formato', type=click.Choice(observation_io.FORMATI), default='csv')
+@click.option('--disciplina', default='')
+@click.option('--classe', default='')
+@click.option('--allievo', default='')
+@click.option('--dimensione', default='')
+def export_observations_command(file, formato, disciplina, classe, allievo, dimensione):
+    filtri = {'allievo': allievo, 'classe': classe, 'disciplina': disciplina, 'dimensione': dimensione, 'q': ''}
+    osservazioni = tutte_le_osservazioni(lambda: db_manager.connessione(DB_PATH), filtri, EXPORT_BATCH_SIZE)
+    for frammento in observation_io.esporta(osservazioni, formato, EXPORT_BATCH_SIZE):
+        file.write(frammento)
+
+if AUTO_MIGRATE:
+    init_databases()
+
 # Funzione per ottenere connessione al database RIZA
+# (durante una richiesta è sempre la stessa connessione, rilasciata al teardown)
 def get_db_connection():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+    return db_manager.connessione(DB_PATH)
+
+# Connessione non legata alla richiesta, restituita al pool con close(): per i
+# generatori delle risposte in streaming, che la prendono blocco per blocco
+def get_stream_db_connection():
+    return db_manager.connessione(DB_PATH, legata_richiesta=False)
 
 # Funzione per ottenere connessione al database Admin
 def get_admin_db_connection():
-    conn = sqlite3.connect(ADMIN_DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+    return db_manager.connessione(ADMIN_DB_PATH)
+
+# Salvataggio delle osservazioni con group commit: i salvataggi contemporanei
+# (es. a fine lezione) sono scritti insieme in una sola transazione
+OBSERVATION_GROUP_COMMIT = os.getenv('OBSERVATION_GROUP_COMMIT', 'True').lower() == 'true'
+OBSERVATION_GROUP_COMMIT_WINDOW_MS = float(os.getenv('OBSERVATION_GROUP_COMMIT_WINDOW_MS', 2))
+OBSERVATION_GROUP_COMMIT_MAX_BATCH = int(os.getenv('OBSERVATION_GROUP_COMMIT_MAX_BATCH', 200))
+
+scrittore_osservazioni = ScrittoreRaggruppato(
+    lambda: db_manager.connessione(DB_PATH),
+    finestra_ms=OBSERVATION_GROUP_COMMIT_WINDOW_MS,
+    max_batch=OBSERVATION_GROUP_COMMIT_MAX_BATCH,
+    timeout=DB_POOL_TIMEOUT
+)
+
+# Codici numerici di dimensione, processo e livello calcolati in scrittura
+normalizzatore_osservazioni = Normalizzatore(lambda: db_manager.connessione(DB_PATH))
+
+# Logger asincrono delle attività: le richieste accodano, un thread scrive in batch
+ACTIVITY_LOG_ASYNC = os.getenv('ACTIVITY_LOG_ASYNC', 'True').lower() == 'true'
+ACTIVITY_LOG_BATCH_SIZE = int(os.getenv('ACTIVITY_LOG_BATCH_SIZE', 100))
+ACTIVITY_LOG_FLUSH_MS = int(os.getenv('ACTIVITY_LOG_FLUSH_MS', 500))
+ACTIVITY_LOG_MAX_QUEUE = int(os.getenv('ACTIVITY_LOG_MAX_QUEUE', 10000))
+ACTIVITY_LOG_DROP_POLICY = os.getenv('ACTIVITY_LOG_DROP_POLICY', DROP_NEWEST)
+
+activity_logger = ActivityLogger(
+    lambda: db_manager.connessione(ADMIN_DB_PATH),
+    batch_size=ACTIVITY_LOG_BATCH_SIZE,
+    flush_interval_ms=ACTIVITY_LOG_FLUSH_MS,
+    max_queue=ACTIVITY_LOG_MAX_QUEUE,
+    drop_policy=ACTIVITY_LOG_DROP_POLICY
+)
 
 # Funzione per registrare attività utente
 def log_activity(user_id, user_name, activity_type, details=None):
+    with span('log_activity'):
+        _log_activity(user_id, user_name, activity_type, details)
+
+def _log_activity(user_id, user_name, activity_type, details=None):
+    if ACTIVITY_LOG_ASYNC:
+        activity_logger.log(user_id, user_name, activity_type, details)
+        return
+    
     try:
         conn = get_admin_db_connection()
         cursor = conn.cursor()
@@ -48,8 +316,8 @@ def log_activity(user_id, user_name, activity_type, details=None):
         details_json = json.dumps(details) if details else None
         
         cursor.execute(
-            "INSERT INTO activities (user_id, user_name, activity_type, details, timestamp) VALUES (?, ?, ?, ?, ?)",
-            (user_id, user_name, activity_type, details_json, timestamp)
+            "INSERT INTO activities (user_id, user_name, activity_type, details, timestamp, day) VALUES (?, ?, ?, ?, ?, ?)",
+            (user_id, user_name, activity_type, details_json, timestamp, timestamp[:10])
         )
         
         conn.commit()
@@ -57,11 +325,144 @@ def log_activity(user_id, user_name, activity_type, details=None):
     except Exception as e:
         print(f"Errore durante il log dell'attività: {e}")
 
+# Client LLM condiviso
+llm_backend = ResilientBackend(
+    crea_backend(
+        LLM_BACKEND,
+        api_key=OPENAI_API_KEY,
+        base_url=OPENAI_BASE_URL,
+        timeout=LLM_TIMEOUT,
+        fake_latenza_ms=FAKE_LLM_LATENCY_MS,
+        fake_latenza_token_ms=FAKE_LLM_TOKEN_MS,
+        fake_tasso_errori=FAKE_LLM_ERROR_RATE
+    ),
+    scadenza=LLM_TIMEOUT,
+    tentativi=LLM_MAX_RETRIES,
+    soglia_circuito=LLM_BREAKER_THRESHOLD,
+    cooldown_circuito=LLM_BREAKER_COOLDOWN
+)
+
+def llm_disponibile():
+    return ENABLE_AI and llm_backend.disponibile()
+
+# Domande correlate generate in background (CHATBOT_MODE=async)
+suggerimenti_asincroni = SuggerimentiAsincroni(max_workers=CHATBOT_SUGGESTIONS_WORKERS)
+
+# Limiti di concorrenza per endpoint
+limite_chatbot = LimiteConcorrenza('chatbot', CHATBOT_MAX_CONCURRENT, attesa=LLM_QUEUE_TIMEOUT)
+limite_suggerimenti = LimiteConcorrenza('suggestions', SUGGESTIONS_MAX_CONCURRENT, attesa=LLM_QUEUE_TIMEOUT)
+
+# Cache delle risposte del chatbot condivisa tra le richieste del worker
+chatbot_cache = ResponseCache(
+    max_entries=CHATBOT_CACHE_SIZE,
+    ttl=CHATBOT_CACHE_TTL,
+    persist_path=CHATBOT_CACHE_PATH or None,
+    nome='chatbot'
+)
+
+# Indice TF-IDF dei descrittori, addestrato una volta per disciplina e
+# ricostruito automaticamente quando la tabella descrittori cambia
+text_analyzer = TextAnalyzer(
+    stemming=TEXT_STEMMING,
+    rimuovi_accenti=TEXT_REMOVE_ACCENTS,
+    char_ngrams=TEXT_CHAR_NGRAMS
+)
+# Gli indici controllano la versione dei descrittori con una connessione breve,
+# restituita al pool subito dopo: non resta occupata per tutta la richiesta
+# (es. durante la chiamata al modello in /get_suggestions)
+descriptor_index = DescriptorIndex(
+    lambda: db_manager.connessione(DB_PATH, legata_richiesta=False),
+    analyzer=text_analyzer,
+    check_interval=DESCRIPTOR_INDEX_CHECK_INTERVAL
+)
+
+# Indice di embedding dei descrittori, salvato accanto a riza.db
+embedding_index = EmbeddingIndex(
+    lambda: db_manager.connessione(DB_PATH, legata_richiesta=False),
+    os.path.join(os.path.dirname(DB_PATH), 'riza_descrittori.emb'),
+    HashedEmbedder(
+        TextAnalyzer(stemming=TEXT_STEMMING, rimuovi_accenti=TEXT_REMOVE_ACCENTS),
+        dim=EMBEDDING_DIM
+    ),
+    check_interval=DESCRIPTOR_INDEX_CHECK_INTERVAL
+)
+
+# Motore usato da get_suggestions e get_suggestions_batch
+matcher = embedding_index if MATCHING_ENGINE == 'embedding' else descriptor_index
+
+# Cache dei suggerimenti: la chiave contiene la versione dei descrittori, e quando
+# la tabella cambia le voci in memoria ormai inutili vengono scartate subito
+suggestions_cache = ResponseCache(
+    max_entries=SUGGESTIONS_CACHE_SIZE,
+    ttl=SUGGESTIONS_CACHE_TTL,
+    persist_path=SUGGESTIONS_CACHE_PATH or None,
+    nome='suggestions'
+)
+matcher.al_cambio(suggestions_cache.clear)
+
+analytics_cache = ResponseCache(max_entries=ANALYTICS_CACHE_SIZE, ttl=ANALYTICS_CACHE_TTL, nome='analytics')
+
+# Contatori già mantenuti dai singoli componenti, letti a ogni esportazione di /metrics
+def raccogli_metriche():
+    llm = llm_backend.statistiche()
+    metriche = [
+        ('llm_calls_total', 'counter', 'Chiamate al modello per esito',
+         [({'result': k}, llm[k]) for k in ('calls', 'successes', 'failures', 'retries', 'timeouts', 'short_circuited')]),
+        ('llm_circuit_open', 'gauge', 'Circuit breaker del modello aperto o semiaperto (1) o chiuso (0)',
+         [({}, 0 if llm['circuit_state'] == CircuitBreaker.CHIUSO else 1)]),
+    ]
+
+    cache = []
+    for nome, c in (('chatbot', chatbot_cache), ('suggestions', suggestions_cache), ('analytics', analytics_cache)):
+        statistiche = c.statistiche()
+        cache.extend(({'cache': nome, 'evento': k}, statistiche[k]) for k in ('hits', 'misses', 'evictions'))
+    metriche.append(('cache_events_total', 'counter', 'Eventi delle cache di risposte e suggerimenti', cache))
+
+    limiti = [limite_chatbot, limite_suggerimenti]
+    metriche.append(('concurrency_active', 'gauge', 'Richieste al modello in corso',
+                     [({'limite': l.nome}, l.statistiche()['attive']) for l in limiti]))
+    metriche.append(('concurrency_rejected_total', 'counter', 'Richieste rifiutate per limite di concorrenza',
+                     [({'limite': l.nome}, l.statistiche()['rifiutate']) for l in limiti]))
+
+    statistiche = scrittore_osservazioni.statistiche()
+    metriche.append(('observation_group_commit_total', 'counter', 'Salvataggi di osservazioni con group commit',
+                     [({'evento': k}, statistiche[k]) for k in ('scritture', 'transazioni', 'errori')]))
+
+    if ACTIVITY_LOG_ASYNC:
+        statistiche = activity_logger.statistiche()
+        metriche.append(('activity_log_queue', 'gauge', 'Attività in coda di scrittura', [({}, statistiche['in_coda'])]))
+        metriche.append(('activity_log_events_total', 'counter', 'Attività scritte, scartate o in errore',
+                         [({'esito': k}, statistiche[k]) for k in ('scritti', 'scartati', 'errori')]))
+    return metriche
+
+metrics.registro.aggiungi_collettore(raccogli_metriche)
+
+# Chiamata dal master di gunicorn con preload_app prima di creare i worker:
+# l'indice dei descrittori (e scikit-learn/NumPy) viene costruito una volta sola
+# e i worker lo ereditano già pronto, in memoria condivisa copy-on-write
+def prepara_fork():
+    import gc
+
+    inizio = time.perf_counter()
+    discipline = matcher.riscalda()
+
+    # Le connessioni SQLite non possono passare da un processo all'altro:
+    # ogni worker riapre le proprie al primo utilizzo
+    db_manager.chiudi_tutte()
+    chatbot_cache.chiudi_connessioni()
+    suggestions_cache.chiudi_connessioni()
+
+    # Gli oggetti creati finora non vengono più visitati dal garbage collector,
+    # che altrimenti toccandoli copierebbe le pagine condivise in ogni worker
+    gc.collect()
+    gc.freeze()
+    print(f"Indice dei descrittori pronto per {discipline} discipline in {time.perf_counter() - inizio:.2f}s")
+
 # Middleware per verificare l'autenticazione
 @app.before_request
 def check_auth():
     # Escludi le pagine che non richiedono autenticazione
-    excluded_routes = ['login', 'static']
+    excluded_routes = ['login', 'static', 'metrics_endpoint']
     if request.endpoint in excluded_routes:
         return
     
@@ -123,7 +524,7 @@ def chatbot():
     if 'user_id' in session:
         log_activity(session['user_id'], session.get('user_name', 'Unknown'), 'page_view', {'page': 'chatbot'})
     
-    return render_template('chatbot.html')
+    return render_template('chatbot.html', streaming=CHATBOT_STREAMING)
 
 @app.route('/valutazione')
 def valutazione():
@@ -136,50 +537,39 @@ def valutazione():
     
     return render_template('index.html', discipline=discipline)
 
+# Filtri di ricerca delle osservazioni dalla query string
+def filtri_osservazioni():
+    return {
+        'allievo': request.args.get('allievo', ''),
+        'classe': request.args.get('classe', ''),
+        'disciplina': request.args.get('disciplina', ''),
+        'dimensione': request.args.get('dimensione', ''),
+        'q': request.args.get('q', '')
+    }
+
 @app.route('/view_observations')
 def view_observations():
     conn = get_db_connection()
     
     # Parametri di ricerca
-    allievo = request.args.get('allievo', '')
-    classe = request.args.get('classe', '')
-    disciplina = request.args.get('disciplina', '')
-    dimensione = request.args.get('dimensione', '')
-    
-    # Costruisci la query in base ai parametri
-    query = """
-        SELECT o.id, o.allievo, o.classe, o.disciplina, o.situazione, o.osservazione, 
-               o.dimensione, o.processo, o.livello, o.data_creazione, o.id_descrittore
-        FROM osservazioni o
-        WHERE 1=1
-    """
-    params = []
-    
-    if allievo:
-        query += " AND o.allievo LIKE ?"
-        params.append(f"%{allievo}%")
-    
-    if classe:
-        query += " AND o.classe LIKE ?"
-        params.append(f"%{classe}%")
-    
-    if disciplina:
-        query += " AND o.disciplina = ?"
-        params.append(disciplina)
-    
-    if dimensione:
-        query += " AND o.dimensione = ?"
-        params.append(dimensione)
-    
-    query += " ORDER BY o.data_creazione DESC"
-    
-    # Esegui la query
-    observations = conn.execute(query, params).fetchall()
+    filtri = filtri_osservazioni()
+    elenco_completo = request.args.get('all') == '1'
     
     # Ottieni elenchi per i filtri
     discipline = [row['disciplina'] for row in conn.execute("SELECT DISTINCT disciplina FROM aree_disciplinari").fetchall()]
     dimensioni = [row['dimensione_riza'] for row in conn.execute("SELECT DISTINCT dimensione_riza FROM descrittori").fetchall()]
     
+    if elenco_completo:
+        # Elenco completo: righe lette a blocchi e HTML inviato man mano (streaming)
+        observations = tutte_le_osservazioni(get_stream_db_connection, filtri)
+        next_cursor = None
+    else:
+        # Prima pagina: le successive vengono caricate da /api/observations durante lo scroll
+        with span('db'):
+            observations, prossimo = pagina_osservazioni(conn, filtri, None, OBSERVATIONS_PAGE_SIZE)
+
+        next_cursor = codifica_cursore(prossimo) if prossimo else None
+    
     conn.close()
     
     if 'user_id' in session:
@@ -187,22 +577,55 @@ def view_observations():
             session['user_id'], 
             session.get('user_name', 'Unknown'), 
             'search_observations', 
-            {
-                'allievo': allievo,
-                'classe': classe,
-                'disciplina': disciplina,
-                'dimensione': dimensione,
-                'results_count': len(observations)
-            }
+            dict(filtri, results_count=None if elenco_completo else len(observations), all=elenco_completo)
         )
     
-    return render_template(
+    if elenco_completo:
+        db_manager.rilascia_richiesta()
+    render = stream_template if elenco_completo else render_template
+    return render(
         'view_observations.html', 
         observations=observations, 
         discipline=discipline, 
-        dimensioni=dimensioni
+        dimensioni=dimensioni,
+        streaming=elenco_completo,
+        next_cursor=next_cursor
     )
 
+# API JSON per il caricamento progressivo (paginazione keyset su data_creazione, id)
+@app.route('/api/observations')
+def api_observations():
+    # Parametri non validi: 400 con un messaggio, senza passare dal gestore generico
+    try:
+        cursore = decodifica_cursore(request.args.get('cursor'))
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    # Un limit non numerico vale la pagina predefinita
+    limite = request.args.get('limit', OBSERVATIONS_PAGE_SIZE, type=int)
+    if limite < 1:
+        return jsonify({'success': False, 'error': 'Il parametro limit deve essere almeno 1'}), 400
+    limite = min(limite, OBSERVATIONS_MAX_PAGE_SIZE)
+    
+    try:
+        conn = get_db_connection()
+        with span('db'):
+            observations, prossimo = pagina_osservazioni(conn, filtri_osservazioni(), cursore, limite)
+
+        conn.close()
+        
+        for obs in observations:
+            obs['snippet'] = str(obs['snippet'])
+        
+        return jsonify({
+            'success': True,
+            'observations': observations,
+            'next_cursor': codifica_cursore(prossimo) if prossimo else None
+        })
+    
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
 @app.route('/get_observation_details/<int:observation_id>')
 def get_observation_details(observation_id):
     try:
@@ -241,6 +664,7 @@ def get_observation_details(observation_id):
         return jsonify({'success': False, 'error': str(e)})
 
 @app.route('/chatbot_query', methods=['POST'])
+@limite_chatbot.limita
 def chatbot_query():
     data = request.json
     query = data.get('query', '')
@@ -249,43 +673,68 @@ def chatbot_query():
         return jsonify({'response': 'Nessuna domanda ricevuta. Come posso aiutarti?'})
     
     try:
-        if ENABLE_AI and openai.api_key:
-            # Usa OpenAI per generare la risposta
-            response = openai.ChatCompletion.create(
-                model=AI_MODEL,
-                messages=[
-                    {"role": "system", "content": "Sei un assistente esperto in ambito educativo e didattico, specializzato nel supporto ai docenti. Fornisci risposte dettagliate, pratiche e basate su evidenze scientifiche. Quando possibile, offri esempi concreti e suggerimenti applicabili in classe."},
-                    {"role": "user", "content": query}
-                ],
-                max_tokens=MAX_TOKENS,
-                temperature=TEMPERATURE
+        if llm_disponibile():
+            # Domande identiche (a parità di modello, parametri, prompt e modalità) riusano la risposta in cache
+            cache_key = chiave_cache(
+                normalizza_testo(query), AI_MODEL, TEMPERATURE, MAX_TOKENS, CHATBOT_MODE,
+                CHATBOT_SYSTEM_PROMPT, CHATBOT_SUGGESTIONS_PROMPT, CHATBOT_MERGED_PROMPT
             )
+            cached = chatbot_cache.get(cache_key) if CHATBOT_CACHE_ENABLED else None
             
-            ai_response = response.choices[0].message.content
-            
-            # Genera suggerimenti correlati
-            suggestions_response = openai.ChatCompletion.create(
-                model=AI_MODEL,
-                messages=[
-                    {"role": "system", "content": "Genera 5 domande correlate che un docente potrebbe voler fare dopo aver ricevuto una risposta alla sua domanda iniziale. Fornisci solo le domande, una per riga, senza numerazione o punti elenco."},
-                    {"role": "user", "content": f"Domanda iniziale: {query}\nRisposta ricevuta: {ai_response}"}
-                ],
-                max_tokens=200,
-                temperature=0.7
-            )
+            if cached is not None:
+                if 'user_id' in session:
+                    log_activity(
+                        session['user_id'], 
+                        session.get('user_name', 'Unknown'), 
+                        'chatbot_query', 
+                        {'query': query, 'response_length': len(cached['response']), 'cached': True}
+                    )
+                
+                return jsonify({'response': cached['response'], 'suggestions': cached['suggestions'], 'cached': True})
+            
+            result = {}
             
-            suggestions_text = suggestions_response.choices[0].message.content
-            suggestions = [s.strip() for s in suggestions_text.split('\n') if s.strip()]
+            if CHATBOT_MODE == MODE_MERGED:
+                # Una sola chiamata: risposta e domande correlate come JSON
+                with span('llm'):
+                    ai_response, suggestions = genera_risposta_e_suggerimenti(
+                        llm_backend, query, AI_MODEL, MAX_TOKENS, TEMPERATURE, CHATBOT_LLM_DEADLINE
+                    )
+            else:
+                # Usa il modello per generare la risposta
+                with span('llm'):
+                    ai_response = genera_risposta(llm_backend, query, AI_MODEL, MAX_TOKENS, TEMPERATURE, CHATBOT_LLM_DEADLINE)
+                
+                if CHATBOT_MODE == MODE_ASYNC:
+                    # Le domande correlate arrivano dopo tramite /chatbot_suggestions/<token>
+                    suggestions = []
+                    
+                    def salva_in_cache(suggerimenti):
+                        if CHATBOT_CACHE_ENABLED:
+                            chatbot_cache.set(cache_key, {'response': ai_response, 'suggestions': suggerimenti})
+                    
+                    result['suggestions_token'] = suggerimenti_asincroni.avvia(
+                        genera_suggerimenti, llm_backend, query, ai_response, AI_MODEL, CHATBOT_LLM_DEADLINE,
+                        al_termine=salva_in_cache
+                    )
+                else:
+                    # Genera suggerimenti correlati
+                    with span('llm'):
+                        suggestions = genera_suggerimenti(llm_backend, query, ai_response, AI_MODEL, CHATBOT_LLM_DEADLINE)
+            
+            if CHATBOT_CACHE_ENABLED and CHATBOT_MODE != MODE_ASYNC:
+                chatbot_cache.set(cache_key, {'response': ai_response, 'suggestions': suggestions})
             
             if 'user_id' in session:
                 log_activity(
                     session['user_id'], 
                     session.get('user_name', 'Unknown'), 
                     'chatbot_query', 
-                    {'query': query, 'response_length': len(ai_response)}
+                    {'query': query, 'response_length': len(ai_response), 'mode': CHATBOT_MODE}
                 )
             
-            return jsonify({'response': ai_response, 'suggestions': suggestions})
+            result.update({'response': ai_response, 'suggestions': suggestions})
+            return jsonify(result)
         
         else:
             # Risposta predefinita se OpenAI non è configurato
@@ -309,7 +758,98 @@ def chatbot_query():
             ]
         })
 
+# Variante in streaming di /chatbot_query: eventi SSE "token" con i frammenti della
+# risposta man mano che il modello li genera, poi "suggestions" e infine "done".
+# In modalità merged le domande correlate vengono generate dopo la risposta
+@app.route('/chatbot_query_stream', methods=['POST'])
+@limite_chatbot.limita
+def chatbot_query_stream():
+    data = request.json or {}
+    query = data.get('query', '')
+    
+    if not query or not llm_disponibile():
+        # Nessuno streaming possibile: stessa risposta JSON dell'endpoint classico
+        return chatbot_query.__wrapped__()
+    
+    cache_key = chiave_cache(
+        normalizza_testo(query), AI_MODEL, TEMPERATURE, MAX_TOKENS, CHATBOT_MODE,
+        CHATBOT_SYSTEM_PROMPT, CHATBOT_SUGGESTIONS_PROMPT, CHATBOT_MERGED_PROMPT
+    )
+    
+    def genera_eventi():
+        cached = chatbot_cache.get(cache_key) if CHATBOT_CACHE_ENABLED else None
+        
+        if cached is not None:
+            ai_response = cached['response']
+            yield evento_sse('token', {'text': ai_response})
+            yield evento_sse('suggestions', {'suggestions': cached['suggestions']})
+            dettagli = {'query': query, 'response_length': len(ai_response), 'cached': True}
+        else:
+            frammenti = []
+            try:
+                for frammento in genera_risposta_stream(
+                    llm_backend, query, AI_MODEL, MAX_TOKENS, TEMPERATURE, CHATBOT_LLM_DEADLINE
+                ):
+                    frammenti.append(frammento)
+                    yield evento_sse('token', {'text': frammento})
+            except Exception as e:
+                print(f"Errore nello streaming della risposta chatbot: {e}")
+                yield evento_sse('error', {'error': str(e)})
+                return
+            
+            ai_response = ''.join(frammenti)
+            
+            if CHATBOT_MODE == MODE_ASYNC:
+                def salva_in_cache(suggerimenti):
+                    if CHATBOT_CACHE_ENABLED:
+                        chatbot_cache.set(cache_key, {'response': ai_response, 'suggestions': suggerimenti})
+                
+                token = suggerimenti_asincroni.avvia(
+                    genera_suggerimenti, llm_backend, query, ai_response, AI_MODEL, CHATBOT_LLM_DEADLINE,
+                    al_termine=salva_in_cache
+                )
+                yield evento_sse('suggestions', {'suggestions': [], 'suggestions_token': token})
+            else:
+                try:
+                    suggestions = genera_suggerimenti(llm_backend, query, ai_response, AI_MODEL, CHATBOT_LLM_DEADLINE)
+                except Exception as e:
+                    print(f"Errore nella generazione delle domande correlate: {e}")
+                    suggestions = []
+                
+                if CHATBOT_CACHE_ENABLED:
+                    chatbot_cache.set(cache_key, {'response': ai_response, 'suggestions': suggestions})
+                yield evento_sse('suggestions', {'suggestions': suggestions})
+            
+            dettagli = {'query': query, 'response_length': len(ai_response), 'mode': CHATBOT_MODE, 'streaming': True}
+        
+        # Attività registrata solo a stream completato
+        if 'user_id' in session:
+            log_activity(session['user_id'], session.get('user_name', 'Unknown'), 'chatbot_query', dettagli)
+        
+        yield evento_sse('done', {})
+    
+    return Response(
+        stream_with_context(genera_eventi()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+# Domande correlate generate in background (CHATBOT_MODE=async); ?wait=secondi
+# attende al massimo quel tempo che siano pronte prima di rispondere
+@app.route('/chatbot_suggestions/<token>')
+def chatbot_suggestions(token):
+    # Valore non numerico = nessuna attesa; al più 10 secondi
+    attesa = max(0.0, min(request.args.get('wait', 0, type=float), 10.0))
+    risultato = suggerimenti_asincroni.risultato(token, attesa)
+    
+    if risultato is None:
+        return jsonify({'ready': True, 'suggestions': [], 'error': 'Suggerimenti non disponibili'})
+    
+    pronto, suggestions = risultato
+    return jsonify({'ready': pronto, 'suggestions': suggestions})
+
 @app.route('/get_suggestions', methods=['POST'])
+@limite_suggerimenti.limita
 def get_suggestions():
     data = request.json
     osservazione = data.get('osservazione', '')
@@ -319,136 +859,83 @@ def get_suggestions():
         return jsonify({'suggestions': []})
     
     try:
-        conn = get_db_connection()
+        usa_ai = llm_disponibile()
+        cache_key = chiave_cache(
+            normalizza_testo(osservazione), disciplina, matcher.versione(), MATCHING_ENGINE, usa_ai,
+            AI_MODEL if usa_ai else None, RANKER_MIN_CANDIDATES, RANKER_MAX_CANDIDATES, RANKER_TOKEN_BUDGET
+        )
+        cached = suggestions_cache.get(cache_key) if SUGGESTIONS_CACHE_ENABLED else None
         
-        # Ottieni i descrittori per la disciplina selezionata
-        descrittori = conn.execute(
-            """
-            SELECT d.*, a.disciplina
-            FROM descrittori d
-            JOIN aree_disciplinari a ON d.area_disciplinare_id = a.id
-            WHERE a.disciplina = ?
-            """,
-            (disciplina,)
-        ).fetchall()
+        if cached is not None:
+            if 'user_id' in session:
+                log_activity(
+                    session['user_id'], 
+                    session.get('user_name', 'Unknown'), 
+                    'get_suggestions', 
+                    {'osservazione': osservazione, 'disciplina': disciplina, 'method': cached['method'], 'count': len(cached['suggestions']), 'cached': True}
+                )
+            
+            return jsonify({'suggestions': cached['suggestions'], 'cached': True})
         
-        conn.close()
+        # Prima fase: tutti i descrittori della disciplina ordinati dal motore locale
+        with span('matcher'):
+            candidati = matcher.cerca(disciplina, osservazione, top_k=max(RANKER_MAX_CANDIDATES, 5))
         
-        if ENABLE_AI and openai.api_key:
-            # Usa OpenAI per analizzare l'osservazione e trovare corrispondenze
+        if usa_ai:
+            # Seconda fase: il modello riordina solo i candidati più pertinenti
             try:
-                prompt = f"""
-                Analizza la seguente osservazione di un allievo e identifica quali descrittori RIZA sono più pertinenti.
-                
-                Osservazione: "{osservazione}"
-                
-                Disciplina: {disciplina}
-                
-                Descrittori disponibili:
-                """
-                
-                for d in descrittori[:15]:  # Limitiamo a 15 descrittori per non superare i limiti di token
-                    prompt += f"\nID: {d['id']} - Dimensione: {d['dimensione_riza']} - Processo: {d['processo_specifico_verbo']} - Livello: {d['livello']} - Descrittore: {d['testo_descrittore']}"
-                
-                prompt += """
-                
-                Restituisci i 3 descrittori più pertinenti all'osservazione in formato JSON con la seguente struttura:
-                [
-                  {
-                    "id": "ID del descrittore",
-                    "similarita": "valore da 0 a 1 che indica quanto è pertinente",
-                    "spiegazione": "breve spiegazione del perché questo descrittore è pertinente all'osservazione"
-                  },
-                  ...
-                ]
-                
-                Includi solo il JSON nella tua risposta, senza testo aggiuntivo.
-                """
-                
-                response = openai.ChatCompletion.create(
-                    model=AI_MODEL,
-                    messages=[
-                        {"role": "system", "content": "Sei un assistente specializzato in valutazione formativa e nel modello RIZA (Risorse, Interpretazione, Azione, Autoregolazione). Il tuo compito è analizzare osservazioni di allievi e collegarle ai descrittori RIZA più pertinenti."},
-                        {"role": "user", "content": prompt}
-                    ],
-                    max_tokens=MAX_TOKENS,
-                    temperature=0.2
+                candidati_llm = descriptor_ranker.completa_candidati(
+                    candidati, matcher.descrittori(disciplina), RANKER_MIN_CANDIDATES
                 )
+                # Nessuna connessione del pool resta occupata durante la chiamata al modello
+                db_manager.rilascia_richiesta()
+                with span('llm'):
+                    suggestions, inviati = descriptor_ranker.classifica(
+                        llm_backend, osservazione, disciplina, candidati_llm, AI_MODEL, MAX_TOKENS,
+                        budget_token=RANKER_TOKEN_BUDGET,
+                        k_min=RANKER_MIN_CANDIDATES,
+                        k_max=RANKER_MAX_CANDIDATES,
+                        timeout=SUGGESTIONS_LLM_DEADLINE,
+                        descrittori_per_id=matcher.per_id(disciplina),
+                        json_mode=RANKER_JSON_MODE
+                    )
                 
-                ai_response = response.choices[0].message.content
-                
-                # Estrai il JSON dalla risposta
-                import re
-                json_match = re.search(r'\[.*\]', ai_response, re.DOTALL)
-                if json_match:
-                    ai_suggestions = json.loads(json_match.group(0))
-                else:
-                    # Tentativo alternativo se il primo metodo fallisce
-                    try:
-                        ai_suggestions = json.loads(ai_response)
-                    except:
-                        # Fallback al metodo TF-IDF se non riusciamo a estrarre JSON
-                        ai_suggestions = []
-                
-                # Se abbiamo ottenuto suggerimenti da AI, arricchiscili con i dati completi
-                if ai_suggestions:
-                    suggestions = []
-                    for sugg in ai_suggestions:
-                        desc_id = sugg.get('id')
-                        for d in descrittori:
-                            if str(d['id']) == str(desc_id):
-                                suggestion = dict(d)
-                                suggestion['similarita'] = float(sugg.get('similarita', 0.5))
-                                suggestion['spiegazione'] = sugg.get('spiegazione', '')
-                                suggestions.append(suggestion)
-                                break
-                    
-                    # Ordina per similarità decrescente
-                    suggestions.sort(key=lambda x: x['similarita'], reverse=True)
+                if suggestions:
+                    if SUGGESTIONS_CACHE_ENABLED:
+                        suggestions_cache.set(cache_key, {'suggestions': suggestions, 'method': 'ai'})
                     
                     if 'user_id' in session:
                         log_activity(
                             session['user_id'], 
                             session.get('user_name', 'Unknown'), 
                             'get_suggestions', 
-                            {'osservazione': osservazione, 'disciplina': disciplina, 'method': 'ai', 'count': len(suggestions)}
+                            {'osservazione': osservazione, 'disciplina': disciplina, 'method': 'ai', 'candidates': inviati, 'count': len(suggestions)}
                         )
                     
-                    return jsonify({'suggestions': [dict(s) for s in suggestions]})
+                    return jsonify({'suggestions': suggestions})
             
             except Exception as e:
                 print(f"Errore nell'elaborazione AI: {e}")
-                # In caso di errore, fallback al metodo TF-IDF
+                # In caso di errore, fallback al motore locale
                 pass
         
-        # Metodo TF-IDF (fallback o se AI non è abilitata)
-        # Prepara i testi per l'analisi
-        testi_descrittori = [d['testo_descrittore'] for d in descrittori]
-        
-        # Crea il vettorizzatore TF-IDF
-        vectorizer = TfidfVectorizer(stop_words='english')
-        tfidf_matrix = vectorizer.fit_transform(testi_descrittori + [osservazione])
-        
-        # Calcola la similarità del coseno
-        cosine_similarities = cosine_similarity(tfidf_matrix[-1:], tfidf_matrix[:-1]).flatten()
-        
-        # Ottieni gli indici dei descrittori più simili
-        top_indices = cosine_similarities.argsort()[-5:][::-1]
-        
-        # Prepara i suggerimenti
+        # Motore locale, TF-IDF o embedding (fallback o se AI non è abilitata)
         suggestions = []
-        for idx in top_indices:
-            if cosine_similarities[idx] > 0:  # Solo se c'è una similarità positiva
-                suggestion = dict(descrittori[idx])
-                suggestion['similarita'] = float(cosine_similarities[idx])
-                suggestions.append(suggestion)
+        for descrittore, similarita in candidati[:5]:
+            suggestion = dict(descrittore)
+            suggestion['similarita'] = similarita
+            suggestions.append(suggestion)
+        
+        # Il risultato del fallback dopo un errore AI non va in cache: al prossimo tentativo si riprova il modello
+        if SUGGESTIONS_CACHE_ENABLED and not usa_ai:
+            suggestions_cache.set(cache_key, {'suggestions': suggestions, 'method': MATCHING_ENGINE})
         
         if 'user_id' in session:
             log_activity(
                 session['user_id'], 
                 session.get('user_name', 'Unknown'), 
                 'get_suggestions', 
-                {'osservazione': osservazione, 'disciplina': disciplina, 'method': 'tfidf', 'count': len(suggestions)}
+                {'osservazione': osservazione, 'disciplina': disciplina, 'method': MATCHING_ENGINE, 'count': len(suggestions)}
             )
         
         return jsonify({'suggestions': [dict(s) for s in suggestions]})
@@ -457,38 +944,106 @@ def get_suggestions():
         print(f"Errore nell'elaborazione dei suggerimenti: {e}")
         return jsonify({'error': str(e), 'suggestions': []})
 
+@app.route('/get_suggestions_batch', methods=['POST'])
+@limite_suggerimenti.limita
+def get_suggestions_batch():
+    data = request.json or {}
+    osservazioni = data.get('osservazioni', [])
+    disciplina_predefinita = data.get('disciplina', '')
+    
+    try:
+        top_k = max(1, min(int(data.get('top_k', 5)), BATCH_MAX_TOP_K))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Il campo top_k deve essere un numero intero', 'results': []})
+    
+    if not isinstance(osservazioni, list):
+        return jsonify({'error': 'Il campo osservazioni deve essere una lista', 'results': []})
+    
+    if len(osservazioni) > BATCH_MAX_OBSERVATIONS:
+        return jsonify({'error': f'Massimo {BATCH_MAX_OBSERVATIONS} osservazioni per richiesta', 'results': []})
+    
+    try:
+        # Raggruppa le osservazioni per disciplina mantenendo la posizione originale
+        gruppi = {}
+        for posizione, item in enumerate(osservazioni):
+            if isinstance(item, dict):
+                testo = item.get('osservazione', '')
+                disciplina = item.get('disciplina') or disciplina_predefinita
+            else:
+                testo, disciplina = str(item), disciplina_predefinita
+            
+            if testo and disciplina:
+                gruppi.setdefault(disciplina, []).append((posizione, testo))
+        
+        results = [{'suggestions': []} for _ in osservazioni]
+        
+        # Una sola moltiplicazione di matrici per disciplina per tutte le osservazioni del gruppo
+        for disciplina, elementi in gruppi.items():
+            testi = [testo for _, testo in elementi]
+            with span('matcher'):
+                risultati_disciplina = matcher.cerca_batch(disciplina, testi, top_k)
+            for (posizione, _), trovati in zip(elementi, risultati_disciplina):
+                suggestions = []
+                for descrittore, similarita in trovati:
+                    suggestion = dict(descrittore)
+                    suggestion['similarita'] = similarita
+                    suggestions.append(suggestion)
+                results[posizione] = {'suggestions': suggestions}
+        
+        if 'user_id' in session:
+            log_activity(
+                session['user_id'], 
+                session.get('user_name', 'Unknown'), 
+                'get_suggestions', 
+                {'method': f'{MATCHING_ENGINE}_batch', 'discipline': list(gruppi.keys()), 'count': len(osservazioni)}
+            )
+        
+        return jsonify({'results': results})
+    
+    except Exception as e:
+        print(f"Errore nell'elaborazione dei suggerimenti batch: {e}")
+        return jsonify({'error': str(e), 'results': []})
+
+INSERT_OSSERVAZIONE = """
+    INSERT INTO osservazioni (
+        allievo, classe, disciplina, situazione, osservazione,
+        dimensione, processo, livello, id_descrittore, data_creazione,
+        dimensione_id, processo_id, livello_id
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, datetime('now'), ?, ?, ?)
+"""
+
 @app.route('/save_observation', methods=['POST'])
 def save_observation():
     data = request.json
     
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Inserisci l'osservazione nel database
-        cursor.execute(
-            """
-            INSERT INTO osservazioni (
-                allievo, classe, disciplina, situazione, osservazione,
-                dimensione, processo, livello, id_descrittore, data_creazione
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, datetime('now'))
-            """,
-            (
-                data.get('allievo'),
-                data.get('classe'),
-                data.get('disciplina'),
-                data.get('situazione'),
-                data.get('osservazione'),
-                data.get('dimensione'),
-                data.get('processo'),
-                data.get('livello'),
-                data.get('id_descrittore')
-            )
+        valori = (
+            data.get('allievo'),
+            data.get('classe'),
+            data.get('disciplina'),
+            data.get('situazione'),
+            data.get('osservazione'),
+            data.get('dimensione'),
+            data.get('processo'),
+            data.get('livello'),
+            data.get('id_descrittore')
         )
         
-        conn.commit()
-        observation_id = cursor.lastrowid
-        conn.close()
+        # Inserisci l'osservazione nel database, con i codici numerici di
+        # dimensione, processo e livello (dalla cache del normalizzatore)
+        with span('db'):
+            valori += normalizzatore_osservazioni.codici(
+                data.get('dimensione'), data.get('processo'), data.get('livello')
+            )
+            if OBSERVATION_GROUP_COMMIT:
+                observation_id = scrittore_osservazioni.esegui(INSERT_OSSERVAZIONE, valori)
+            else:
+                conn = get_db_connection()
+                cursor = conn.cursor()
+                cursor.execute(INSERT_OSSERVAZIONE, valori)
+                conn.commit()
+                observation_id = cursor.lastrowid
+                conn.close()
         
         if 'user_id' in session:
             log_activity(
@@ -508,6 +1063,141 @@ def save_observation():
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
+# Importazione in blocco: file caricato (campo "file") o corpo della richiesta,
+# letto come flusso e inserito a blocchi. Parametri: format (csv, jsonl),
+# assign=1 per assegnare i descrittori, dry_run=1 per la sola validazione
+@app.route('/api/observations/import', methods=['POST'])
+def import_observations():
+    try:
+        caricato = request.files.get('file')
+        formato = observation_io.riconosci_formato(
+            request.args.get('format'), caricato.filename if caricato else None
+        )
+        flusso = io.TextIOWrapper(caricato.stream if caricato else request.stream, encoding='utf-8-sig', newline='')
+        
+        conn = get_db_connection()
+        with span('db'):
+            esito = observation_io.importa(
+                conn, observation_io.leggi(flusso, formato),
+                blocco=IMPORT_BATCH_SIZE,
+                matcher=matcher if request.args.get('assign') == '1' else None,
+                soglia=float(request.args.get('min_similarity', 0)),
+                simula=request.args.get('dry_run') == '1',
+                normalizzatore=normalizzatore_osservazioni
+            )
+        conn.close()
+        
+        if 'user_id' in session:
+            log_activity(
+                session['user_id'], 
+                session.get('user_name', 'Unknown'), 
+                'import_observations', 
+                {k: esito[k] for k in ('lette', 'importate', 'scartate', 'descrittori_assegnati')}
+            )
+        
+        return jsonify(dict(esito, success=True))
+    
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+# Esportazione in streaming (CSV o JSONL) delle osservazioni filtrate come in /view_observations
+@app.route('/api/observations/export')
+def export_observations():
+    try:
+        formato = observation_io.riconosci_formato(request.args.get('format', 'csv'))
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)})
+    
+    filtri = filtri_osservazioni()
+    if 'user_id' in session:
+        log_activity(
+            session['user_id'], 
+            session.get('user_name', 'Unknown'), 
+            'export_observations', 
+            dict(filtri, format=formato)
+        )
+    
+    # Il download può durare a lungo: nessuna connessione resta occupata tra un blocco e l'altro
+    db_manager.rilascia_richiesta()
+    osservazioni = tutte_le_osservazioni(get_stream_db_connection, filtri, EXPORT_BATCH_SIZE)
+    nome_file = f"osservazioni-{datetime.date.today().isoformat()}.{formato}"
+    return Response(
+        stream_with_context(observation_io.esporta(osservazioni, formato, EXPORT_BATCH_SIZE)),
+        mimetype='text/csv' if formato == 'csv' else 'application/x-ndjson',
+        headers={'Content-Disposition': f'attachment; filename="{nome_file}"'}
+    )
+
+# Filtri comuni delle analisi: disciplina, classe, allievo e intervallo di date (AAAA-MM-GG)
+def filtri_analisi():
+    return {chiave: request.args.get(chiave, '') for chiave in ('disciplina', 'classe', 'allievo', 'dal', 'al')}
+
+# Esegue un'analisi sul cubo delle osservazioni filtrate, riusando il risultato
+# finché non arrivano nuove osservazioni (firma = id massimo e versione)
+def analisi_in_cache(nome, calcola, filtri, **opzioni):
+    conn = get_db_connection()
+    with span('db'):
+        firma = analytics.firma_osservazioni(conn)
+    
+    chiave = chiave_cache(nome, filtri, opzioni, firma)
+    if ANALYTICS_CACHE_ENABLED:
+        risultato = analytics_cache.get(chiave)
+        if risultato is not None:
+            return risultato, True
+    
+    with span('db'):
+        cubo = analytics.carica(conn, **filtri)
+    with span('analytics'):
+        risultato = dict(calcola(cubo, **opzioni), osservazioni=cubo.totale, dimensioni=cubo.dimensioni)
+    conn.close()
+    
+    if ANALYTICS_CACHE_ENABLED:
+        analytics_cache.set(chiave, risultato)
+    return risultato, False
+
+# Pagelle di tutti gli allievi selezionati (es. una classe o l'intera scuola)
+@app.route('/api/analytics/report_cards')
+def analytics_report_cards():
+    try:
+        risultato, cached = analisi_in_cache(
+            'pagelle', lambda cubo: {'allievi': cubo.pagelle()}, filtri_analisi()
+        )
+        return jsonify(dict(risultato, success=True, livelli=analytics.LIVELLI, cached=cached))
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+# Confronto tra classi per dimensione, con lo scarto dalla media complessiva
+@app.route('/api/analytics/classes')
+def analytics_classes():
+    try:
+        risultato, cached = analisi_in_cache('classi', lambda cubo: cubo.confronto_classi(), filtri_analisi())
+        return jsonify(dict(risultato, success=True, livelli=analytics.LIVELLI, cached=cached))
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+# Livello medio mese per mese (per=scuola, classe o allievo)
+@app.route('/api/analytics/trends')
+def analytics_trends():
+    per = request.args.get('per', 'scuola')
+    if per not in analytics.GRUPPI_ANDAMENTO:
+        return jsonify({'success': False, 'error': f"Parametro per non valido: usa {', '.join(analytics.GRUPPI_ANDAMENTO)}"})
+    
+    try:
+        risultato, cached = analisi_in_cache(
+            'andamento', lambda cubo, per: cubo.andamento(per), filtri_analisi(), per=per
+        )
+        return jsonify(dict(risultato, success=True, cached=cached))
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+# Dettagli JSON di un'attività; un valore non JSON resta com'è
+def leggi_dettagli(details):
+    if not details:
+        return None
+    try:
+        return json.loads(details)
+    except (TypeError, ValueError):
+        return details
+
 # Rotte amministrative
 @app.route('/admin/dashboard')
 def admin_dashboard():
@@ -517,32 +1207,11 @@ def admin_dashboard():
     try:
         conn = get_admin_db_connection()
         
-        # Statistiche utenti
-        user_stats = {
-            'total_users': conn.execute("SELECT COUNT(*) as count FROM users").fetchone()['count'],
-            'docenti': conn.execute("SELECT COUNT(*) as count FROM users WHERE role = 'docente'").fetchone()['count'],
-            'coordinatori': conn.execute("SELECT COUNT(*) as count FROM users WHERE role = 'coordinatore'").fetchone()['count'],
-            'admin': conn.execute("SELECT COUNT(*) as count FROM users WHERE role = 'admin'").fetchone()['count']
-        }
-        
-        # Statistiche conversazioni per tool
-        conversation_stats = conn.execute(
-            """
-            SELECT activity_type as tool, COUNT(*) as count
-            FROM activities
-            WHERE activity_type IN ('chatbot_query', 'get_suggestions')
-            GROUP BY activity_type
-            """
-        ).fetchall()
-        
-        # Statistiche attività
-        activity_stats = conn.execute(
-            """
-            SELECT activity_type, COUNT(*) as count
-            FROM activities
-            GROUP BY activity_type
-            """
-        ).fetchall()
+        # Statistiche utenti, conversazioni, attività e attività giornaliere
+        # (lette dalle tabelle di riepilogo aggiornate dai trigger)
+        with span('db'):
+            user_stats, conversation_stats, activity_stats, daily_activities = rollups.statistiche_dashboard(conn)
+
         
         # Attività recenti
         recent_activities = conn.execute(
@@ -553,19 +1222,11 @@ def admin_dashboard():
             """
         ).fetchall()
         
-        # Attività giornaliere
-        daily_activities = conn.execute(
-            """
-            SELECT strftime('%Y-%m-%d', timestamp) as day, COUNT(*) as count
-            FROM activities
-            GROUP BY day
-            ORDER BY day DESC
-            LIMIT 7
-            """
-        ).fetchall()
-        
         conn.close()
         
+        # I dettagli sono salvati come JSON: il template li legge come dizionario
+        recent_activities = [dict(activity, details=leggi_dettagli(activity['details'])) for activity in recent_activities]
+        
         if 'user_id' in session:
             log_activity(session['user_id'], session.get('user_name', 'Unknown'), 'page_view', {'page': 'admin_dashboard'})
         
@@ -763,5 +1424,32 @@ def admin_api_users():
     finally:
         conn.close()
 
+# Metriche del client LLM (tentativi, timeout, stato del circuit breaker) e dei limiti di concorrenza
+@app.route('/admin/api/llm_metrics')
+def admin_api_llm_metrics():
+    if session.get('user_role') != 'admin':
+        return jsonify({'success': False, 'error': 'Accesso non autorizzato'})
+    
+    return jsonify({
+        'success': True,
+        'llm': llm_backend.statistiche(),
+        'concurrency': {
+            limite_chatbot.nome: limite_chatbot.statistiche(),
+            limite_suggerimenti.nome: limite_suggerimenti.statistiche()
+        }
+    })
+
+# Metriche in formato Prometheus: accessibili all'amministratore o con
+# l'header "Authorization: Bearer <METRICS_TOKEN>" (per lo scraper)
+@app.route('/metrics')
+def metrics_endpoint():
+    autorizzato = session.get('user_role') == 'admin'
+    if not autorizzato and METRICS_TOKEN:
+        autorizzato = hmac.compare_digest(request.headers.get('Authorization', ''), f"Bearer {METRICS_TOKEN}")
+    if not autorizzato:
+        return Response('Accesso non autorizzato\n', status=403, mimetype='text/plain')
+    
+    return Response(metrics.registro.esporta_prometheus(), mimetype='text/plain; version=0.0.4')
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', debug=True)
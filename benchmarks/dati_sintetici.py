@@ -0,0 +1,131 @@
+import datetime
+import json
+import random
+import sqlite3
+
+# Generatore deterministico di dati sintetici in italiano per i benchmark:
+# descrittori RIZA, osservazioni e attività in quantità configurabile
+
+DISCIPLINE = ['Matematica', 'Italiano', 'Scienze', 'Storia', 'Geografia', 'Inglese', 'Tecnologia', 'Arte']
+DIMENSIONI = ['Risorse', 'Interpretazione', 'Azione', 'Autoregolazione']
+PROCESSI = [
+    'Riconoscere', 'Interpretare', 'Eseguire e applicare', 'Argomentare', 'Rappresentare',
+    'Esplorare', 'Pianificare', 'Verificare', 'Collaborare', 'Comunicare',
+]
+LIVELLI = ['Iniziale', 'Base', 'Intermedio', 'Avanzato']
+
+SOGGETTI = ["L'allievo", "L'allieva", 'Lo studente', 'La studentessa', 'Il ragazzo', 'La ragazza']
+AZIONI = [
+    'esegue calcoli', 'risolve problemi', 'formula ipotesi', 'argomenta le proprie scelte',
+    'rappresenta i dati', 'collabora con i compagni', 'espone oralmente', 'legge e comprende testi',
+    'pianifica il lavoro', 'verifica i risultati', 'individua strategie', 'riconosce errori',
+    'utilizza il lessico specifico', 'confronta soluzioni diverse', 'organizza le informazioni',
+]
+MODI = [
+    'in modo autonomo', 'con l\'aiuto del docente', 'in contesti noti', 'in situazioni nuove',
+    'con sicurezza', 'talvolta con incertezza', 'in modo approfondito', 'per tentativi ed errori',
+    'con precisione', 'in modo frammentario',
+]
+CONTESTI = [
+    'durante il lavoro di gruppo', 'nella verifica scritta', 'nell\'attività di laboratorio',
+    'nella discussione in classe', 'nel compito di realtà', 'durante l\'esposizione orale',
+    'nell\'esercitazione individuale', 'nella correzione collettiva',
+]
+SITUAZIONI = ['Lavoro di gruppo', 'Verifica scritta', 'Laboratorio', 'Discussione', 'Compito di realtà']
+TIPI_ATTIVITA = ['login', 'page_view', 'get_suggestions', 'save_observation', 'chatbot_query', 'view_observation_details']
+
+
+def osservazione_casuale(rnd):
+    return f"{rnd.choice(SOGGETTI)} {rnd.choice(AZIONI)} {rnd.choice(MODI)} {rnd.choice(CONTESTI)}."
+
+
+def descrittore_casuale(rnd):
+    return f"{rnd.choice(AZIONI).capitalize()} {rnd.choice(MODI)} e {rnd.choice(AZIONI)} {rnd.choice(CONTESTI)}"
+
+
+def _a_blocchi(righe, blocco=10000):
+    corrente = []
+    for riga in righe:
+        corrente.append(riga)
+        if len(corrente) >= blocco:
+            yield corrente
+            corrente = []
+    if corrente:
+        yield corrente
+
+
+# Popola riza.db (schema già creato dalle migrazioni) con n descrittori e osservazioni
+def popola_riza(path, n_descrittori, n_osservazioni, seed=42):
+    rnd = random.Random(seed)
+    conn = sqlite3.connect(path)
+    conn.executemany(
+        "INSERT INTO aree_disciplinari (id, disciplina) VALUES (?, ?)",
+        list(enumerate(DISCIPLINE, start=1))
+    )
+    conn.executemany(
+        """
+        INSERT INTO descrittori (area_disciplinare_id, dimensione_riza, processo_specifico_verbo, livello, testo_descrittore)
+        VALUES (?, ?, ?, ?, ?)
+        """,
+        [
+            (i % len(DISCIPLINE) + 1, rnd.choice(DIMENSIONI), rnd.choice(PROCESSI), rnd.choice(LIVELLI), descrittore_casuale(rnd))
+            for i in range(n_descrittori)
+        ]
+    )
+
+    inizio = datetime.datetime(2024, 9, 1)
+    righe = (
+        (
+            f"Allievo {rnd.randrange(500)}", f"{rnd.randint(1, 5)}{rnd.choice('ABCD')}", rnd.choice(DISCIPLINE),
+            rnd.choice(SITUAZIONI), osservazione_casuale(rnd), rnd.choice(DIMENSIONI), rnd.choice(PROCESSI),
+            rnd.choice(LIVELLI), rnd.randint(1, max(n_descrittori, 1)),
+            (inizio + datetime.timedelta(minutes=rnd.randrange(365 * 24 * 60))).strftime('%Y-%m-%d %H:%M:%S')
+        )
+        for _ in range(n_osservazioni)
+    )
+    for blocco in _a_blocchi(righe):
+        conn.executemany(
+            """
+            INSERT INTO osservazioni (
+                allievo, classe, disciplina, situazione, osservazione,
+                dimensione, processo, livello, id_descrittore, data_creazione
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            blocco
+        )
+        conn.commit()
+    conn.commit()
+    conn.close()
+
+
+# Popola admin.db con un amministratore, alcuni docenti e n attività
+def popola_admin(path, n_attivita, n_utenti=50, seed=42):
+    rnd = random.Random(seed)
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "INSERT INTO users (name, email, password, role) VALUES ('Admin Benchmark', 'admin@benchmark.local', 'benchmark', 'admin')"
+    )
+    conn.executemany(
+        "INSERT INTO users (name, email, password, role) VALUES (?, ?, 'benchmark', ?)",
+        [(f"Docente {i}", f"docente{i}@benchmark.local", 'coordinatore' if i % 10 == 0 else 'docente') for i in range(n_utenti)]
+    )
+
+    inizio = datetime.datetime(2024, 9, 1)
+
+    def righe():
+        for _ in range(n_attivita):
+            istante = inizio + datetime.timedelta(seconds=rnd.randrange(365 * 24 * 3600))
+            utente = rnd.randrange(n_utenti) + 2
+            yield (
+                utente, f"Docente {utente - 2}", rnd.choice(TIPI_ATTIVITA),
+                json.dumps({'benchmark': True}), istante.strftime('%Y-%m-%d %H:%M:%S'), istante.strftime('%Y-%m-%d')
+            )
+
+    for blocco in _a_blocchi(righe()):
+        conn.executemany(
+            "INSERT INTO activities (user_id, user_name, activity_type, details, timestamp, day) VALUES (?, ?, ?, ?, ?, ?)",
+            blocco
+        )
+        conn.commit()
+    conn.commit()
+    conn.close()
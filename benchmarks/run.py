@@ -0,0 +1,314 @@
+"""Benchmark offline dei percorsi critici dell'applicazione.
+
+Genera un database sintetico (descrittori, osservazioni, attività), usa il client
+di test di Flask e un backend LLM locale deterministico al posto di OpenAI, e
+misura throughput, latenze p50/p95/p99 e picco di memoria (RSS) per scenario.
+I risultati sono salvati in JSON per confrontare esecuzioni diverse:
+
+    python benchmarks/run.py --scale small
+    python benchmarks/run.py --scale medium --ai --output prima.json
+    python benchmarks/run.py --scale medium --ai --compare prima.json
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+RADICE = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(RADICE))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import dati_sintetici  # noqa: E402
+
+# (descrittori, osservazioni, attività)
+SCALE = {
+    'small': (1000, 1000, 1000),
+    'medium': (10000, 100000, 100000),
+    'large': (100000, 1000000, 1000000),
+}
+
+SCENARI = ['get_suggestions', 'save_observation', 'view_observations', 'admin_dashboard']
+
+
+def rss_picco_mb():
+    picco = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux riporta kilobyte, macOS byte
+    return round(picco / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def percentile(valori, p):
+    ordinati = sorted(valori)
+    if not ordinati:
+        return 0.0
+    posizione = (len(ordinati) - 1) * p / 100
+    inferiore = int(posizione)
+    superiore = min(inferiore + 1, len(ordinati) - 1)
+    return ordinati[inferiore] + (ordinati[superiore] - ordinati[inferiore]) * (posizione - inferiore)
+
+
+def commit_corrente():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=RADICE, stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# Variabili d'ambiente lette da app.py all'importazione
+def configura_ambiente(args):
+    os.environ.update({
+        'ENABLE_AI': 'True' if args.ai else 'False',
+        'LLM_BACKEND': 'fake',
+        'FAKE_LLM_LATENCY_MS': str(args.llm_latency_ms),
+        'FAKE_LLM_TOKEN_MS': '0',
+        'AUTO_MIGRATE': 'False',
+        'CHATBOT_CACHE_PATH': '',
+        'SUGGESTIONS_CACHE_PATH': '',
+        'SUGGESTIONS_CACHE_ENABLED': 'True' if args.cache else 'False',
+        'CHATBOT_CACHE_ENABLED': 'True' if args.cache else 'False',
+    })
+    if args.matching_engine:
+        os.environ['MATCHING_ENGINE'] = args.matching_engine
+
+
+def prepara_dati(app_module, cartella, n_descrittori, n_osservazioni, n_attivita, riusa):
+    meta_path = os.path.join(cartella, 'benchmark.json')
+    dimensioni = {'descrittori': n_descrittori, 'osservazioni': n_osservazioni, 'attivita': n_attivita}
+
+    app_module.DB_PATH = os.path.join(cartella, 'riza.db')
+    app_module.ADMIN_DB_PATH = os.path.join(cartella, 'admin.db')
+    app_module.embedding_index.path = os.path.join(cartella, 'riza_descrittori.emb')
+
+    if riusa and os.path.exists(meta_path):
+        with open(meta_path) as f:
+            if json.load(f) == dimensioni:
+                print(f"Dati sintetici riutilizzati da {cartella}")
+                return 0.0
+
+    shutil.rmtree(cartella, ignore_errors=True)
+    os.makedirs(cartella)
+    inizio = time.perf_counter()
+    app_module.init_databases()
+    dati_sintetici.popola_riza(app_module.DB_PATH, n_descrittori, n_osservazioni)
+    dati_sintetici.popola_admin(app_module.ADMIN_DB_PATH, n_attivita)
+    with open(meta_path, 'w') as f:
+        json.dump(dimensioni, f)
+    durata = time.perf_counter() - inizio
+    print(f"Dati sintetici generati in {durata:.1f}s: {dimensioni}")
+    return durata
+
+
+def crea_richieste(rnd):
+    def get_suggestions(client):
+        return client.post('/get_suggestions', json={
+            'osservazione': dati_sintetici.osservazione_casuale(rnd),
+            'disciplina': rnd.choice(dati_sintetici.DISCIPLINE),
+        })
+
+    def save_observation(client):
+        return client.post('/save_observation', json={
+            'allievo': f"Allievo {rnd.randrange(500)}",
+            'classe': f"{rnd.randint(1, 5)}A",
+            'disciplina': rnd.choice(dati_sintetici.DISCIPLINE),
+            'situazione': rnd.choice(dati_sintetici.SITUAZIONI),
+            'osservazione': dati_sintetici.osservazione_casuale(rnd),
+            'dimensione': rnd.choice(dati_sintetici.DIMENSIONI),
+            'processo': rnd.choice(dati_sintetici.PROCESSI),
+            'livello': rnd.choice(dati_sintetici.LIVELLI),
+            'id_descrittore': rnd.randint(1, 100),
+        })
+
+    # Alterna elenco senza filtri, filtro per disciplina e ricerca full-text
+    def view_observations(client):
+        parametri = rnd.choice([
+            '',
+            f"?disciplina={rnd.choice(dati_sintetici.DISCIPLINE)}",
+            f"?q={rnd.choice(['calcoli', 'problemi', 'compagni', 'strategie'])}",
+        ])
+        return client.get(f'/view_observations{parametri}')
+
+    def admin_dashboard(client):
+        return client.get('/admin/dashboard')
+
+    return {
+        'get_suggestions': get_suggestions,
+        'save_observation': save_observation,
+        'view_observations': view_observations,
+        'admin_dashboard': admin_dashboard,
+    }
+
+
+# Esito di una risposta: None se valida, altrimenti la descrizione dell'errore.
+# Le rotte HTML rispondono 200 anche ai fallimenti, con il solo testo
+# "Errore: ..." al posto della pagina: una pagina è valida solo se completa
+def errore_risposta(risposta):
+    if risposta.status_code != 200:
+        return f"HTTP {risposta.status_code}"
+    if risposta.is_json:
+        dati = risposta.get_json()
+        if isinstance(dati, dict) and (dati.get('success') is False or dati.get('error')):
+            return f"JSON: {dati.get('error') or dati}"
+        return None
+    corpo = risposta.get_data(as_text=True)
+    if risposta.mimetype != 'text/html' or corpo.lstrip().startswith('Errore') or '</html>' not in corpo:
+        return f"{risposta.mimetype}: {corpo.strip()[:200]}"
+    return None
+
+
+def esegui_scenario(client, richiesta, n, riscaldamento):
+    for _ in range(riscaldamento):
+        richiesta(client)
+
+    latenze = []
+    errori = 0
+    primo_errore = None
+    inizio = time.perf_counter()
+    for _ in range(n):
+        t = time.perf_counter()
+        risposta = richiesta(client)
+        latenze.append((time.perf_counter() - t) * 1000)
+        errore = errore_risposta(risposta)
+        if errore:
+            errori += 1
+            primo_errore = primo_errore or errore
+    totale = time.perf_counter() - inizio
+
+    return {
+        'requests': n,
+        'errors': errori,
+        'first_error': primo_errore,
+        'throughput_rps': round(n / totale, 1) if totale else 0.0,
+        'latency_ms': {
+            'mean': round(sum(latenze) / len(latenze), 3) if latenze else 0.0,
+            'p50': round(percentile(latenze, 50), 3),
+            'p95': round(percentile(latenze, 95), 3),
+            'p99': round(percentile(latenze, 99), 3),
+            'max': round(max(latenze), 3) if latenze else 0.0,
+        },
+        'rss_peak_mb': rss_picco_mb(),
+    }
+
+
+def confronta(precedenti, attuali):
+    print(f"\nConfronto con {precedenti['meta'].get('commit') or 'esecuzione precedente'}:")
+    print(f"{'scenario':<20} {'p50 ms':>18} {'p95 ms':>18} {'req/s':>18}")
+    for nome, attuale in attuali['scenari'].items():
+        prima = precedenti['scenari'].get(nome)
+        if not prima:
+            continue
+
+        def cella(vecchio, nuovo):
+            variazione = (nuovo - vecchio) / vecchio * 100 if vecchio else 0.0
+            return f"{nuovo:.2f} ({variazione:+.0f}%)"
+
+        print(
+            f"{nome:<20} "
+            f"{cella(prima['latency_ms']['p50'], attuale['latency_ms']['p50']):>18} "
+            f"{cella(prima['latency_ms']['p95'], attuale['latency_ms']['p95']):>18} "
+            f"{cella(prima['throughput_rps'], attuale['throughput_rps']):>18}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scale', choices=SCALE, default='small')
+    parser.add_argument('--descrittori', type=int, help='sovrascrive la scala')
+    parser.add_argument('--osservazioni', type=int, help='sovrascrive la scala')
+    parser.add_argument('--attivita', type=int, help='sovrascrive la scala')
+    parser.add_argument('--scenari', default=','.join(SCENARI), help='elenco separato da virgole')
+    parser.add_argument('--requests', type=int, default=200, help='richieste misurate per scenario')
+    parser.add_argument('--warmup', type=int, default=10, help='richieste di riscaldamento per scenario')
+    parser.add_argument('--ai', action='store_true', help='suggerimenti con riordino LLM (backend locale)')
+    parser.add_argument('--llm-latency-ms', type=int, default=0, help='latenza simulata del backend LLM')
+    parser.add_argument('--matching-engine', choices=['tfidf', 'embedding'])
+    parser.add_argument('--cache', action='store_true', help='abilita le cache di risposte e suggerimenti')
+    parser.add_argument('--data-dir', help='cartella dei database sintetici (predefinita: temporanea)')
+    parser.add_argument('--reuse', action='store_true', help='riusa i dati in --data-dir se hanno le stesse dimensioni')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='file JSON dei risultati')
+    parser.add_argument('--compare', help='file JSON di una esecuzione precedente da confrontare')
+    args = parser.parse_args()
+
+    n_descrittori, n_osservazioni, n_attivita = SCALE[args.scale]
+    n_descrittori = args.descrittori or n_descrittori
+    n_osservazioni = args.osservazioni if args.osservazioni is not None else n_osservazioni
+    n_attivita = args.attivita if args.attivita is not None else n_attivita
+
+    configura_ambiente(args)
+    import app as app_module
+
+    cartella = args.data_dir or tempfile.mkdtemp(prefix='riza-benchmark-')
+    generazione = prepara_dati(app_module, cartella, n_descrittori, n_osservazioni, n_attivita, args.reuse)
+
+    app_module.app.testing = True
+    client = app_module.app.test_client()
+    client.post('/login', data={'email': 'admin@benchmark.local', 'password': 'benchmark'})
+
+    richieste = crea_richieste(random.Random(args.seed))
+    risultati = {
+        'meta': {
+            'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+            'commit': commit_corrente(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'sizes': {'descrittori': n_descrittori, 'osservazioni': n_osservazioni, 'attivita': n_attivita},
+            'options': {
+                'ai': args.ai, 'llm_latency_ms': args.llm_latency_ms, 'cache': args.cache,
+                'matching_engine': app_module.MATCHING_ENGINE, 'requests': args.requests, 'warmup': args.warmup,
+            },
+            'data_generation_s': round(generazione, 2),
+            'rss_before_mb': rss_picco_mb(),
+        },
+        'scenari': {},
+    }
+
+    for nome in [s.strip() for s in args.scenari.split(',') if s.strip()]:
+        if nome not in richieste:
+            parser.error(f"scenario sconosciuto: {nome}")
+        risultati['scenari'][nome] = esegui_scenario(client, richieste[nome], args.requests, args.warmup)
+        r = risultati['scenari'][nome]
+        print(
+            f"{nome:<20} {r['throughput_rps']:>8} req/s  p50 {r['latency_ms']['p50']:>8.2f} ms  "
+            f"p95 {r['latency_ms']['p95']:>8.2f} ms  p99 {r['latency_ms']['p99']:>8.2f} ms  "
+            f"RSS {r['rss_peak_mb']} MB  errori {r['errors']}"
+        )
+        if r['errors']:
+            print(f"{'':<20} primo errore: {r['first_error']}")
+
+    if app_module.activity_logger is not None:
+        app_module.activity_logger.flush()
+
+    output = args.output or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'risultati',
+        f"benchmark-{datetime.datetime.now():%Y%m%d-%H%M%S}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(risultati, f, indent=2)
+    print(f"Risultati salvati in {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            confronta(json.load(f), risultati)
+
+    if not args.data_dir:
+        shutil.rmtree(cartella, ignore_errors=True)
+
+    # Le misure di uno scenario con errori non sono confrontabili
+    falliti = [nome for nome, r in risultati['scenari'].items() if r['errors']]
+    if falliti:
+        sys.exit(f"Scenari con errori: {', '.join(falliti)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""Benchmark dei salvataggi concorrenti di osservazioni (fine lezione).
+
+Molti docenti salvano insieme: ogni thread simula un docente con il proprio
+client e invia richieste a /save_observation. Lo stesso carico è eseguito con
+una transazione per richiesta e con il group commit, e per ciascuna modalità
+sono riportati throughput, latenze e osservazioni per transazione:
+
+    python benchmarks/salvataggi_concorrenti.py --threads 32 --requests 50
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import dati_sintetici  # noqa: E402
+from run import percentile  # noqa: E402
+
+MODALITA = {'per_richiesta': False, 'group_commit': True}
+
+
+def docente(app_module, indice, n, latenze, errori, barriera):
+    rnd = random.Random(indice)
+    client = app_module.app.test_client()
+    client.post('/login', data={'email': 'admin@benchmark.local', 'password': 'benchmark'})
+    barriera.wait()
+    for _ in range(n):
+        inizio = time.perf_counter()
+        risposta = client.post('/save_observation', json={
+            'allievo': f"Allievo {rnd.randrange(500)}",
+            'classe': f"{rnd.randint(1, 5)}A",
+            'disciplina': rnd.choice(dati_sintetici.DISCIPLINE),
+            'situazione': rnd.choice(dati_sintetici.SITUAZIONI),
+            'osservazione': dati_sintetici.osservazione_casuale(rnd),
+            'dimensione': rnd.choice(dati_sintetici.DIMENSIONI),
+            'processo': rnd.choice(dati_sintetici.PROCESSI),
+            'livello': rnd.choice(dati_sintetici.LIVELLI),
+            'id_descrittore': rnd.randint(1, 100),
+        })
+        latenze.append((time.perf_counter() - inizio) * 1000)
+        if not risposta.json.get('success'):
+            errori.append(risposta.json.get('error'))
+
+
+def esegui(app_module, threads, n):
+    latenze, errori = [], []
+    barriera = threading.Barrier(threads + 1)
+    docenti = [
+        threading.Thread(target=docente, args=(app_module, i, n, latenze, errori, barriera))
+        for i in range(threads)
+    ]
+    for t in docenti:
+        t.start()
+    barriera.wait()
+    inizio = time.perf_counter()
+    for t in docenti:
+        t.join()
+    durata = time.perf_counter() - inizio
+    return {
+        'requests': threads * n,
+        'errors': len(errori),
+        'throughput_rps': round(threads * n / durata, 1),
+        'p50_ms': round(percentile(latenze, 50), 2),
+        'p95_ms': round(percentile(latenze, 95), 2),
+        'p99_ms': round(percentile(latenze, 99), 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=32, help='docenti che salvano contemporaneamente')
+    parser.add_argument('--requests', type=int, default=50, help='salvataggi per docente')
+    parser.add_argument('--window-ms', type=float, default=2, help='finestra di raccolta del group commit')
+    parser.add_argument('--synchronous', default='NORMAL', choices=['OFF', 'NORMAL', 'FULL'],
+                        help='PRAGMA synchronous (FULL simula un fsync a ogni commit)')
+    args = parser.parse_args()
+
+    os.environ.update({
+        'ENABLE_AI': 'False', 'AUTO_MIGRATE': 'False', 'ACTIVITY_LOG_ASYNC': 'True',
+        'OBSERVATION_GROUP_COMMIT_WINDOW_MS': str(args.window_ms),
+        'DB_POOL_SIZE': str(max(args.threads, 5)),
+    })
+    import app as app_module
+
+    cartella = tempfile.mkdtemp(prefix='riza-salvataggi-')
+    try:
+        app_module.DB_PATH = os.path.join(cartella, 'riza.db')
+        app_module.ADMIN_DB_PATH = os.path.join(cartella, 'admin.db')
+        app_module.init_databases()
+        dati_sintetici.popola_riza(app_module.DB_PATH, 200, 1000)
+        dati_sintetici.popola_admin(app_module.ADMIN_DB_PATH, 0)
+        app_module.db_manager.pragmas = dict(app_module.db_manager.pragmas or {}, synchronous=args.synchronous)
+        app_module.app.testing = True
+
+        risultati = {}
+        for nome, group_commit in MODALITA.items():
+            app_module.OBSERVATION_GROUP_COMMIT = group_commit
+            prima = app_module.scrittore_osservazioni.statistiche()
+            risultati[nome] = r = esegui(app_module, args.threads, args.requests)
+            dopo = app_module.scrittore_osservazioni.statistiche()
+            if group_commit:
+                transazioni = dopo['transazioni'] - prima['transazioni']
+                r['observations_per_commit'] = round((dopo['scritture'] - prima['scritture']) / transazioni, 1)
+            print(
+                f"{nome:<14} {r['throughput_rps']:>8} salvataggi/s  p50 {r['p50_ms']:>7.2f} ms  "
+                f"p95 {r['p95_ms']:>7.2f} ms  p99 {r['p99_ms']:>7.2f} ms  errori {r['errors']}"
+                + (f"  {r['observations_per_commit']} oss./commit" if group_commit else '')
+            )
+
+        base = risultati['per_richiesta']['throughput_rps']
+        if base:
+            print(f"Guadagno del group commit: x{risultati['group_commit']['throughput_rps'] / base:.2f}")
+        app_module.activity_logger.flush()
+    finally:
+        shutil.rmtree(cartella, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+import json
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# Prompt di sistema del chatbot
+CHATBOT_SYSTEM_PROMPT = "Sei un assistente esperto in ambito educativo e didattico, specializzato nel supporto ai docenti. Fornisci risposte dettagliate, pratiche e basate su evidenze scientifiche. Quando possibile, offri esempi concreti e suggerimenti applicabili in classe."
+CHATBOT_SUGGESTIONS_PROMPT = "Genera 5 domande correlate che un docente potrebbe voler fare dopo aver ricevuto una risposta alla sua domanda iniziale. Fornisci solo le domande, una per riga, senza numerazione o punti elenco."
+
+# Istruzioni aggiunte in modalità "merged": risposta e domande correlate in un unico JSON
+CHATBOT_MERGED_PROMPT = CHATBOT_SYSTEM_PROMPT + """
+Rispondi esclusivamente con un oggetto JSON con questa struttura:
+{"risposta": "la tua risposta completa al docente", "domande_correlate": ["5 domande che il docente potrebbe voler fare dopo questa risposta"]}"""
+
+# Modalità di generazione di risposta e domande correlate
+MODE_SERIAL = 'serial'    # due chiamate in sequenza (comportamento originale)
+MODE_MERGED = 'merged'    # una sola chiamata con output strutturato
+MODE_ASYNC = 'async'      # risposta subito, domande generate in background
+
+
+def genera_risposta(backend, query, model, max_tokens, temperature, timeout=None):
+    return backend.completa(
+        [
+            {"role": "system", "content": CHATBOT_SYSTEM_PROMPT},
+            {"role": "user", "content": query}
+        ],
+        model=model,
+        max_tokens=max_tokens,
+        temperature=temperature,
+        timeout=timeout
+    )
+
+
+def genera_risposta_stream(backend, query, model, max_tokens, temperature, timeout=None):
+    return backend.stream(
+        [
+            {"role": "system", "content": CHATBOT_SYSTEM_PROMPT},
+            {"role": "user", "content": query}
+        ],
+        model=model,
+        max_tokens=max_tokens,
+        temperature=temperature,
+        timeout=timeout
+    )
+
+
+# Formatta un evento Server-Sent Events con payload JSON
+def evento_sse(evento, dati):
+    return f"event: {evento}\ndata: {json.dumps(dati, ensure_ascii=False)}\n\n"
+
+
+def genera_suggerimenti(backend, query, risposta, model, timeout=None):
+    suggestions_text = backend.completa(
+        [
+            {"role": "system", "content": CHATBOT_SUGGESTIONS_PROMPT},
+            {"role": "user", "content": f"Domanda iniziale: {query}\nRisposta ricevuta: {risposta}"}
+        ],
+        model=model,
+        max_tokens=200,
+        temperature=0.7,
+        timeout=timeout
+    )
+    return [s.strip() for s in suggestions_text.split('\n') if s.strip()]
+
+
+# Una sola chiamata che restituisce risposta e domande correlate come JSON;
+# se il modello non rispetta il formato, il testo intero diventa la risposta
+def genera_risposta_e_suggerimenti(backend, query, model, max_tokens, temperature, timeout=None):
+    testo = backend.completa(
+        [
+            {"role": "system", "content": CHATBOT_MERGED_PROMPT},
+            {"role": "user", "content": query}
+        ],
+        model=model,
+        max_tokens=max_tokens,
+        temperature=temperature,
+        response_format={"type": "json_object"},
+        timeout=timeout
+    )
+
+    try:
+        dati = json.loads(testo)
+        risposta = str(dati['risposta'])
+        suggerimenti = [str(s).strip() for s in dati.get('domande_correlate', []) if str(s).strip()]
+        return risposta, suggerimenti
+    except (ValueError, KeyError, TypeError):
+        return testo, []
+
+
+# Domande correlate generate in un thread pool mentre la risposta è già stata
+# restituita: il client le recupera con il token tramite un endpoint dedicato.
+# I risultati restano in memoria del worker per ttl secondi
+class SuggerimentiAsincroni:
+    def __init__(self, max_workers=4, ttl=300, max_pendenti=1000):
+        self.ttl = ttl
+        self.max_pendenti = max_pendenti
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='chatbot-suggestions')
+        self._futures = {}
+        self._lock = threading.Lock()
+
+    def _pulisci(self, adesso):
+        scaduti = [t for t, (_, creato) in self._futures.items() if adesso - creato > self.ttl]
+        for token in scaduti:
+            del self._futures[token]
+        while len(self._futures) >= self.max_pendenti:
+            del self._futures[next(iter(self._futures))]
+
+    def avvia(self, funzione, *args, al_termine=None):
+        future = self._executor.submit(funzione, *args)
+        if al_termine is not None:
+            future.add_done_callback(lambda f: f.exception() is None and al_termine(f.result()))
+
+        token = uuid.uuid4().hex
+        adesso = time.monotonic()
+        with self._lock:
+            self._pulisci(adesso)
+            self._futures[token] = (future, adesso)
+        return token
+
+    # Restituisce (pronto, suggerimenti); None se il token è sconosciuto o scaduto
+    def risultato(self, token, attesa=0):
+        with self._lock:
+            voce = self._futures.get(token)
+        if voce is None:
+            return None
+
+        future = voce[0]
+        if attesa and not future.done():
+            try:
+                future.result(timeout=attesa)
+            except Exception:
+                pass
+
+        if not future.done():
+            return False, []
+
+        with self._lock:
+            self._futures.pop(token, None)
+
+        if future.exception() is not None:
+            print(f"Errore nella generazione delle domande correlate: {future.exception()}")
+            return True, []
+        return True, future.result()
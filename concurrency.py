@@ -0,0 +1,67 @@
+import threading
+from functools import wraps
+
+from flask import jsonify
+
+
+# Limite di richieste contemporanee per un endpoint: oltre max_concorrenti le
+# richieste attendono al massimo attesa secondi un posto libero, poi ricevono 503.
+# Evita che gli endpoint che chiamano il modello occupino tutti i thread del worker
+class LimiteConcorrenza:
+    def __init__(self, nome, max_concorrenti, attesa=5.0):
+        self.nome = nome
+        self.max_concorrenti = max_concorrenti
+        self.attesa = attesa
+        self._semaforo = threading.BoundedSemaphore(max_concorrenti)
+        self._lock = threading.Lock()
+        self.attive = 0
+        self.rifiutate = 0
+
+    def acquisisci(self):
+        if not self._semaforo.acquire(timeout=self.attesa):
+            with self._lock:
+                self.rifiutate += 1
+            return False
+        with self._lock:
+            self.attive += 1
+        return True
+
+    def rilascia(self):
+        with self._lock:
+            self.attive -= 1
+        self._semaforo.release()
+
+    # Decoratore per le view: per le risposte in streaming il posto resta
+    # occupato fino alla chiusura dello stream
+    def limita(self, view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if not self.acquisisci():
+                risposta = jsonify({
+                    'success': False,
+                    'error': 'Servizio momentaneamente sovraccarico, riprova tra qualche secondo.'
+                })
+                risposta.status_code = 503
+                risposta.headers['Retry-After'] = '5'
+                return risposta
+
+            try:
+                risposta = view(*args, **kwargs)
+            except BaseException:
+                self.rilascia()
+                raise
+
+            if getattr(risposta, 'is_streamed', False):
+                risposta.call_on_close(self.rilascia)
+            else:
+                self.rilascia()
+            return risposta
+        return wrapper
+
+    def statistiche(self):
+        with self._lock:
+            return {
+                'max_concorrenti': self.max_concorrenti,
+                'attive': self.attive,
+                'rifiutate': self.rifiutate,
+            }
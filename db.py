@@ -0,0 +1,187 @@
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+# Pragma applicati una sola volta alla creazione di ogni connessione
+PRAGMA_PREDEFINITI = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -8000,         # ~8 MB di cache pagine per connessione
+    'mmap_size': 64 * 1024 * 1024,
+    'busy_timeout': 5000,        # millisecondi di attesa sui lock invece di "database is locked"
+    'temp_store': 'MEMORY',
+}
+
+
+# Pool thread-safe di connessioni SQLite verso un singolo file
+class ConnectionPool:
+    def __init__(self, path, max_size=5, timeout=10.0, pragmas=None):
+        self.path = path
+        self.max_size = max_size
+        self.timeout = timeout
+        self.pragmas = dict(PRAGMA_PREDEFINITI, **(pragmas or {}))
+        self._libere = queue.LifoQueue()
+        self._create = 0
+        self._lock = threading.Lock()
+
+    def _crea(self):
+        conn = sqlite3.connect(
+            self.path,
+            timeout=self.pragmas.get('busy_timeout', 5000) / 1000,
+            check_same_thread=False
+        )
+        conn.row_factory = sqlite3.Row
+        for nome, valore in self.pragmas.items():
+            conn.execute(f"PRAGMA {nome} = {valore}")
+        return conn
+
+    def acquisisci(self):
+        try:
+            return self._libere.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if self._create < self.max_size:
+                self._create += 1
+                try:
+                    return self._crea()
+                except Exception:
+                    self._create -= 1
+                    raise
+
+        try:
+            return self._libere.get(timeout=self.timeout)
+        except queue.Empty:
+            raise sqlite3.OperationalError(f"Nessuna connessione libera nel pool per {self.path}")
+
+    def rilascia(self, conn):
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            # Connessione non più utilizzabile: la scartiamo
+            with self._lock:
+                self._create -= 1
+            return
+        self._libere.put(conn)
+
+    @contextmanager
+    def connessione(self):
+        conn = self.acquisisci()
+        try:
+            yield conn
+        finally:
+            self.rilascia(conn)
+
+    def chiudi_tutte(self):
+        while True:
+            try:
+                conn = self._libere.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._create -= 1
+
+
+# Connessione presa in prestito dal pool: close() la restituisce al pool invece di
+# chiuderla; se è legata alla richiesta Flask, close() non fa nulla e il rilascio
+# avviene al teardown, così tutti gli handler della richiesta riusano la stessa
+class ConnessionePool:
+    def __init__(self, conn, pool, legata_richiesta=False):
+        self._conn = conn
+        self._pool = pool
+        self._legata_richiesta = legata_richiesta
+        self._rilasciata = False
+
+    def __getattr__(self, nome):
+        return getattr(self._conn, nome)
+
+    def __enter__(self):
+        return self._conn.__enter__()
+
+    def __exit__(self, *args):
+        return self._conn.__exit__(*args)
+
+    def close(self):
+        if not self._legata_richiesta:
+            self.rilascia()
+
+    def rilascia(self):
+        if not self._rilasciata:
+            self._rilasciata = True
+            self._pool.rilascia(self._conn)
+
+
+# Registro dei pool per percorso del database, creati al primo utilizzo
+class DatabaseManager:
+    def __init__(self, max_size=5, timeout=10.0, pragmas=None):
+        self.max_size = max_size
+        self.timeout = timeout
+        self.pragmas = pragmas
+        self._pools = {}
+        self._lock = threading.Lock()
+
+    def pool(self, path):
+        pool = self._pools.get(path)
+        if pool is None:
+            with self._lock:
+                pool = self._pools.get(path)
+                if pool is None:
+                    pool = ConnectionPool(path, self.max_size, self.timeout, self.pragmas)
+                    self._pools[path] = pool
+        return pool
+
+    # Restituisce la connessione della richiesta corrente (creandola se serve) oppure,
+    # fuori da una richiesta o con legata_richiesta=False, una connessione del pool
+    # da chiudere con close() (es. nei generatori delle risposte in streaming)
+    def connessione(self, path, legata_richiesta=True):
+        from flask import g, has_app_context
+
+        if not legata_richiesta or not has_app_context():
+            return ConnessionePool(self.pool(path).acquisisci(), self.pool(path))
+
+        connessioni = g.setdefault('_db_connessioni', {})
+        conn = connessioni.get(path)
+        if conn is None:
+            conn = ConnessionePool(self.pool(path).acquisisci(), self.pool(path), legata_richiesta=True)
+            connessioni[path] = conn
+        return conn
+
+    # Restituisce subito al pool le connessioni della richiesta: le risposte in
+    # streaming arrivano al teardown solo a download finito
+    def rilascia_richiesta(self):
+        from flask import g
+
+        for conn in g.pop('_db_connessioni', {}).values():
+            conn.rilascia()
+
+    def init_app(self, app):
+        @app.teardown_appcontext
+        def rilascia_connessioni(exception=None):
+            self.rilascia_richiesta()
+
+    def chiudi_tutte(self):
+        for pool in list(self._pools.values()):
+            pool.chiudi_tutte()
+
+
+# Esegue uno script SQL dentro la transazione corrente (executescript farebbe commit da solo)
+def esegui_script(conn, script):
+    for istruzione in _istruzioni(script):
+        conn.execute(istruzione)
+
+
+# Divide uno script SQL in istruzioni complete
+def _istruzioni(script):
+    istruzione = ''
+    for riga in script.splitlines(keepends=True):
+        istruzione += riga
+        if sqlite3.complete_statement(istruzione):
+            if istruzione.strip():
+                yield istruzione.strip()
+            istruzione = ''
+    if istruzione.strip():
+        yield istruzione.strip()
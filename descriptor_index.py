@@ -0,0 +1,200 @@
+import sqlite3
+import threading
+import time
+
+from metrics import span
+from text_analysis import TextAnalyzer
+
+# Query per caricare i descrittori di tutte le discipline in un colpo solo
+DESCRITTORI_QUERY = """
+    SELECT d.*, a.disciplina
+    FROM descrittori d
+    JOIN aree_disciplinari a ON d.area_disciplinare_id = a.id
+    ORDER BY a.disciplina, d.id
+"""
+
+# Versione della tabella descrittori mantenuta dai trigger (migrazione 3)
+VERSIONE_QUERY = "SELECT versione FROM meta_versioni WHERE nome = 'descrittori'"
+
+# Firma economica della tabella descrittori, usata se la tabella delle versioni
+# non esiste: cambia a ogni inserimento, cancellazione o modifica del testo
+FIRMA_QUERY = """
+    SELECT COUNT(*), COALESCE(MAX(id), 0), TOTAL(LENGTH(testo_descrittore)), TOTAL(area_disciplinare_id)
+    FROM descrittori
+"""
+
+
+# Indici dei top_k valori più alti per ogni riga, in ordine decrescente:
+# argpartition seleziona in O(n), l'ordinamento riguarda solo i k candidati
+def top_k_righe(punteggi, top_k):
+    import numpy as np
+
+    n = punteggi.shape[1]
+    k = min(top_k, n)
+    if k <= 0:
+        return np.empty((punteggi.shape[0], 0), dtype=int)
+
+    if k < n:
+        candidati = np.argpartition(-punteggi, k - 1, axis=1)[:, :k]
+    else:
+        candidati = np.tile(np.arange(n), (punteggi.shape[0], 1))
+
+    valori = np.take_along_axis(punteggi, candidati, axis=1)
+    ordine = np.argsort(-valori, axis=1, kind='stable')
+    return np.take_along_axis(candidati, ordine, axis=1)
+
+
+# I testi arrivano al vettorizzatore già analizzati (liste di token)
+def _identita(tokens):
+    return tokens
+
+
+# Indice TF-IDF di una singola disciplina: vettorizzatore già addestrato,
+# matrice sparsa dei descrittori (righe normalizzate L2) e righe originali
+class IndiceDisciplina:
+    def __init__(self, disciplina, descrittori, vectorizer, matrice, analyzer):
+        self.disciplina = disciplina
+        self.analyzer = analyzer
+        self.descrittori = descrittori
+        self.per_id = {d['id']: d for d in descrittori}
+        self.vectorizer = vectorizer
+        self.matrice = matrice
+
+    def punteggi(self, testi):
+        # Con righe normalizzate il prodotto scalare coincide con la similarità del coseno:
+        # un solo prodotto matrice sparsa per tutte le osservazioni
+        vettori = self.vectorizer.transform([self.analyzer.analizza(t) for t in testi])
+        return (vettori @ self.matrice.T).toarray()
+
+    def cerca_batch(self, testi, top_k=5):
+        if not self.descrittori or not testi:
+            return [[] for _ in testi]
+
+        punteggi = self.punteggi(testi)
+        risultati = []
+        for riga, indici in zip(punteggi, top_k_righe(punteggi, top_k)):
+            risultati.append([(self.descrittori[idx], float(riga[idx])) for idx in indici if riga[idx] > 0])
+        return risultati
+
+    def cerca(self, testo, top_k=5):
+        return self.cerca_batch([testo], top_k)[0]
+
+
+# Indice dei descrittori RIZA per disciplina, costruito una sola volta e
+# tenuto in memoria finché la tabella descrittori non cambia
+class DescriptorIndex:
+    def __init__(self, get_connection, analyzer=None, check_interval=5.0):
+        self.get_connection = get_connection
+        self.analyzer = analyzer or TextAnalyzer()
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._indici = {}
+        self._firma = None
+        self._ultimo_controllo = 0.0
+        self._al_cambio = []
+
+    # scikit-learn (e SciPy) viene importato alla prima costruzione dell'indice e
+    # non all'avvio: i worker che servono solo login e pagine statiche non lo caricano
+    def _crea_vectorizer(self):
+        from sklearn.feature_extraction.text import TfidfVectorizer
+
+        return TfidfVectorizer(analyzer=_identita, lowercase=False)
+
+    def _leggi_firma(self, conn):
+        try:
+            row = conn.execute(VERSIONE_QUERY).fetchone()
+            if row is not None:
+                return ('versione', row[0])
+        except sqlite3.OperationalError:
+            pass
+        return tuple(conn.execute(FIRMA_QUERY).fetchone())
+
+    def _costruisci(self, conn):
+        per_disciplina = {}
+        for row in conn.execute(DESCRITTORI_QUERY).fetchall():
+            per_disciplina.setdefault(row['disciplina'], []).append(dict(row))
+
+        indici = {}
+        for disciplina, descrittori in per_disciplina.items():
+            vectorizer = self._crea_vectorizer()
+            try:
+                matrice = vectorizer.fit_transform(
+                    [self.analyzer.analizza_descrittore(d['testo_descrittore'] or '') for d in descrittori]
+                )
+            except ValueError:
+                # Vocabolario vuoto (es. descrittori composti solo da stop word)
+                vectorizer, matrice = None, None
+            indici[disciplina] = IndiceDisciplina(disciplina, descrittori, vectorizer, matrice, self.analyzer)
+
+        return indici
+
+    # Verifica (al più ogni check_interval secondi) che la tabella non sia cambiata
+    def _aggiorna_se_necessario(self):
+        now = time.monotonic()
+        if self._firma is not None and now - self._ultimo_controllo < self.check_interval:
+            return
+
+        with self._lock:
+            now = time.monotonic()
+            if self._firma is not None and now - self._ultimo_controllo < self.check_interval:
+                return
+
+            conn = self.get_connection()
+            try:
+                firma = self._leggi_firma(conn)
+                if firma != self._firma:
+                    precedente = self._firma
+                    with span('descriptor_index_build'):
+                        self._indici = self._costruisci(conn)
+                    self._firma = firma
+                    if precedente is not None:
+                        for funzione in self._al_cambio:
+                            funzione()
+            finally:
+                conn.close()
+
+            self._ultimo_controllo = now
+
+    # Registra una funzione da chiamare quando l'indice viene ricostruito
+    # perché la tabella descrittori è cambiata
+    def al_cambio(self, funzione):
+        self._al_cambio.append(funzione)
+
+    # Versione dei descrittori su cui è costruito l'indice corrente
+    def versione(self):
+        self._aggiorna_se_necessario()
+        return self._firma
+
+    def invalida(self):
+        with self._lock:
+            self._firma = None
+            self._indici = {}
+
+    def riscalda(self):
+        self._aggiorna_se_necessario()
+        return len(self._indici)
+
+    def get(self, disciplina):
+        self._aggiorna_se_necessario()
+        return self._indici.get(disciplina)
+
+    def descrittori(self, disciplina):
+        indice = self.get(disciplina)
+        return indice.descrittori if indice else []
+
+    # Dizionario id -> descrittore della disciplina, costruito con l'indice
+    def per_id(self, disciplina):
+        indice = self.get(disciplina)
+        return indice.per_id if indice else {}
+
+    def cerca(self, disciplina, testo, top_k=5):
+        indice = self.get(disciplina)
+        if not indice or indice.vectorizer is None:
+            return []
+        return indice.cerca(testo, top_k)
+
+    def cerca_batch(self, disciplina, testi, top_k=5):
+        indice = self.get(disciplina)
+        if not indice or indice.vectorizer is None:
+            return [[] for _ in testi]
+        return indice.cerca_batch(testi, top_k)
@@ -0,0 +1,136 @@
+from structured_output import ParserJSONIncrementale, normalizza_id
+
+# Classificazione dei descrittori in due fasi: l'indice TF-IDF ordina tutti i
+# descrittori della disciplina, il modello riceve solo i candidati migliori
+# (quanti ne stanno nel budget di token) e li riordina con una spiegazione
+
+RANKER_SYSTEM_PROMPT = "Sei un assistente specializzato in valutazione formativa e nel modello RIZA (Risorse, Interpretazione, Azione, Autoregolazione). Il tuo compito è analizzare osservazioni di allievi e collegarle ai descrittori RIZA più pertinenti."
+
+# Intestazione riconosciuta anche dal backend di prova per simulare la risposta
+INTESTAZIONE_CANDIDATI = "Descrittori candidati:"
+
+
+# Stima approssimativa dei token (circa 4 caratteri per token per l'italiano)
+def stima_token(testo):
+    return len(testo) // 4 + 1
+
+
+def formatta_descrittore(d):
+    return f"ID: {d['id']} - Dimensione: {d['dimensione_riza']} - Processo: {d['processo_specifico_verbo']} - Livello: {d['livello']} - Descrittore: {d['testo_descrittore']}"
+
+
+# Prende i candidati in ordine di punteggio TF-IDF finché rientrano nel budget
+# di token, garantendone almeno k_min e al massimo k_max
+def seleziona_candidati(candidati, budget_token, k_min=3, k_max=15):
+    selezionati = []
+    usati = 0
+    for descrittore, similarita in candidati[:k_max]:
+        riga = formatta_descrittore(descrittore)
+        costo = stima_token(riga)
+        if len(selezionati) >= k_min and usati + costo > budget_token:
+            break
+        selezionati.append((descrittore, similarita, riga))
+        usati += costo
+    return selezionati
+
+
+# Se l'osservazione ha pochi termini in comune con i descrittori, l'indice restituisce
+# meno di k_min candidati: si completano con gli altri descrittori della disciplina
+# perché il modello possa comunque riconoscere corrispondenze semantiche
+def completa_candidati(candidati, descrittori, k_min):
+    if len(candidati) >= k_min:
+        return candidati
+    presenti = {d['id'] for d, _ in candidati}
+    aggiunti = [(d, 0.0) for d in descrittori if d['id'] not in presenti]
+    return candidati + aggiunti[:k_min - len(candidati)]
+
+
+def costruisci_prompt(osservazione, disciplina, righe, risultati=3):
+    prompt = f"""
+Analizza la seguente osservazione di un allievo e identifica quali descrittori RIZA sono più pertinenti.
+
+Osservazione: "{osservazione}"
+
+Disciplina: {disciplina}
+
+{INTESTAZIONE_CANDIDATI}
+"""
+    prompt += '\n'.join(righe)
+    prompt += f"""
+
+Restituisci i {risultati} descrittori più pertinenti all'osservazione, dal più pertinente, in formato JSON con la seguente struttura:
+{{
+  "descrittori": [
+    {{
+      "id": "ID del descrittore",
+      "similarita": "valore da 0 a 1 che indica quanto è pertinente",
+      "spiegazione": "breve spiegazione del perché questo descrittore è pertinente all'osservazione"
+    }},
+    ...
+  ]
+}}
+
+Includi solo il JSON nella tua risposta, senza testo aggiuntivo.
+"""
+    return prompt
+
+
+def _suggerimento(descrittore, sugg):
+    suggestion = dict(descrittore)
+    try:
+        suggestion['similarita'] = min(max(float(sugg.get('similarita', 0.5)), 0.0), 1.0)
+    except (TypeError, ValueError):
+        suggestion['similarita'] = 0.5
+    suggestion['spiegazione'] = str(sugg.get('spiegazione') or '')
+    return suggestion
+
+
+# Riordina con il modello i candidati selezionati; restituisce (suggerimenti, numero
+# di candidati inviati). La risposta è letta in streaming con un parser JSON
+# tollerante: ci si ferma appena arrivano `risultati` descrittori validi, e se
+# l'output non è JSON lo stream viene interrotto subito e si restituisce una lista
+# vuota, così il chiamante passa al motore locale senza una seconda chiamata.
+# Gli id sono risolti con il dizionario dei descrittori della disciplina
+def classifica(backend, osservazione, disciplina, candidati, model, max_tokens,
+               budget_token=1500, k_min=3, k_max=15, risultati=3, timeout=None,
+               descrittori_per_id=None, json_mode=True):
+    selezionati = seleziona_candidati(candidati, budget_token, k_min, k_max)
+    if not selezionati:
+        return [], 0
+
+    if descrittori_per_id is None:
+        descrittori_per_id = {d['id']: d for d, _, _ in selezionati}
+
+    frammenti = backend.stream(
+        [
+            {"role": "system", "content": RANKER_SYSTEM_PROMPT},
+            {"role": "user", "content": costruisci_prompt(osservazione, disciplina, [r for _, _, r in selezionati], risultati)}
+        ],
+        model=model,
+        max_tokens=max_tokens,
+        temperature=0.2,
+        timeout=timeout,
+        response_format={"type": "json_object"} if json_mode else None
+    )
+
+    parser = ParserJSONIncrementale('id')
+    suggestions = []
+    visti = set()
+    try:
+        for frammento in frammenti:
+            for sugg in parser.feed(frammento):
+                id_ = normalizza_id(sugg.get('id'))
+                descrittore = descrittori_per_id.get(id_)
+                if descrittore is None or id_ in visti:
+                    continue
+                visti.add(id_)
+                suggestions.append(_suggerimento(descrittore, sugg))
+
+            if len(suggestions) >= risultati or parser.malformato:
+                break
+    finally:
+        frammenti.close()
+
+    # Ordina per similarità decrescente
+    suggestions.sort(key=lambda x: x['similarita'], reverse=True)
+    return suggestions, len(selezionati)
@@ -0,0 +1,188 @@
+import hashlib
+import json
+import os
+import threading
+import zlib
+
+from descriptor_index import DESCRITTORI_QUERY, DescriptorIndex, top_k_righe
+
+# Motore di corrispondenza locale: ogni descrittore diventa un vettore denso
+# (hashing di parole e n-grammi di caratteri, normalizzato L2) calcolato una volta
+# e salvato in un file NumPy memory-mapped accanto al database; le ricerche sono
+# un prodotto matrice-vettore sulle righe della disciplina, senza rete.
+# NumPy è importato nei metodi che lo usano, per non pesare sull'avvio dei worker
+
+# Byte dell'impronta (sha256 esadecimale) in testa al file dei vettori
+LUNGHEZZA_IMPRONTA = 64
+
+
+# Embedding per hashing: ogni caratteristica (parola analizzata o n-gramma di
+# caratteri) incrementa una delle dim componenti, con segno dato dall'hash per
+# ridurre l'effetto delle collisioni
+class HashedEmbedder:
+    def __init__(self, analyzer, dim=512, char_ngrams=(3, 5), peso_ngrammi=0.5):
+        self.analyzer = analyzer
+        self.dim = dim
+        self.char_ngrams = char_ngrams
+        self.peso_ngrammi = peso_ngrammi
+        self._hash = {}
+
+    # Identifica la configurazione: vettori salvati con parametri diversi vanno ricalcolati
+    def firma(self):
+        return {
+            'tipo': 'hashed',
+            'dim': self.dim,
+            'char_ngrams': list(self.char_ngrams or ()),
+            'peso_ngrammi': self.peso_ngrammi,
+            'stemming': self.analyzer.stemming,
+            'rimuovi_accenti': self.analyzer.rimuovi_accenti,
+        }
+
+    def _caratteristiche(self, tokens):
+        caratteristiche = [(f'w:{t}', 1.0) for t in tokens]
+        if self.char_ngrams:
+            min_n, max_n = self.char_ngrams
+            for t in tokens:
+                parola = f' {t} '
+                for n in range(min_n, max_n + 1):
+                    caratteristiche.extend(
+                        (f'c:{parola[i:i + n]}', self.peso_ngrammi) for i in range(max(len(parola) - n + 1, 1))
+                    )
+        return caratteristiche
+
+    def _indice_segno(self, caratteristica):
+        valore = self._hash.get(caratteristica)
+        if valore is None:
+            h = zlib.crc32(caratteristica.encode())
+            valore = (h % self.dim, 1.0 if h & 0x80000000 else -1.0)
+            if len(self._hash) < 200000:
+                self._hash[caratteristica] = valore
+        return valore
+
+    def embed(self, testi, descrittori=False):
+        import numpy as np
+
+        analizza = self.analyzer.analizza_descrittore if descrittori else self.analyzer.analizza
+        vettori = np.zeros((len(testi), self.dim), dtype=np.float32)
+        for riga, testo in enumerate(testi):
+            caratteristiche = self._caratteristiche(analizza(testo or ''))
+            if not caratteristiche:
+                continue
+            indici, segni = zip(*(self._indice_segno(c) for c, _ in caratteristiche))
+            pesi = np.array([p for _, p in caratteristiche], dtype=np.float32) * np.array(segni, dtype=np.float32)
+            np.add.at(vettori[riga], np.array(indici), pesi)
+
+        norme = np.linalg.norm(vettori, axis=1, keepdims=True)
+        norme[norme == 0] = 1.0
+        return vettori / norme
+
+
+# Righe della matrice degli embedding relative a una disciplina (vista sul memmap)
+class IndiceEmbedding:
+    def __init__(self, disciplina, descrittori, matrice, embedder):
+        self.disciplina = disciplina
+        self.descrittori = descrittori
+        self.per_id = {d['id']: d for d in descrittori}
+        self.matrice = matrice
+        self.vectorizer = embedder
+
+    def punteggi(self, testi):
+        return self.vectorizer.embed(testi) @ self.matrice.T
+
+    def cerca_batch(self, testi, top_k=5):
+        if not self.descrittori or not testi:
+            return [[] for _ in testi]
+
+        punteggi = self.punteggi(testi)
+        risultati = []
+        for riga, indici in zip(punteggi, top_k_righe(punteggi, top_k)):
+            risultati.append([(self.descrittori[idx], float(riga[idx])) for idx in indici if riga[idx] > 0])
+        return risultati
+
+    def cerca(self, testo, top_k=5):
+        return self.cerca_batch([testo], top_k)[0]
+
+
+# Stessa interfaccia e stesso controllo delle modifiche di DescriptorIndex; i vettori
+# sono riletti dal file se descrittori e configurazione non sono cambiati dall'ultimo calcolo
+class EmbeddingIndex(DescriptorIndex):
+    def __init__(self, get_connection, path, embedder, check_interval=5.0):
+        super().__init__(get_connection, analyzer=embedder.analyzer, check_interval=check_interval)
+        self.path = path
+        self.embedder = embedder
+        self.matrice = None
+
+    def _impronta(self, descrittori):
+        h = hashlib.sha256(json.dumps(self.embedder.firma(), sort_keys=True).encode())
+        for d in descrittori:
+            h.update(f"{d['id']}\x1f{d['testo_descrittore'] or ''}\x1e".encode())
+        return h.hexdigest()
+
+    # Il file inizia con l'impronta (intestazione di LUNGHEZZA_IMPRONTA byte) seguita
+    # dai vettori: un solo file sostituito con un rename, così impronta e vettori
+    # letti appartengono sempre alla stessa versione anche con più processi che
+    # salvano insieme o con un'interruzione a metà salvataggio
+    def _carica(self, impronta, n):
+        import numpy as np
+
+        try:
+            with open(self.path, 'rb') as f:
+                intestazione = f.read(LUNGHEZZA_IMPRONTA)
+                dimensione = os.fstat(f.fileno()).st_size
+        except OSError:
+            return None
+
+        if intestazione != impronta.encode() or dimensione != LUNGHEZZA_IMPRONTA + n * self.embedder.dim * 4:
+            return None
+        if n == 0:
+            return np.zeros((0, self.embedder.dim), dtype=np.float32)
+        try:
+            return np.memmap(self.path, dtype=np.float32, mode='r', offset=LUNGHEZZA_IMPRONTA, shape=(n, self.embedder.dim))
+        except (OSError, ValueError):
+            return None
+
+    # Scrittura su un file temporaneo e rename, così i processi che leggono il file
+    # in parallelo vedono sempre una versione completa
+    def _salva(self, vettori, impronta):
+        import numpy as np
+
+        temporaneo = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(temporaneo, 'wb') as f:
+                f.write(impronta.encode())
+                f.write(np.ascontiguousarray(vettori, dtype=np.float32).tobytes())
+            os.replace(temporaneo, self.path)
+        except OSError:
+            if os.path.exists(temporaneo):
+                os.remove(temporaneo)
+            raise
+
+        if not len(vettori):
+            return vettori
+        return np.memmap(self.path, dtype=np.float32, mode='r', offset=LUNGHEZZA_IMPRONTA, shape=vettori.shape)
+
+    def _costruisci(self, conn):
+        descrittori = [dict(row) for row in conn.execute(DESCRITTORI_QUERY).fetchall()]
+        impronta = self._impronta(descrittori)
+
+        matrice = self._carica(impronta, len(descrittori))
+        if matrice is None:
+            vettori = self.embedder.embed([d['testo_descrittore'] for d in descrittori], descrittori=True)
+            try:
+                matrice = self._salva(vettori, impronta)
+            except OSError as e:
+                print(f"Impossibile salvare gli embedding dei descrittori in {self.path}: {e}")
+                matrice = vettori
+        self.matrice = matrice
+
+        # I descrittori sono ordinati per disciplina: ogni disciplina è un intervallo di righe
+        indici = {}
+        inizio = 0
+        for fine in range(1, len(descrittori) + 1):
+            if fine == len(descrittori) or descrittori[fine]['disciplina'] != descrittori[inizio]['disciplina']:
+                disciplina = descrittori[inizio]['disciplina']
+                indici[disciplina] = IndiceEmbedding(
+                    disciplina, descrittori[inizio:fine], matrice[inizio:fine], self.embedder
+                )
+                inizio = fine
+        return indici
@@ -0,0 +1,177 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+# Scrittore con "group commit": le scritture che arrivano insieme da richieste
+# diverse sono eseguite da un unico thread in una sola transazione, invece di
+# una transazione (e un'attesa del lock di scrittura di SQLite) per richiesta.
+# Ogni istruzione gira in un proprio SAVEPOINT, così un errore annulla solo
+# quella e il chiamante riceve comunque in modo sincrono il proprio lastrowid
+# o la propria eccezione
+
+
+# Timeout di una scrittura che il writer ha già iniziato: a differenza di una
+# scrittura annullata in coda, potrebbe essere salvata comunque
+class ScritturaInCorsoError(TimeoutError):
+    pass
+
+
+class ScrittoreRaggruppato:
+    def __init__(self, get_connection, finestra_ms=2, max_batch=200, timeout=10.0):
+        self.get_connection = get_connection
+        self.finestra = finestra_ms / 1000
+        self.max_batch = max_batch
+        self.timeout = timeout
+        self._coda = queue.Queue()
+        self._avvio = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self.scritture = 0
+        self.transazioni = 0
+        self.errori = 0
+
+    # Il thread parte alla prima scrittura (e riparte nei worker dopo un fork)
+    def _assicura_writer(self):
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._avvio:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._loop, name='group-commit', daemon=True)
+            self._thread.start()
+
+    # Accoda l'istruzione e attende l'esito: restituisce il lastrowid oppure
+    # solleva l'eccezione che l'istruzione ha prodotto. Allo scadere del timeout
+    # la scrittura ancora in coda viene annullata (il writer la salta), così un
+    # nuovo tentativo del chiamante non la duplica; se il writer l'ha già presa
+    # la si attende per un altro timeout, poi si solleva comunque
+    # ScritturaInCorsoError (la scrittura potrebbe essere ancora salvata)
+    def esegui(self, sql, parametri=()):
+        self._assicura_writer()
+        esito = Future()
+        self._coda.put((sql, parametri, esito))
+        try:
+            return esito.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            if esito.cancel():
+                raise
+        try:
+            return esito.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            raise ScritturaInCorsoError(
+                f"Scrittura presa dal writer ma non completata entro {2 * self.timeout:g}s"
+            ) from None
+
+    # Prende la prima scrittura in attesa e le altre che arrivano entro la finestra
+    def _preleva(self):
+        batch = [self._coda.get()]
+        scadenza = time.monotonic() + self.finestra
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self._coda.get_nowait())
+                continue
+            except queue.Empty:
+                pass
+            restante = scadenza - time.monotonic()
+            if restante <= 0:
+                break
+            try:
+                batch.append(self._coda.get(timeout=restante))
+            except queue.Empty:
+                break
+        return batch
+
+    # Esegue il batch e consegna a ogni chiamante il proprio esito; le scritture
+    # rimaste senza esito per un errore imprevisto ricevono comunque un'eccezione,
+    # così nessun chiamante resta in attesa
+    def _scrivi(self, batch):
+        # Le scritture annullate da esegui() per timeout non vanno eseguite
+        batch = [(sql, parametri, esito) for sql, parametri, esito in batch if esito.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        errore = None
+        try:
+            self._consegna(self._transazione(batch))
+        except Exception as e:
+            errore = e
+            raise
+        finally:
+            pendenti = [esito for _, _, esito in batch if not esito.done()]
+            for esito in pendenti:
+                esito.set_exception(errore or RuntimeError('Scrittura interrotta dal writer'))
+            if pendenti:
+                with self._lock:
+                    self.errori += len(pendenti)
+
+    # Una transazione per il batch, un SAVEPOINT per istruzione: restituisce
+    # (esito, lastrowid, errore) per ogni scrittura
+    def _transazione(self, batch):
+        risultati = []
+        conn = None
+        try:
+            conn = self.get_connection()
+            conn.execute("BEGIN IMMEDIATE")
+            for sql, parametri, esito in batch:
+                conn.execute("SAVEPOINT scrittura")
+                try:
+                    risultati.append((esito, conn.execute(sql, parametri).lastrowid, None))
+                    conn.execute("RELEASE scrittura")
+                except Exception as e:
+                    conn.execute("ROLLBACK TO scrittura")
+                    conn.execute("RELEASE scrittura")
+                    risultati.append((esito, None, e))
+            conn.commit()
+        except Exception as e:
+            # Transazione fallita (lock, disco, commit): nessuna scrittura è stata
+            # salvata. Se anche il rollback fallisce la chiusura della connessione
+            # annulla comunque la transazione
+            if conn is not None and conn.in_transaction:
+                try:
+                    conn.rollback()
+                except Exception:
+                    pass
+            risultati = [(esito, None, e) for _, _, esito in batch]
+        finally:
+            if conn is not None:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+        return risultati
+
+    def _consegna(self, risultati):
+        with self._lock:
+            self.transazioni += 1
+            for esito, lastrowid, errore in risultati:
+                if errore is None:
+                    self.scritture += 1
+                else:
+                    self.errori += 1
+
+        for esito, lastrowid, errore in risultati:
+            if errore is None:
+                esito.set_result(lastrowid)
+            else:
+                esito.set_exception(errore)
+
+    def _loop(self):
+        while True:
+            try:
+                self._scrivi(self._preleva())
+            except Exception as e:
+                print(f"Errore nel thread di group commit: {e}")
+                time.sleep(self.finestra)
+
+    def statistiche(self):
+        with self._lock:
+            return {
+                'in_coda': self._coda.qsize(),
+                'scritture': self.scritture,
+                'transazioni': self.transazioni,
+                'errori': self.errori,
+                'media_per_transazione': round(self.scritture / self.transazioni, 2) if self.transazioni else 0.0,
+            }
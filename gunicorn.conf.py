@@ -0,0 +1,36 @@
+import os
+
+# Configurazione di gunicorn (caricata dal Procfile con -c gunicorn.conf.py).
+# Le chiamate al modello passano quasi tutto il tempo in attesa di rete: con
+# worker a thread (gthread) o a greenlet (gevent, richiede `pip install gevent`)
+# ogni processo serve decine di utenti del chatbot contemporaneamente invece di
+# restare bloccato su una sola richiesta come i worker sync predefiniti
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+workers = int(os.getenv('WEB_CONCURRENCY', 2))
+
+# gthread: thread per worker; gevent: connessioni contemporanee per worker
+threads = int(os.getenv('GUNICORN_THREADS', 32))
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', 1000))
+
+# Le risposte in streaming del chatbot possono durare quanto la generazione
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 120))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 5))
+
+# Stringa vuota per disattivare il log degli accessi
+accesslog = os.getenv('GUNICORN_ACCESS_LOG', '-') or None
+
+# Avvio ottimizzato: con GUNICORN_PRELOAD=True l'applicazione è importata una sola
+# volta nel master e l'indice dei descrittori è costruito prima del fork, così i
+# nuovi worker (dopo un deploy, un riavvio o con max_requests) sono subito pronti
+preload_app = os.getenv('GUNICORN_PRELOAD', 'False').lower() == 'true'
+
+
+def when_ready(server):
+    if preload_app:
+        import app
+
+        app.prepara_fork()
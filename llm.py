@@ -0,0 +1,315 @@
+import json
+import random
+import re
+import sys
+import threading
+import time
+
+ULTIMA_DOMANDA_RE = re.compile(r"Domanda iniziale: (.*)", re.DOTALL)
+CANDIDATI_RE = re.compile(r"Descrittori candidati:(.*?)\n\s*\n", re.DOTALL)
+ID_DESCRITTORE_RE = re.compile(r"^ID: (\d+)", re.MULTILINE)
+
+
+# Backend OpenAI (client v1, creato al primo utilizzo e condiviso tra i thread)
+class OpenAIBackend:
+    def __init__(self, api_key=None, base_url=None, timeout=None):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.timeout = timeout
+        self._client = None
+        self._lock = threading.Lock()
+
+    def disponibile(self):
+        return bool(self.api_key)
+
+    def _get_client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    # Importato qui: il pacchetto openai (e httpx/pydantic) pesa
+                    # sull'avvio dei worker e serve solo alla prima chiamata reale
+                    import openai
+
+                    # I tentativi sono gestiti da ResilientBackend, non dal client
+                    self._client = openai.OpenAI(
+                        api_key=self.api_key, base_url=self.base_url, timeout=self.timeout, max_retries=0
+                    )
+        return self._client
+
+    def _client_per(self, timeout):
+        client = self._get_client()
+        return client.with_options(timeout=timeout) if timeout else client
+
+    def completa(self, messages, model, max_tokens, temperature, response_format=None, timeout=None):
+        kwargs = {}
+        if response_format:
+            kwargs['response_format'] = response_format
+
+        response = self._client_per(timeout).chat.completions.create(
+            model=model,
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            **kwargs
+        )
+        return response.choices[0].message.content
+
+    # Restituisce i frammenti di testo man mano che arrivano dal modello
+    def stream(self, messages, model, max_tokens, temperature, timeout=None, response_format=None):
+        kwargs = {}
+        if response_format:
+            kwargs['response_format'] = response_format
+
+        response = self._client_per(timeout).chat.completions.create(
+            model=model,
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            stream=True,
+            **kwargs
+        )
+        # Chiudere il generatore prima della fine interrompe anche la generazione lato server
+        try:
+            for chunk in response:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            response.close()
+
+
+# Backend locale deterministico con latenza simulata, per sviluppo, test e benchmark
+# senza rete: risponde con testi di prova o, se fornita, con la funzione risponditore
+class FakeBackend:
+    def __init__(self, latenza_ms=0, risponditore=None, latenza_token_ms=20, tasso_errori=0.0):
+        self.latenza = latenza_ms / 1000
+        self.latenza_token = latenza_token_ms / 1000
+        self.risponditore = risponditore or risposta_di_prova
+        self.tasso_errori = tasso_errori
+        self.chiamate = 0
+        self._lock = threading.Lock()
+
+    def disponibile(self):
+        return True
+
+    # Latenza iniziale rispettando la scadenza, ed errori simulati per provare i fallback
+    def _attendi(self, timeout):
+        with self._lock:
+            self.chiamate += 1
+        if timeout is not None and self.latenza > timeout:
+            time.sleep(timeout)
+            raise TimeoutError(f"Nessuna risposta entro {timeout:.1f}s")
+        if self.latenza:
+            time.sleep(self.latenza)
+        if self.tasso_errori and random.random() < self.tasso_errori:
+            raise ConnectionError("Errore simulato del backend LLM")
+
+    def completa(self, messages, model, max_tokens, temperature, response_format=None, timeout=None):
+        self._attendi(timeout)
+        return self.risponditore(messages, response_format)
+
+    # Streaming simulato: latenza iniziale, poi una parola alla volta
+    def stream(self, messages, model, max_tokens, temperature, timeout=None, response_format=None):
+        self._attendi(timeout)
+        for parola in re.findall(r"\S+\s*", self.risponditore(messages, response_format)):
+            if self.latenza_token:
+                time.sleep(self.latenza_token)
+            yield parola
+
+
+def risposta_di_prova(messages, response_format=None):
+    domanda = messages[-1]['content'] if messages else ''
+    corrispondenza = ULTIMA_DOMANDA_RE.search(domanda)
+    if corrispondenza:
+        # Richiesta di domande correlate
+        return '\n'.join(f"Domanda correlata di prova {i}" for i in range(1, 6))
+
+    candidati = CANDIDATI_RE.search(domanda)
+    if candidati:
+        # Riordino dei descrittori: i primi tre candidati nell'ordine ricevuto
+        ids = ID_DESCRITTORE_RE.findall(candidati.group(1))[:3]
+        classifica = [
+            {'id': id_, 'similarita': round(0.9 - 0.1 * i, 2), 'spiegazione': f"Spiegazione di prova per il descrittore {id_}"}
+            for i, id_ in enumerate(ids)
+        ]
+        if response_format and response_format.get('type') == 'json_object':
+            return json.dumps({'descrittori': classifica}, ensure_ascii=False)
+        return json.dumps(classifica, ensure_ascii=False)
+
+    risposta = f"Risposta di prova alla domanda: {domanda[:200]}"
+    if response_format and response_format.get('type') == 'json_object':
+        return json.dumps({
+            'risposta': risposta,
+            'domande_correlate': [f"Domanda correlata di prova {i}" for i in range(1, 6)]
+        }, ensure_ascii=False)
+    return risposta
+
+
+# Errori per cui ha senso ritentare (rete, timeout, limiti di frequenza, errori 5xx)
+ERRORI_TEMPORANEI = (TimeoutError, ConnectionError)
+ERRORI_TEMPORANEI_OPENAI = ('APITimeoutError', 'APIConnectionError', 'RateLimitError', 'InternalServerError')
+
+
+# Classi di errore del pacchetto openai, solo se è già stato importato: se nessun
+# client OpenAI è stato creato, nessuna di queste eccezioni può essere sollevata
+def errori_openai(*nomi):
+    modulo = sys.modules.get('openai')
+    return tuple(getattr(modulo, nome) for nome in nomi) if modulo is not None else ()
+
+
+def errore_temporaneo(e):
+    return isinstance(e, ERRORI_TEMPORANEI + errori_openai(*ERRORI_TEMPORANEI_OPENAI))
+
+
+class CircuitoAperto(Exception):
+    pass
+
+
+# Interruttore: dopo soglia fallimenti consecutivi il backend viene saltato per
+# cooldown secondi; poi una sola chiamata di prova decide se richiuderlo
+class CircuitBreaker:
+    CHIUSO = 'closed'
+    APERTO = 'open'
+    SEMIAPERTO = 'half_open'
+
+    def __init__(self, soglia=5, cooldown=30.0):
+        self.soglia = soglia
+        self.cooldown = cooldown
+        self.stato = self.CHIUSO
+        self.fallimenti = 0
+        self.aperture = 0
+        self._riapertura = 0.0
+        self._lock = threading.Lock()
+
+    def consente(self):
+        with self._lock:
+            if self.stato == self.CHIUSO:
+                return True
+            if self.stato == self.APERTO and time.monotonic() >= self._riapertura:
+                self.stato = self.SEMIAPERTO
+                return True
+            return False
+
+    # Come consente(), ma senza avviare la chiamata di prova
+    def aperto(self):
+        with self._lock:
+            return self.stato == self.SEMIAPERTO or (
+                self.stato == self.APERTO and time.monotonic() < self._riapertura
+            )
+
+    def successo(self):
+        with self._lock:
+            self.stato = self.CHIUSO
+            self.fallimenti = 0
+
+    def fallimento(self):
+        with self._lock:
+            self.fallimenti += 1
+            if self.stato == self.SEMIAPERTO or self.fallimenti >= self.soglia:
+                if self.stato != self.APERTO:
+                    self.aperture += 1
+                self.stato = self.APERTO
+                self._riapertura = time.monotonic() + self.cooldown
+
+
+# Involucro comune ai backend per chatbot e suggerimenti: scadenza complessiva per
+# chiamata, tentativi limitati con backoff esponenziale e jitter, circuit breaker
+# e contatori esportati da statistiche()
+class ResilientBackend:
+    def __init__(self, backend, scadenza=30.0, tentativi=2, backoff=0.5, backoff_max=4.0,
+                 soglia_circuito=5, cooldown_circuito=30.0):
+        self.backend = backend
+        self.scadenza = scadenza
+        self.tentativi = tentativi
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.circuito = CircuitBreaker(soglia_circuito, cooldown_circuito)
+        self._lock = threading.Lock()
+        self._contatori = {
+            'calls': 0, 'successes': 0, 'failures': 0, 'retries': 0, 'timeouts': 0, 'short_circuited': 0,
+        }
+        self._latenza_totale = 0.0
+
+    # Un circuito aperto rende il modello non disponibile: gli endpoint passano subito al fallback
+    def disponibile(self):
+        return self.backend.disponibile() and not self.circuito.aperto()
+
+    def _conta(self, nome, quanti=1):
+        with self._lock:
+            self._contatori[nome] += quanti
+
+    def _attesa_backoff(self, tentativo):
+        # Full jitter: attesa casuale tra 0 e il backoff esponenziale
+        return random.uniform(0, min(self.backoff_max, self.backoff * 2 ** tentativo))
+
+    def _esegui(self, chiamata, scadenza=None):
+        if not self.circuito.consente():
+            self._conta('short_circuited')
+            raise CircuitoAperto("Servizio AI temporaneamente sospeso dopo errori ripetuti")
+
+        self._conta('calls')
+        inizio = time.monotonic()
+        limite = inizio + (scadenza or self.scadenza)
+        tentativo = 0
+        while True:
+            residuo = limite - time.monotonic()
+            try:
+                risultato = chiamata(residuo)
+            except Exception as e:
+                if isinstance(e, (TimeoutError,) + errori_openai('APITimeoutError')):
+                    self._conta('timeouts')
+                attesa = self._attesa_backoff(tentativo)
+                if (not errore_temporaneo(e) or tentativo >= self.tentativi
+                        or time.monotonic() + attesa >= limite):
+                    self._conta('failures')
+                    self.circuito.fallimento()
+                    raise
+                tentativo += 1
+                self._conta('retries')
+                time.sleep(attesa)
+                continue
+
+            self.circuito.successo()
+            with self._lock:
+                self._contatori['successes'] += 1
+                self._latenza_totale += time.monotonic() - inizio
+            return risultato
+
+    def completa(self, messages, model, max_tokens, temperature, response_format=None, timeout=None):
+        return self._esegui(
+            lambda residuo: self.backend.completa(
+                messages, model, max_tokens, temperature, response_format=response_format, timeout=residuo
+            ),
+            timeout
+        )
+
+    # Si ritenta solo finché non è arrivato il primo frammento; la scadenza vale
+    # per l'attesa del primo frammento, non per la durata dell'intero stream
+    def stream(self, messages, model, max_tokens, temperature, timeout=None, response_format=None):
+        def apri(residuo):
+            frammenti = iter(self.backend.stream(
+                messages, model, max_tokens, temperature, timeout=residuo, response_format=response_format
+            ))
+            return frammenti, next(frammenti, None)
+
+        frammenti, primo = self._esegui(apri, timeout)
+        if primo is not None:
+            yield primo
+        yield from frammenti
+
+    def statistiche(self):
+        with self._lock:
+            statistiche = dict(self._contatori)
+            successi = statistiche['successes']
+            statistiche['avg_latency_ms'] = round(self._latenza_totale / successi * 1000, 1) if successi else 0.0
+        statistiche['circuit_state'] = self.circuito.stato
+        statistiche['circuit_opened'] = self.circuito.aperture
+        return statistiche
+
+
+def crea_backend(nome, api_key=None, base_url=None, timeout=None, fake_latenza_ms=0, fake_latenza_token_ms=20,
+                 fake_tasso_errori=0.0):
+    if nome == 'fake':
+        return FakeBackend(
+            latenza_ms=fake_latenza_ms, latenza_token_ms=fake_latenza_token_ms, tasso_errori=fake_tasso_errori
+        )
+    return OpenAIBackend(api_key=api_key, base_url=base_url or None, timeout=timeout)
@@ -0,0 +1,168 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Metriche in memoria del processo: istogrammi delle durate delle richieste e
+# degli span (query, indice dei descrittori, chiamate LLM, log delle attività),
+# esportate in formato testo Prometheus
+
+BUCKET_PREDEFINITI = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _etichette(etichette):
+    if not etichette:
+        return ''
+    valori = ','.join(
+        '{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for k, v in etichette
+    )
+    return '{' + valori + '}'
+
+
+class Istogramma:
+    def __init__(self, bucket=BUCKET_PREDEFINITI):
+        self.bucket = tuple(bucket)
+        self.conteggi = [0] * (len(self.bucket) + 1)
+        self.somma = 0.0
+        self.totale = 0
+
+    def osserva(self, valore):
+        self.conteggi[bisect.bisect_left(self.bucket, valore)] += 1
+        self.somma += valore
+        self.totale += 1
+
+
+class RegistroMetriche:
+    def __init__(self, prefisso='riza'):
+        self.prefisso = prefisso
+        self._istogrammi = {}
+        self._contatori = {}
+        self._descrizioni = {}
+        self._collettori = []
+        self._lock = threading.Lock()
+
+    def descrivi(self, nome, descrizione):
+        self._descrizioni[nome] = descrizione
+
+    def osserva(self, nome, valore, **etichette):
+        chiave = (nome, tuple(sorted(etichette.items())))
+        with self._lock:
+            istogramma = self._istogrammi.get(chiave)
+            if istogramma is None:
+                istogramma = self._istogrammi[chiave] = Istogramma()
+            istogramma.osserva(valore)
+
+    def incrementa(self, nome, quanti=1, **etichette):
+        chiave = (nome, tuple(sorted(etichette.items())))
+        with self._lock:
+            self._contatori[chiave] = self._contatori.get(chiave, 0) + quanti
+
+    # Funzione chiamata a ogni esportazione che restituisce metriche già aggregate
+    # altrove: lista di (nome, tipo, descrizione, [(etichette, valore), ...])
+    def aggiungi_collettore(self, funzione):
+        self._collettori.append(funzione)
+
+    def azzera(self):
+        with self._lock:
+            self._istogrammi.clear()
+            self._contatori.clear()
+
+    def esporta_prometheus(self):
+        righe = []
+        with self._lock:
+            istogrammi = sorted(self._istogrammi.items())
+            contatori = sorted(self._contatori.items())
+            istogrammi = [(k, (i.bucket, list(i.conteggi), i.somma, i.totale)) for k, i in istogrammi]
+
+        dichiarati = set()
+
+        def intestazione(nome, tipo):
+            if nome not in dichiarati:
+                dichiarati.add(nome)
+                righe.append(f"# HELP {nome} {self._descrizioni.get(nome, nome)}")
+                righe.append(f"# TYPE {nome} {tipo}")
+
+        for (nome, etichette), (bucket, conteggi, somma, totale) in istogrammi:
+            completo = f"{self.prefisso}_{nome}"
+            intestazione(completo, 'histogram')
+            cumulato = 0
+            for limite, conteggio in zip(bucket + (float('inf'),), conteggi):
+                cumulato += conteggio
+                le = '+Inf' if limite == float('inf') else repr(limite)
+                righe.append(f"{completo}_bucket{_etichette(etichette + (('le', le),))} {cumulato}")
+            righe.append(f"{completo}_sum{_etichette(etichette)} {somma}")
+            righe.append(f"{completo}_count{_etichette(etichette)} {totale}")
+
+        for (nome, etichette), valore in contatori:
+            completo = f"{self.prefisso}_{nome}"
+            intestazione(completo, 'counter')
+            righe.append(f"{completo}{_etichette(etichette)} {valore}")
+
+        for collettore in self._collettori:
+            try:
+                metriche = collettore()
+            except Exception as e:
+                print(f"Errore nella raccolta delle metriche: {e}")
+                continue
+            for nome, tipo, descrizione, campioni in metriche:
+                completo = f"{self.prefisso}_{nome}"
+                self._descrizioni.setdefault(completo, descrizione)
+                intestazione(completo, tipo)
+                for etichette, valore in campioni:
+                    righe.append(f"{completo}{_etichette(tuple(sorted(etichette.items())))} {float(valore)}")
+
+        return '\n'.join(righe) + '\n'
+
+
+registro = RegistroMetriche()
+registro.descrivi('riza_request_duration_seconds', 'Durata delle richieste HTTP')
+registro.descrivi('riza_span_duration_seconds', 'Durata delle fasi interne delle richieste')
+
+
+# Misura una fase interna (es. span('llm')): aggiorna l'istogramma per nome ed
+# endpoint e, dentro una richiesta, la somma per fase usata nell'header Server-Timing
+@contextmanager
+def span(nome):
+    inizio = time.perf_counter()
+    try:
+        yield
+    finally:
+        durata = time.perf_counter() - inizio
+        endpoint = ''
+        try:
+            from flask import g, has_request_context, request
+
+            if has_request_context():
+                endpoint = request.endpoint or ''
+                spans = g.setdefault('_spans', {})
+                spans[nome] = spans.get(nome, 0.0) + durata
+        except ImportError:
+            pass
+        registro.osserva('span_duration_seconds', durata, span=nome, endpoint=endpoint)
+
+
+# Hook prima/dopo ogni richiesta: durata per endpoint, metodo e stato, più
+# l'header Server-Timing con le fasi misurate (visibile negli strumenti del browser)
+def init_app(app, registro_metriche=registro):
+    from flask import g, request
+
+    @app.before_request
+    def avvia_timer():
+        g._inizio_richiesta = time.perf_counter()
+
+    @app.after_request
+    def registra_durata(response):
+        inizio = g.pop('_inizio_richiesta', None)
+        if inizio is None:
+            return response
+
+        durata = time.perf_counter() - inizio
+        registro_metriche.osserva(
+            'request_duration_seconds', durata,
+            endpoint=request.endpoint or 'sconosciuto', method=request.method, status=response.status_code
+        )
+        fasi = [f"{nome};dur={valore * 1000:.1f}" for nome, valore in g.get('_spans', {}).items()]
+        fasi.append(f"app;dur={durata * 1000:.1f}")
+        response.headers['Server-Timing'] = ', '.join(fasi)
+        return response
@@ -0,0 +1,329 @@
+import sqlite3
+
+from db import esegui_script
+from observation_codes import COLONNE, TABELLE_CODICI, TRIGGER_CODICI, normalizza_esistenti
+from rollups import TABELLE_RIEPILOGO, ricostruisci
+
+
+# Helper per le migrazioni che aggiungono colonne: ALTER TABLE non supporta IF NOT EXISTS
+def colonne(conn, tabella):
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({tabella})").fetchall()}
+
+
+def aggiungi_colonna(conn, tabella, colonna, definizione):
+    if colonna not in colonne(conn, tabella):
+        conn.execute(f"ALTER TABLE {tabella} ADD COLUMN {colonna} {definizione}")
+
+
+# --- Migrazioni database RIZA ---------------------------------------------
+
+RIZA_SCHEMA_BASE = """
+CREATE TABLE IF NOT EXISTS aree_disciplinari (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    disciplina TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS descrittori (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    area_disciplinare_id INTEGER NOT NULL,
+    dimensione_riza TEXT NOT NULL,
+    processo_specifico_verbo TEXT NOT NULL,
+    livello TEXT NOT NULL,
+    testo_descrittore TEXT NOT NULL,
+    FOREIGN KEY (area_disciplinare_id) REFERENCES aree_disciplinari (id)
+);
+CREATE TABLE IF NOT EXISTS osservazioni (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    allievo TEXT NOT NULL,
+    classe TEXT NOT NULL,
+    disciplina TEXT NOT NULL,
+    situazione TEXT,
+    osservazione TEXT NOT NULL,
+    dimensione TEXT,
+    processo TEXT,
+    livello TEXT,
+    id_descrittore INTEGER,
+    data_creazione TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (id_descrittore) REFERENCES descrittori (id)
+);
+"""
+
+RIZA_INDICI = """
+CREATE INDEX IF NOT EXISTS idx_osservazioni_data ON osservazioni (data_creazione DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_osservazioni_disciplina_data ON osservazioni (disciplina, data_creazione DESC);
+CREATE INDEX IF NOT EXISTS idx_osservazioni_dimensione_data ON osservazioni (dimensione, data_creazione DESC);
+CREATE INDEX IF NOT EXISTS idx_descrittori_area ON descrittori (area_disciplinare_id);
+CREATE INDEX IF NOT EXISTS idx_descrittori_dimensione ON descrittori (dimensione_riza);
+CREATE INDEX IF NOT EXISTS idx_aree_disciplina ON aree_disciplinari (disciplina);
+"""
+
+# Contatore di versione della tabella descrittori mantenuto dai trigger:
+# l'indice TF-IDF lo legge per sapere quando ricostruirsi
+RIZA_VERSIONE_DESCRITTORI = """
+CREATE TABLE IF NOT EXISTS meta_versioni (
+    nome TEXT PRIMARY KEY,
+    versione INTEGER NOT NULL DEFAULT 0
+);
+INSERT OR IGNORE INTO meta_versioni (nome, versione) VALUES ('descrittori', 1);
+CREATE TRIGGER IF NOT EXISTS trg_descrittori_versione_ins AFTER INSERT ON descrittori
+BEGIN
+    UPDATE meta_versioni SET versione = versione + 1 WHERE nome = 'descrittori';
+END;
+CREATE TRIGGER IF NOT EXISTS trg_descrittori_versione_upd AFTER UPDATE ON descrittori
+BEGIN
+    UPDATE meta_versioni SET versione = versione + 1 WHERE nome = 'descrittori';
+END;
+CREATE TRIGGER IF NOT EXISTS trg_descrittori_versione_del AFTER DELETE ON descrittori
+BEGIN
+    UPDATE meta_versioni SET versione = versione + 1 WHERE nome = 'descrittori';
+END;
+"""
+
+# Indice full-text delle osservazioni (contenuto esterno, sincronizzato dai trigger)
+RIZA_FTS_OSSERVAZIONI = """
+CREATE VIRTUAL TABLE IF NOT EXISTS osservazioni_fts USING fts5 (
+    allievo, classe, situazione, osservazione,
+    content='osservazioni', content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS trg_osservazioni_fts_ins AFTER INSERT ON osservazioni
+BEGIN
+    INSERT INTO osservazioni_fts (rowid, allievo, classe, situazione, osservazione)
+    VALUES (NEW.id, NEW.allievo, NEW.classe, NEW.situazione, NEW.osservazione);
+END;
+CREATE TRIGGER IF NOT EXISTS trg_osservazioni_fts_del AFTER DELETE ON osservazioni
+BEGIN
+    INSERT INTO osservazioni_fts (osservazioni_fts, rowid, allievo, classe, situazione, osservazione)
+    VALUES ('delete', OLD.id, OLD.allievo, OLD.classe, OLD.situazione, OLD.osservazione);
+END;
+CREATE TRIGGER IF NOT EXISTS trg_osservazioni_fts_upd AFTER UPDATE OF allievo, classe, situazione, osservazione ON osservazioni
+BEGIN
+    INSERT INTO osservazioni_fts (osservazioni_fts, rowid, allievo, classe, situazione, osservazione)
+    VALUES ('delete', OLD.id, OLD.allievo, OLD.classe, OLD.situazione, OLD.osservazione);
+    INSERT INTO osservazioni_fts (rowid, allievo, classe, situazione, osservazione)
+    VALUES (NEW.id, NEW.allievo, NEW.classe, NEW.situazione, NEW.osservazione);
+END;
+INSERT INTO osservazioni_fts (osservazioni_fts) VALUES ('rebuild');
+"""
+
+# Indici dei filtri estesi con id, la seconda colonna della chiave di paginazione
+RIZA_INDICI_KEYSET = """
+DROP INDEX IF EXISTS idx_osservazioni_disciplina_data;
+DROP INDEX IF EXISTS idx_osservazioni_dimensione_data;
+CREATE INDEX IF NOT EXISTS idx_osservazioni_disciplina_data ON osservazioni (disciplina, data_creazione DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_osservazioni_dimensione_data ON osservazioni (dimensione, data_creazione DESC, id DESC);
+"""
+
+# Versione delle osservazioni per le cache delle analisi: i nuovi inserimenti sono
+# già riconoscibili dall'id massimo, i trigger contano solo modifiche e cancellazioni
+# (nessun costo aggiuntivo sui salvataggi). Indice per le analisi per classe e allievo
+RIZA_VERSIONE_OSSERVAZIONI = """
+INSERT OR IGNORE INTO meta_versioni (nome, versione) VALUES ('osservazioni', 1);
+CREATE TRIGGER IF NOT EXISTS trg_osservazioni_versione_upd AFTER UPDATE ON osservazioni
+BEGIN
+    UPDATE meta_versioni SET versione = versione + 1 WHERE nome = 'osservazioni';
+END;
+CREATE TRIGGER IF NOT EXISTS trg_osservazioni_versione_del AFTER DELETE ON osservazioni
+BEGIN
+    UPDATE meta_versioni SET versione = versione + 1 WHERE nome = 'osservazioni';
+END;
+CREATE INDEX IF NOT EXISTS idx_osservazioni_classe_allievo ON osservazioni (classe, allievo);
+"""
+
+
+# Codici numerici di livello, dimensione e processo (observation_codes): tabelle
+# dei nomi, colonne intere calcolate per le righe esistenti, trigger per gli
+# inserimenti che non le valorizzano e indice coprente delle analisi per classe,
+# che rende superfluo quello su (classe, allievo)
+def riza_codici_osservazioni(conn):
+    esegui_script(conn, TABELLE_CODICI)
+    for colonna_codice, tabella in COLONNE.values():
+        aggiungi_colonna(conn, 'osservazioni', colonna_codice, f'INTEGER REFERENCES {tabella} (id)')
+    normalizza_esistenti(conn)
+    esegui_script(conn, TRIGGER_CODICI + """
+        DROP INDEX IF EXISTS idx_osservazioni_classe_allievo;
+        CREATE INDEX IF NOT EXISTS idx_osservazioni_analisi ON osservazioni (
+            classe, allievo, dimensione_id, livello_id, substr(data_creazione, 1, 7), data_creazione
+        );
+    """)
+
+
+# Chiave di paginazione con COALESCE(data_creazione, ''), così le righe con
+# data_creazione NULL restano confrontabili: indici ricreati sull'espressione
+RIZA_INDICI_DATA_NON_NULLA = """
+DROP INDEX IF EXISTS idx_osservazioni_data;
+DROP INDEX IF EXISTS idx_osservazioni_disciplina_data;
+DROP INDEX IF EXISTS idx_osservazioni_dimensione_data;
+CREATE INDEX IF NOT EXISTS idx_osservazioni_data ON osservazioni (COALESCE(data_creazione, '') DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_osservazioni_disciplina_data ON osservazioni (disciplina, COALESCE(data_creazione, '') DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_osservazioni_dimensione_data ON osservazioni (dimensione, COALESCE(data_creazione, '') DESC, id DESC);
+"""
+
+
+RIZA_MIGRAZIONI = [
+    (1, 'schema base', RIZA_SCHEMA_BASE),
+    (2, 'indici osservazioni e descrittori', RIZA_INDICI),
+    (3, 'versione tabella descrittori', RIZA_VERSIONE_DESCRITTORI),
+    (4, 'ricerca full-text osservazioni', RIZA_FTS_OSSERVAZIONI),
+    (5, 'indici per la paginazione keyset', RIZA_INDICI_KEYSET),
+    (6, 'versione osservazioni per le analisi', RIZA_VERSIONE_OSSERVAZIONI),
+    (7, 'codici numerici di livello, dimensione e processo', riza_codici_osservazioni),
+    (8, 'chiave di paginazione con data_creazione NULL', RIZA_INDICI_DATA_NON_NULLA),
+]
+
+
+# --- Migrazioni database Admin --------------------------------------------
+
+ADMIN_SCHEMA_BASE = """
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    email TEXT UNIQUE NOT NULL,
+    password TEXT NOT NULL,
+    role TEXT NOT NULL DEFAULT 'docente',
+    status TEXT NOT NULL DEFAULT 'attivo',
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    last_login TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS activities (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER,
+    user_name TEXT,
+    activity_type TEXT NOT NULL,
+    details TEXT,
+    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+
+# Colonna "day" memorizzata (valorizzata dal logger, dal trigger per gli altri
+# inserimenti e dal backfill per le righe esistenti) e indici per la dashboard
+def admin_giorno_attivita(conn):
+    aggiungi_colonna(conn, 'activities', 'day', 'TEXT')
+    esegui_script(conn, """
+        UPDATE activities SET day = strftime('%Y-%m-%d', timestamp) WHERE day IS NULL;
+        CREATE TRIGGER IF NOT EXISTS trg_activities_day AFTER INSERT ON activities
+        WHEN NEW.day IS NULL
+        BEGIN
+            UPDATE activities SET day = strftime('%Y-%m-%d', NEW.timestamp) WHERE id = NEW.id;
+        END;
+        CREATE INDEX IF NOT EXISTS idx_activities_day ON activities (day);
+        CREATE INDEX IF NOT EXISTS idx_activities_type ON activities (activity_type);
+        CREATE INDEX IF NOT EXISTS idx_activities_timestamp ON activities (timestamp DESC);
+        CREATE INDEX IF NOT EXISTS idx_activities_type_timestamp ON activities (activity_type, timestamp DESC);
+        CREATE INDEX IF NOT EXISTS idx_users_role ON users (role);
+    """)
+
+
+# Tabelle di riepilogo della dashboard, popolate subito dai dati esistenti
+def admin_riepiloghi(conn):
+    esegui_script(conn, TABELLE_RIEPILOGO)
+    ricostruisci(conn)
+
+
+ADMIN_MIGRAZIONI = [
+    (1, 'schema base', ADMIN_SCHEMA_BASE),
+    (2, 'colonna day e indici activities', admin_giorno_attivita),
+    (3, 'statistiche materializzate dashboard', admin_riepiloghi),
+]
+
+
+# Applica in ordine le migrazioni con versione superiore a PRAGMA user_version,
+# ciascuna nella propria transazione
+def applica_migrazioni(path, migrazioni):
+    conn = sqlite3.connect(path, timeout=30)
+    conn.isolation_level = None
+    applicate = []
+    try:
+        corrente = conn.execute("PRAGMA user_version").fetchone()[0]
+        for versione, descrizione, passo in migrazioni:
+            if versione <= corrente:
+                continue
+
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Un altro processo potrebbe averla appena applicata
+                if conn.execute("PRAGMA user_version").fetchone()[0] >= versione:
+                    conn.execute("ROLLBACK")
+                    continue
+
+                if callable(passo):
+                    passo(conn)
+                else:
+                    esegui_script(conn, passo)
+
+                conn.execute(f"PRAGMA user_version = {versione}")
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+            applicate.append((versione, descrizione))
+    finally:
+        conn.close()
+    return applicate
+
+
+# --- Verifica dei piani di esecuzione delle query più frequenti -----------
+
+QUERY_CRITICHE_RIZA = {
+    'osservazioni_recenti': (
+        "SELECT * FROM osservazioni o ORDER BY COALESCE(o.data_creazione, '') DESC, o.id DESC LIMIT 51", ()
+    ),
+    'osservazioni_pagina_successiva': (
+        "SELECT * FROM osservazioni o WHERE (COALESCE(o.data_creazione, ''), o.id) < (?, ?) "
+        "ORDER BY COALESCE(o.data_creazione, '') DESC, o.id DESC LIMIT 51", ('2030-01-01', 1)
+    ),
+    'osservazioni_per_disciplina': (
+        "SELECT * FROM osservazioni o WHERE o.disciplina = ? ORDER BY COALESCE(o.data_creazione, '') DESC, o.id DESC LIMIT 51", ('x',)
+    ),
+    'osservazioni_per_dimensione': (
+        "SELECT * FROM osservazioni o WHERE o.dimensione = ? ORDER BY COALESCE(o.data_creazione, '') DESC, o.id DESC LIMIT 51", ('x',)
+    ),
+    'ricerca_testo': (
+        "SELECT o.* FROM osservazioni_fts f JOIN osservazioni o ON o.id = f.rowid "
+        "WHERE osservazioni_fts MATCH ? ORDER BY f.rank", ('"calcol"*',)
+    ),
+    'analisi_classe': (
+        "SELECT classe, allievo, dimensione_id, livello_id, substr(data_creazione, 1, 7), COUNT(*), "
+        "MAX(data_creazione) FROM osservazioni WHERE classe = ? "
+        "GROUP BY classe, allievo, dimensione_id, livello_id, substr(data_creazione, 1, 7) "
+        "ORDER BY classe, allievo, dimensione_id, livello_id, substr(data_creazione, 1, 7)", ('3A',)
+    ),
+    'discipline': (
+        "SELECT DISTINCT disciplina FROM aree_disciplinari", ()
+    ),
+    'dimensioni': (
+        "SELECT DISTINCT dimensione_riza FROM descrittori", ()
+    ),
+}
+
+QUERY_CRITICHE_ADMIN = {
+    'utenti_per_ruolo': (
+        "SELECT COUNT(*) as count FROM users WHERE role = ?", ('docente',)
+    ),
+    'conversazioni_per_tool': (
+        "SELECT activity_type as tool, count FROM stat_attivita_tipo "
+        "WHERE activity_type IN ('chatbot_query', 'get_suggestions') AND count > 0", ()
+    ),
+    'attivita_recenti': (
+        "SELECT * FROM activities ORDER BY timestamp DESC LIMIT 20", ()
+    ),
+    'attivita_giornaliere': (
+        "SELECT day, count FROM stat_attivita_giorno ORDER BY day DESC LIMIT 7", ()
+    ),
+    'conversazioni': (
+        "SELECT * FROM activities WHERE activity_type = 'chatbot_query' ORDER BY timestamp DESC LIMIT 100", ()
+    ),
+}
+
+
+# Restituisce per ogni query il piano e l'esito: una query è accettata solo se
+# non fa scansioni complete senza indice e non ordina con un B-tree temporaneo
+def verifica_piani(conn, query):
+    risultati = {}
+    for nome, (sql, params) in query.items():
+        piano = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()]
+        scansioni_complete = [p for p in piano if p.startswith('SCAN') and 'INDEX' not in p]
+        ordinamenti = [p for p in piano if 'TEMP B-TREE' in p]
+        risultati[nome] = (not scansioni_complete and not ordinamenti, piano)
+    return risultati
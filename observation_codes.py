@@ -0,0 +1,137 @@
+import threading
+
+# Codici numerici delle osservazioni: livello, dimensione e processo sono salvati
+# anche come interi (livello_id, dimensione_id, processo_id) che rimandano alle
+# tabelle livelli, dimensioni e processi. Il testo resta per la visualizzazione,
+# ordinamenti, medie e indici delle analisi lavorano sugli interi
+
+# Scala dei livelli (id, nome, valore): il valore è lo stesso di livello_numerico
+# delle rubriche (data/create_database.py)
+LIVELLI = [(1, 'Iniziale', 3), (2, 'Base', 4), (3, 'Intermedio', 5), (4, 'Avanzato', 6)]
+
+# Dimensioni RIZA nell'ordine canonico, registrate per prime (id da 1 a 4)
+DIMENSIONI = ['Risorse', 'Interpretazione', 'Azione', 'Autoregolazione']
+
+# Colonna testuale -> (colonna del codice, tabella dei nomi). I livelli sono una
+# scala chiusa: un livello sconosciuto resta senza codice, mentre dimensioni e
+# processi nuovi vengono registrati
+COLONNE = {
+    'dimensione': ('dimensione_id', 'dimensioni'),
+    'processo': ('processo_id', 'processi'),
+    'livello': ('livello_id', 'livelli'),
+}
+REGISTRABILI = ('dimensione', 'processo')
+
+TABELLE_CODICI = """
+CREATE TABLE IF NOT EXISTS livelli (
+    id INTEGER PRIMARY KEY,
+    nome TEXT NOT NULL UNIQUE COLLATE NOCASE,
+    valore INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS dimensioni (
+    id INTEGER PRIMARY KEY,
+    nome TEXT NOT NULL UNIQUE COLLATE NOCASE
+);
+CREATE TABLE IF NOT EXISTS processi (
+    id INTEGER PRIMARY KEY,
+    nome TEXT NOT NULL UNIQUE COLLATE NOCASE
+);
+"""
+
+# Corpo comune dei trigger: registra i nomi nuovi e ricalcola i codici della riga
+_CALCOLA_CODICI = """
+    INSERT OR IGNORE INTO dimensioni (nome) SELECT trim(NEW.dimensione) WHERE trim(NEW.dimensione) <> '';
+    INSERT OR IGNORE INTO processi (nome) SELECT trim(NEW.processo) WHERE trim(NEW.processo) <> '';
+    UPDATE osservazioni SET
+        dimensione_id = (SELECT id FROM dimensioni WHERE nome = trim(NEW.dimensione)),
+        processo_id = (SELECT id FROM processi WHERE nome = trim(NEW.processo)),
+        livello_id = (SELECT id FROM livelli WHERE nome = trim(NEW.livello))
+    WHERE id = NEW.id;
+"""
+
+# Gli inserimenti dell'applicazione arrivano già con i codici (Normalizzatore);
+# il trigger di inserimento copre solo gli altri (script, strumenti esterni) e
+# quello di modifica tiene i codici allineati al testo
+TRIGGER_CODICI = f"""
+CREATE TRIGGER IF NOT EXISTS trg_osservazioni_codici_ins AFTER INSERT ON osservazioni
+WHEN (NEW.dimensione_id IS NULL AND trim(NEW.dimensione) <> '')
+  OR (NEW.processo_id IS NULL AND trim(NEW.processo) <> '')
+  OR (NEW.livello_id IS NULL AND EXISTS (SELECT 1 FROM livelli WHERE nome = trim(NEW.livello)))
+BEGIN
+{_CALCOLA_CODICI}
+END;
+CREATE TRIGGER IF NOT EXISTS trg_osservazioni_codici_upd AFTER UPDATE OF dimensione, processo, livello ON osservazioni
+BEGIN
+{_CALCOLA_CODICI}
+END;
+"""
+
+
+# Popola le tabelle dei nomi (dimensioni canoniche, poi quelle dei descrittori e
+# delle osservazioni) e calcola i codici delle osservazioni che non li hanno
+def normalizza_esistenti(conn):
+    conn.executemany("INSERT OR IGNORE INTO livelli (id, nome, valore) VALUES (?, ?, ?)", LIVELLI)
+    conn.executemany("INSERT OR IGNORE INTO dimensioni (nome) VALUES (?)", [(d,) for d in DIMENSIONI])
+    for tabella, colonna, origine in (
+        ('dimensioni', 'dimensione_riza', 'descrittori'),
+        ('dimensioni', 'dimensione', 'osservazioni'),
+        ('processi', 'processo_specifico_verbo', 'descrittori'),
+        ('processi', 'processo', 'osservazioni'),
+    ):
+        conn.execute(
+            f"INSERT OR IGNORE INTO {tabella} (nome) "
+            f"SELECT DISTINCT trim({colonna}) FROM {origine} WHERE trim({colonna}) <> ''"
+        )
+    return conn.execute("""
+        UPDATE osservazioni SET
+            dimensione_id = (SELECT id FROM dimensioni WHERE nome = trim(osservazioni.dimensione)),
+            processo_id = (SELECT id FROM processi WHERE nome = trim(osservazioni.processo)),
+            livello_id = (SELECT id FROM livelli WHERE nome = trim(osservazioni.livello))
+        WHERE dimensione_id IS NULL OR processo_id IS NULL OR livello_id IS NULL
+    """).rowcount
+
+
+def _nome(valore):
+    if valore is None:
+        return None
+    valore = str(valore).strip()
+    return valore or None
+
+
+# Fase di normalizzazione in scrittura: traduce i valori testuali di
+# un'osservazione nei codici, con una cache in memoria dei nomi già visti
+# (chiave: il testo esatto, il confronto senza maiuscole lo fa SQLite)
+class Normalizzatore:
+    def __init__(self, get_connection):
+        self.get_connection = get_connection
+        self._codici = {colonna: {} for colonna in COLONNE}
+        self._lock = threading.Lock()
+
+    # (dimensione_id, processo_id, livello_id) dei valori indicati. I nomi non
+    # ancora in cache sono cercati (e per dimensioni e processi registrati) con
+    # conn, che non deve avere una transazione aperta, o con una connessione propria
+    def codici(self, dimensione, processo, livello, conn=None):
+        valori = {'dimensione': _nome(dimensione), 'processo': _nome(processo), 'livello': _nome(livello)}
+        mancanti = [(c, v) for c, v in valori.items() if v is not None and v not in self._codici[c]]
+        if mancanti:
+            self._risolvi(mancanti, conn)
+        return tuple(self._codici[c].get(v) if v is not None else None for c, v in valori.items())
+
+    def _risolvi(self, mancanti, conn):
+        with self._lock:
+            propria = conn is None
+            if propria:
+                conn = self.get_connection()
+            try:
+                for colonna, nome in mancanti:
+                    _, tabella = COLONNE[colonna]
+                    if colonna in REGISTRABILI:
+                        conn.execute(f"INSERT OR IGNORE INTO {tabella} (nome) VALUES (?)", (nome,))
+                    riga = conn.execute(f"SELECT id FROM {tabella} WHERE nome = ?", (nome,)).fetchone()
+                    # I livelli fuori scala non vanno in cache: restano senza codice
+                    if riga is not None:
+                        self._codici[colonna][nome] = riga[0]
+                conn.commit()
+            finally:
+                if propria:
+                    conn.close()
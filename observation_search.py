@@ -0,0 +1,154 @@
+import base64
+import json
+import re
+
+from markupsafe import Markup, escape
+
+# Marcatori usati da snippet(): caratteri di controllo che non compaiono nei testi,
+# così il contenuto può essere escapato prima di inserire i tag <mark>
+INIZIO_EVIDENZA = '\x02'
+FINE_EVIDENZA = '\x03'
+
+TERMINE_RE = re.compile(r"\w+", re.UNICODE)
+
+COLONNE_OSSERVAZIONI = """
+    o.id, o.allievo, o.classe, o.disciplina, o.situazione, o.osservazione,
+    o.dimensione, o.processo, o.livello, o.data_creazione, o.id_descrittore
+"""
+
+# Prima colonna della chiave di paginazione, uguale all'espressione degli indici
+# idx_osservazioni_*data (migrazione 8)
+CHIAVE_DATA = "COALESCE(o.data_creazione, '')"
+
+
+# Converte il testo digitato in un'espressione MATCH sicura: ogni parola diventa
+# una stringa FTS5 con ricerca per prefisso, opzionalmente limitata a una colonna
+def costruisci_match(testo, colonna=None):
+    termini = TERMINE_RE.findall(testo or '')
+    prefisso = f"{colonna} : " if colonna else ''
+    return ' AND '.join(f'{prefisso}"{t}"*' for t in termini)
+
+
+def evidenzia(snippet):
+    if not snippet:
+        return ''
+    testo = str(escape(snippet))
+    return Markup(testo.replace(INIZIO_EVIDENZA, '<mark>').replace(FINE_EVIDENZA, '</mark>'))
+
+
+# Il cursore di paginazione è opaco per il client: JSON in base64 url-safe.
+# Per l'elenco cronologico contiene la chiave (data_creazione, id) dell'ultima riga,
+# per la ricerca ordinata per pertinenza l'offset raggiunto
+def codifica_cursore(dati):
+    return base64.urlsafe_b64encode(json.dumps(dati).encode()).decode()
+
+
+def decodifica_cursore(cursore):
+    if not cursore:
+        return None
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursore.encode()).decode())
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError('Cursore di paginazione non valido')
+
+
+# Costruisce la query di ricerca delle osservazioni. Allievo, classe e testo libero
+# passano dall'indice full-text (osservazioni_fts); con il testo libero i risultati
+# sono ordinati per pertinenza (bm25) e includono un estratto evidenziato.
+# Con limite la query restituisce una pagina a partire dal cursore
+def costruisci_ricerca(allievo='', classe='', disciplina='', dimensione='', q='', cursore=None, limite=None):
+    espressioni = [e for e in (
+        costruisci_match(q),
+        costruisci_match(allievo, 'allievo'),
+        costruisci_match(classe, 'classe'),
+    ) if e]
+    per_pertinenza = bool(q and espressioni)
+
+    # L'estratto ha senso solo per la ricerca nel testo libero
+    snippet = f"snippet(osservazioni_fts, -1, '{INIZIO_EVIDENZA}', '{FINE_EVIDENZA}', '…', 16)" if q else 'NULL'
+
+    params = []
+    if espressioni:
+        query = f"""
+            SELECT {COLONNE_OSSERVAZIONI},
+                   {snippet} AS snippet
+            FROM osservazioni_fts f
+            JOIN osservazioni o ON o.id = f.rowid
+            WHERE osservazioni_fts MATCH ?
+        """
+        params.append(' AND '.join(f'({e})' for e in espressioni))
+    else:
+        query = f"""
+            SELECT {COLONNE_OSSERVAZIONI}, NULL AS snippet
+            FROM osservazioni o
+            WHERE 1=1
+        """
+
+    if disciplina:
+        query += " AND o.disciplina = ?"
+        params.append(disciplina)
+
+    if dimensione:
+        query += " AND o.dimensione = ?"
+        params.append(dimensione)
+
+    # Paginazione keyset: riparte dalla chiave dell'ultima riga vista, senza OFFSET.
+    # Le righe senza data_creazione valgono '' (in fondo all'elenco): con NULL il
+    # confronto non sarebbe mai vero e la paginazione le salterebbe
+    if cursore and not per_pertinenza:
+        query += f" AND ({CHIAVE_DATA}, o.id) < (?, ?)"
+        params.extend([cursore['data_creazione'] or '', cursore['id']])
+
+    if per_pertinenza:
+        # rank (= bm25) viene ordinato direttamente dal modulo FTS5
+        query += " ORDER BY f.rank"
+    else:
+        query += f" ORDER BY {CHIAVE_DATA} DESC, o.id DESC"
+
+    if limite:
+        query += " LIMIT ?"
+        params.append(limite)
+        if per_pertinenza and cursore:
+            query += " OFFSET ?"
+            params.append(cursore.get('offset', 0))
+
+    return query, params
+
+
+def _riga(row):
+    obs = dict(row)
+    obs['snippet'] = evidenzia(obs['snippet'])
+    return obs
+
+
+# Restituisce una pagina di osservazioni e il cursore per la successiva (None alla fine)
+def pagina_osservazioni(conn, filtri, cursore=None, limite=50):
+    query, params = costruisci_ricerca(**filtri, cursore=cursore, limite=limite + 1)
+    righe = conn.execute(query, params).fetchall()
+
+    osservazioni = [_riga(row) for row in righe[:limite]]
+    prossimo = None
+    if len(righe) > limite:
+        if filtri.get('q') and costruisci_match(filtri['q']):
+            prossimo = {'offset': (cursore or {}).get('offset', 0) + limite}
+        else:
+            ultima = osservazioni[-1]
+            prossimo = {'data_creazione': ultima['data_creazione'] or '', 'id': ultima['id']}
+
+    return osservazioni, prossimo
+
+
+# Generatore su tutte le osservazioni che legge a blocchi con il cursore keyset:
+# la memoria resta costante qualunque sia la dimensione della tabella
+def tutte_le_osservazioni(get_connection, filtri, blocco=500):
+    cursore = None
+    while True:
+        conn = get_connection()
+        try:
+            osservazioni, cursore = pagina_osservazioni(conn, filtri, cursore, blocco)
+        finally:
+            conn.close()
+
+        yield from osservazioni
+        if cursore is None:
+            return
@@ -0,0 +1,103 @@
+import datetime
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+# Profiler a campionamento opzionale: un thread legge a intervalli regolari lo
+# stack dei thread che stanno servendo una richiesta; se la richiesta supera la
+# soglia, gli stack vengono salvati in formato "folded" (una riga per stack,
+# frame separati da ';' e numero di campioni), pronto per flamegraph.pl o speedscope
+
+NOME_FILE_RE = re.compile(r'[^A-Za-z0-9_.-]+')
+
+
+def _stack_compresso(frame):
+    frames = []
+    while frame is not None:
+        codice = frame.f_code
+        frames.append(f"{os.path.basename(codice.co_filename)}:{codice.co_name}:{frame.f_lineno}")
+        frame = frame.f_back
+    return ';'.join(reversed(frames))
+
+
+class SamplingProfiler:
+    def __init__(self, cartella, soglia_ms=1000, intervallo_ms=5, max_file=500):
+        self.cartella = cartella
+        self.soglia = soglia_ms / 1000
+        self.intervallo = intervallo_ms / 1000
+        self.max_file = max_file
+        self._attivi = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self.salvati = 0
+
+    def _avvia_thread(self):
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._loop, name='sampling-profiler', daemon=True)
+            self._thread.start()
+
+    # Gli stack sono letti fuori dal lock, i contatori aggiornati sotto il lock:
+    # termina() toglie il contatore del thread sotto lo stesso lock, così dopo
+    # non riceve più campioni mentre viene salvato
+    def _loop(self):
+        while True:
+            time.sleep(self.intervallo)
+            with self._lock:
+                thread_attivi = list(self._attivi)
+            if not thread_attivi:
+                continue
+            frames = sys._current_frames()
+            stack = {ident: _stack_compresso(frames[ident]) for ident in thread_attivi if ident in frames}
+            del frames
+            with self._lock:
+                for ident, compresso in stack.items():
+                    campioni = self._attivi.get(ident)
+                    if campioni is not None:
+                        campioni[compresso] += 1
+
+    def inizia(self):
+        self._avvia_thread()
+        with self._lock:
+            self._attivi[threading.get_ident()] = Counter()
+
+    # Chiude la misura del thread corrente e salva gli stack se la richiesta è lenta
+    def termina(self, durata, nome):
+        with self._lock:
+            campioni = self._attivi.pop(threading.get_ident(), None)
+        if not campioni or durata < self.soglia or self.salvati >= self.max_file:
+            return None
+
+        os.makedirs(self.cartella, exist_ok=True)
+        adesso = datetime.datetime.now()
+        percorso = os.path.join(
+            self.cartella,
+            f"{adesso:%Y%m%d-%H%M%S}-{adesso.microsecond:06d}-{NOME_FILE_RE.sub('_', nome)}-{int(durata * 1000)}ms.folded"
+        )
+        with open(percorso, 'w') as f:
+            for stack, conteggio in campioni.most_common():
+                f.write(f"{stack} {conteggio}\n")
+        self.salvati += 1
+        return percorso
+
+    def init_app(self, app):
+        from flask import g, request
+
+        @app.before_request
+        def avvia_campionamento():
+            g._profilo_inizio = time.perf_counter()
+            self.inizia()
+
+        @app.teardown_request
+        def chiudi_campionamento(exception=None):
+            inizio = g.pop('_profilo_inizio', None)
+            if inizio is not None:
+                self.termina(time.perf_counter() - inizio, request.endpoint or 'sconosciuto')
@@ -0,0 +1,138 @@
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from db import ConnectionPool
+
+SPAZI_RE = re.compile(r"\s+")
+
+
+# Normalizza una domanda per il confronto: minuscole, spazi compattati,
+# punteggiatura finale ignorata ("Cos'è RIZA?" == "cos'è riza")
+def normalizza_testo(testo):
+    testo = SPAZI_RE.sub(' ', (testo or '').casefold()).strip()
+    return testo.rstrip('?!. ')
+
+
+# Chiave stabile a partire da più componenti (testo, modello, parametri, prompt)
+def chiave_cache(*parti):
+    return hashlib.sha256(json.dumps(parti, ensure_ascii=False, sort_keys=True).encode()).hexdigest()
+
+
+# Cache in memoria con scadenza (TTL) ed espulsione LRU a dimensione limitata,
+# con un livello opzionale su SQLite per sopravvivere ai riavvii dei worker
+class ResponseCache:
+    def __init__(self, max_entries=1000, ttl=86400, persist_path=None, nome='cache'):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.nome = nome
+        self._voci = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._pool = None
+
+        if persist_path:
+            self._pool = ConnectionPool(persist_path, max_size=2)
+            with self._pool.connessione() as conn:
+                conn.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS response_cache (
+                        cache TEXT NOT NULL,
+                        chiave TEXT NOT NULL,
+                        valore TEXT NOT NULL,
+                        scadenza REAL NOT NULL,
+                        PRIMARY KEY (cache, chiave)
+                    )
+                    """
+                )
+                conn.execute("DELETE FROM response_cache WHERE scadenza < ?", (time.time(),))
+                conn.commit()
+
+    def _salva_memoria(self, chiave, valore, scadenza):
+        with self._lock:
+            self._voci[chiave] = (valore, scadenza)
+            self._voci.move_to_end(chiave)
+            while len(self._voci) > self.max_entries:
+                self._voci.popitem(last=False)
+                self.evictions += 1
+
+    def _leggi_disco(self, chiave):
+        try:
+            with self._pool.connessione() as conn:
+                row = conn.execute(
+                    "SELECT valore, scadenza FROM response_cache WHERE cache = ? AND chiave = ?",
+                    (self.nome, chiave)
+                ).fetchone()
+        except Exception as e:
+            print(f"Errore lettura cache persistente: {e}")
+            return None
+
+        if row is None or row['scadenza'] < time.time():
+            return None
+        return json.loads(row['valore']), row['scadenza']
+
+    def get(self, chiave):
+        adesso = time.time()
+        with self._lock:
+            voce = self._voci.get(chiave)
+            if voce is not None:
+                valore, scadenza = voce
+                if scadenza >= adesso:
+                    self._voci.move_to_end(chiave)
+                    self.hits += 1
+                    return valore
+                del self._voci[chiave]
+
+        if self._pool is not None:
+            voce = self._leggi_disco(chiave)
+            if voce is not None:
+                self._salva_memoria(chiave, *voce)
+                with self._lock:
+                    self.hits += 1
+                return voce[0]
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, chiave, valore, ttl=None):
+        scadenza = time.time() + (ttl if ttl is not None else self.ttl)
+        self._salva_memoria(chiave, valore, scadenza)
+
+        if self._pool is not None:
+            try:
+                with self._pool.connessione() as conn:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO response_cache (cache, chiave, valore, scadenza) VALUES (?, ?, ?, ?)",
+                        (self.nome, chiave, json.dumps(valore), scadenza)
+                    )
+                    conn.commit()
+            except Exception as e:
+                print(f"Errore scrittura cache persistente: {e}")
+
+    def clear(self):
+        with self._lock:
+            self._voci.clear()
+        if self._pool is not None:
+            with self._pool.connessione() as conn:
+                conn.execute("DELETE FROM response_cache WHERE cache = ?", (self.nome,))
+                conn.commit()
+
+    # Chiude le connessioni del livello su disco (riaperte al primo utilizzo)
+    def chiudi_connessioni(self):
+        if self._pool is not None:
+            self._pool.chiudi_tutte()
+
+    def statistiche(self):
+        with self._lock:
+            return {
+                'entries': len(self._voci),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
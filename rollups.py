@@ -0,0 +1,159 @@
+from db import esegui_script
+
+# Statistiche della dashboard amministrativa mantenute in tabelle di riepilogo:
+# i trigger (migrazione 3 di admin.db) le aggiornano a ogni attività registrata
+# e a ogni modifica degli utenti, la dashboard legge solo queste tabelle
+
+TABELLE_RIEPILOGO = """
+CREATE TABLE IF NOT EXISTS stat_attivita_giornaliere (
+    day TEXT NOT NULL,
+    activity_type TEXT NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, activity_type)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS stat_attivita_giorno (
+    day TEXT PRIMARY KEY,
+    count INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS stat_attivita_tipo (
+    activity_type TEXT PRIMARY KEY,
+    count INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS stat_utenti_ruolo (
+    role TEXT PRIMARY KEY,
+    count INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+
+CREATE TRIGGER IF NOT EXISTS trg_stat_activities_ins AFTER INSERT ON activities
+BEGIN
+    INSERT INTO stat_attivita_giornaliere (day, activity_type, count)
+    VALUES (COALESCE(NEW.day, strftime('%Y-%m-%d', NEW.timestamp)), NEW.activity_type, 1)
+    ON CONFLICT (day, activity_type) DO UPDATE SET count = count + 1;
+    INSERT INTO stat_attivita_giorno (day, count)
+    VALUES (COALESCE(NEW.day, strftime('%Y-%m-%d', NEW.timestamp)), 1)
+    ON CONFLICT (day) DO UPDATE SET count = count + 1;
+    INSERT INTO stat_attivita_tipo (activity_type, count) VALUES (NEW.activity_type, 1)
+    ON CONFLICT (activity_type) DO UPDATE SET count = count + 1;
+END;
+CREATE TRIGGER IF NOT EXISTS trg_stat_activities_del AFTER DELETE ON activities
+BEGIN
+    UPDATE stat_attivita_giornaliere SET count = count - 1
+    WHERE day = COALESCE(OLD.day, strftime('%Y-%m-%d', OLD.timestamp)) AND activity_type = OLD.activity_type;
+    UPDATE stat_attivita_giorno SET count = count - 1
+    WHERE day = COALESCE(OLD.day, strftime('%Y-%m-%d', OLD.timestamp));
+    UPDATE stat_attivita_tipo SET count = count - 1 WHERE activity_type = OLD.activity_type;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_stat_users_ins AFTER INSERT ON users
+BEGIN
+    INSERT INTO stat_utenti_ruolo (role, count) VALUES (NEW.role, 1)
+    ON CONFLICT (role) DO UPDATE SET count = count + 1;
+END;
+CREATE TRIGGER IF NOT EXISTS trg_stat_users_del AFTER DELETE ON users
+BEGIN
+    UPDATE stat_utenti_ruolo SET count = count - 1 WHERE role = OLD.role;
+END;
+CREATE TRIGGER IF NOT EXISTS trg_stat_users_role AFTER UPDATE OF role ON users
+WHEN OLD.role IS NOT NEW.role
+BEGIN
+    UPDATE stat_utenti_ruolo SET count = count - 1 WHERE role = OLD.role;
+    INSERT INTO stat_utenti_ruolo (role, count) VALUES (NEW.role, 1)
+    ON CONFLICT (role) DO UPDATE SET count = count + 1;
+END;
+"""
+
+# Ricalcolo completo a partire dalle tabelle sorgente
+RICOSTRUZIONE = """
+DELETE FROM stat_attivita_giornaliere;
+DELETE FROM stat_attivita_giorno;
+DELETE FROM stat_attivita_tipo;
+DELETE FROM stat_utenti_ruolo;
+INSERT INTO stat_attivita_giornaliere (day, activity_type, count)
+    SELECT COALESCE(day, strftime('%Y-%m-%d', timestamp)) AS d, activity_type, COUNT(*)
+    FROM activities GROUP BY d, activity_type;
+INSERT INTO stat_attivita_giorno (day, count)
+    SELECT day, SUM(count) FROM stat_attivita_giornaliere GROUP BY day;
+INSERT INTO stat_attivita_tipo (activity_type, count)
+    SELECT activity_type, COUNT(*) FROM activities GROUP BY activity_type;
+INSERT INTO stat_utenti_ruolo (role, count)
+    SELECT role, COUNT(*) FROM users GROUP BY role;
+"""
+
+# Confronto tra riepiloghi e conteggi calcolati da zero
+VERIFICHE = {
+    'stat_attivita_giornaliere': (
+        "SELECT day, activity_type, count FROM stat_attivita_giornaliere WHERE count <> 0",
+        "SELECT COALESCE(day, strftime('%Y-%m-%d', timestamp)) AS d, activity_type, COUNT(*) "
+        "FROM activities GROUP BY d, activity_type",
+    ),
+    'stat_attivita_giorno': (
+        "SELECT day, count FROM stat_attivita_giorno WHERE count <> 0",
+        "SELECT COALESCE(day, strftime('%Y-%m-%d', timestamp)) AS d, COUNT(*) FROM activities GROUP BY d",
+    ),
+    'stat_attivita_tipo': (
+        "SELECT activity_type, count FROM stat_attivita_tipo WHERE count <> 0",
+        "SELECT activity_type, COUNT(*) FROM activities GROUP BY activity_type",
+    ),
+    'stat_utenti_ruolo': (
+        "SELECT role, count FROM stat_utenti_ruolo WHERE count <> 0",
+        "SELECT role, COUNT(*) FROM users GROUP BY role",
+    ),
+}
+
+TOOL_CONVERSAZIONI = ('chatbot_query', 'get_suggestions')
+
+
+def ricostruisci(conn):
+    esegui_script(conn, RICOSTRUZIONE)
+
+
+# Restituisce per ogni tabella di riepilogo le righe che differiscono dal ricalcolo
+def verifica(conn):
+    differenze = {}
+    for tabella, (riepilogo, sorgente) in VERIFICHE.items():
+        attese = {tuple(row[:-1]): row[-1] for row in conn.execute(sorgente).fetchall()}
+        presenti = {tuple(row[:-1]): row[-1] for row in conn.execute(riepilogo).fetchall()}
+        diverse = {
+            chiave: (presenti.get(chiave, 0), attese.get(chiave, 0))
+            for chiave in set(attese) | set(presenti)
+            if presenti.get(chiave, 0) != attese.get(chiave, 0)
+        }
+        if diverse:
+            differenze[tabella] = diverse
+    return differenze
+
+
+# Statistiche della dashboard lette solo dalle tabelle di riepilogo
+def statistiche_dashboard(conn):
+    ruoli = {row['role']: row['count'] for row in conn.execute("SELECT role, count FROM stat_utenti_ruolo").fetchall()}
+
+    user_stats = {
+        'total_users': sum(ruoli.values()),
+        'docenti': ruoli.get('docente', 0),
+        'coordinatori': ruoli.get('coordinatore', 0),
+        'admin': ruoli.get('admin', 0)
+    }
+
+    conversation_stats = conn.execute(
+        f"""
+        SELECT activity_type as tool, count
+        FROM stat_attivita_tipo
+        WHERE activity_type IN ({', '.join('?' for _ in TOOL_CONVERSAZIONI)}) AND count > 0
+        """,
+        TOOL_CONVERSAZIONI
+    ).fetchall()
+
+    activity_stats = conn.execute(
+        "SELECT activity_type, count FROM stat_attivita_tipo WHERE count > 0"
+    ).fetchall()
+
+    daily_activities = conn.execute(
+        """
+        SELECT day, count
+        FROM stat_attivita_giorno
+        ORDER BY day DESC
+        LIMIT 7
+        """
+    ).fetchall()
+
+    return user_stats, conversation_stats, activity_stats, daily_activities
@@ -0,0 +1,94 @@
+"""Controllo del tempo di importazione dell'applicazione.
+
+Importa app.py in un processo pulito con `python -X importtime`, misura il tempo
+cumulativo e verifica che resti entro il budget e che le dipendenze pesanti
+(scikit-learn, SciPy, NumPy, openai) non vengano caricate all'avvio dei worker.
+Esce con codice 1 se il controllo fallisce, così può girare in CI:
+
+    python scripts/check_import_time.py
+    python scripts/check_import_time.py --budget-ms 500 --runs 5 --top 20
+
+Il budget predefinito è 800 ms, o il valore di IMPORT_TIME_BUDGET_MS.
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+RADICE = Path(__file__).resolve().parent.parent
+
+# Moduli che devono essere importati solo al primo utilizzo
+PESANTI = ['sklearn', 'scipy', 'numpy', 'openai']
+
+# Budget predefinito (mediana, ms), condiviso con tests/test_lazy_imports.py;
+# su macchine lente si alza con IMPORT_TIME_BUDGET_MS
+BUDGET_MS = float(os.getenv('IMPORT_TIME_BUDGET_MS', 800))
+
+RIGA_RE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+
+# Tempi cumulativi (microsecondi) del modulo e di tutti i moduli importati da lui:
+# -X importtime stampa i figli prima del padre, con un rientro maggiore
+def misura(modulo):
+    env = dict(os.environ, AUTO_MIGRATE='False', PROFILER_ENABLED='False')
+    processo = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {modulo}'],
+        cwd=RADICE, env=env, capture_output=True, text=True
+    )
+    if processo.returncode != 0:
+        sys.exit(f"Importazione di {modulo} fallita:\n{processo.stderr[-2000:]}")
+
+    righe = []
+    for riga in processo.stderr.splitlines():
+        corrispondenza = RIGA_RE.match(riga)
+        if corrispondenza:
+            _, cumulativo, rientro, nome = corrispondenza.groups()
+            righe.append((nome, int(cumulativo), len(rientro)))
+
+    fine = max(i for i, (nome, _, _) in enumerate(righe) if nome == modulo)
+    livello = righe[fine][2]
+    inizio = fine
+    while inizio > 0 and righe[inizio - 1][2] > livello:
+        inizio -= 1
+    return {nome: cumulativo for nome, cumulativo, _ in righe[inizio:fine + 1]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--module', default='app')
+    parser.add_argument('--budget-ms', type=float, default=BUDGET_MS, help='tempo massimo (mediana) di importazione')
+    parser.add_argument('--runs', type=int, default=3, help='importazioni da misurare')
+    parser.add_argument('--top', type=int, default=10, help='moduli più lenti da mostrare')
+    args = parser.parse_args()
+
+    esecuzioni = [misura(args.module) for _ in range(args.runs)]
+    totali = [tempi[args.module] / 1000 for tempi in esecuzioni]
+    mediana = statistics.median(totali)
+
+    ultimi = esecuzioni[-1]
+    print(f"Moduli più lenti (ms, cumulativo) importando {args.module}:")
+    figli = sorted((v for v in ultimi.items() if v[0] != args.module), key=lambda v: -v[1])
+    for nome, cumulativo in figli[:args.top]:
+        print(f"  {cumulativo / 1000:8.1f}  {nome}")
+
+    errori = []
+    caricati = sorted({nome.split('.')[0] for nome in ultimi} & set(PESANTI))
+    if caricati:
+        errori.append(f"dipendenze pesanti importate all'avvio: {', '.join(caricati)}")
+    if mediana > args.budget_ms:
+        errori.append(f"tempo di importazione {mediana:.0f} ms oltre il budget di {args.budget_ms:.0f} ms")
+
+    print(f"\nImportazione di {args.module}: mediana {mediana:.0f} ms su {args.runs} esecuzioni "
+          f"(min {min(totali):.0f}, max {max(totali):.0f}), budget {args.budget_ms:.0f} ms")
+    if errori:
+        for errore in errori:
+            print(f"ERRORE: {errore}")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+"""Test di carico del chatbot con utenti simulati contemporanei.
+
+Ogni utente effettua il login e invia domande a /chatbot_query (o allo stream
+SSE con --stream) per la durata indicata. Esempio con il server LLM di prova:
+
+    python scripts/mock_llm_server.py --latency-ms 1000 &
+    LLM_BACKEND=openai OPENAI_API_KEY=test OPENAI_BASE_URL=http://127.0.0.1:8001/v1 \\
+        gunicorn -c gunicorn.conf.py app:app &
+    python scripts/load_test.py --url http://127.0.0.1:8000 --users 50 --duration 30
+"""
+import argparse
+import http.cookiejar
+import json
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import Counter
+
+
+def percentile(valori, p):
+    if not valori:
+        return 0.0
+    ordinati = sorted(valori)
+    return ordinati[min(len(ordinati) - 1, int(round(p / 100 * (len(ordinati) - 1))))]
+
+
+def crea_sessione(url, email, password):
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+    dati = urllib.parse.urlencode({'email': email, 'password': password}).encode()
+    opener.open(f"{url}/login", dati, timeout=30).read()
+    return opener
+
+
+def utente(indice, args, fine, risultati, lock):
+    try:
+        opener = crea_sessione(args.url, args.email, args.password)
+    except Exception as e:
+        with lock:
+            risultati['stati'][f"login: {e}"] += 1
+        return
+
+    endpoint = '/chatbot_query_stream' if args.stream else '/chatbot_query'
+    n = 0
+    while time.monotonic() < fine:
+        n += 1
+        corpo = json.dumps({'query': f"Domanda {n} dell'utente {indice}: come valutare la collaborazione?"}).encode()
+        richiesta = urllib.request.Request(
+            f"{args.url}{endpoint}", corpo, {'Content-Type': 'application/json'}
+        )
+        inizio = time.monotonic()
+        primo_byte = None
+        try:
+            with opener.open(richiesta, timeout=args.timeout) as risposta:
+                primo_byte = time.monotonic() - inizio if risposta.read(1) else None
+                risposta.read()
+                stato = risposta.status
+        except urllib.error.HTTPError as e:
+            stato = e.code
+        except Exception as e:
+            stato = type(e).__name__
+        durata = time.monotonic() - inizio
+
+        with lock:
+            risultati['stati'][stato] += 1
+            if stato == 200:
+                risultati['latenze'].append(durata)
+                if primo_byte is not None:
+                    risultati['primo_byte'].append(primo_byte)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', default='http://127.0.0.1:8000')
+    parser.add_argument('--users', type=int, default=50, help='utenti simultanei')
+    parser.add_argument('--duration', type=float, default=30, help='durata in secondi')
+    parser.add_argument('--timeout', type=float, default=120)
+    parser.add_argument('--email', default='admin@edutools.it')
+    parser.add_argument('--password', default='admin123')
+    parser.add_argument('--stream', action='store_true', help='usa /chatbot_query_stream')
+    parser.add_argument('--json', action='store_true', help='stampa il riepilogo in JSON')
+    args = parser.parse_args()
+
+    risultati = {'stati': Counter(), 'latenze': [], 'primo_byte': []}
+    lock = threading.Lock()
+    inizio = time.monotonic()
+    fine = inizio + args.duration
+
+    threads = [
+        threading.Thread(target=utente, args=(i, args, fine, risultati, lock), daemon=True)
+        for i in range(args.users)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    trascorso = time.monotonic() - inizio
+
+    latenze = risultati['latenze']
+    riepilogo = {
+        'users': args.users,
+        'duration_s': round(trascorso, 2),
+        'requests': sum(risultati['stati'].values()),
+        'ok': len(latenze),
+        'throughput_rps': round(len(latenze) / trascorso, 2),
+        'status': {str(k): v for k, v in risultati['stati'].items()},
+        'latency_s': {
+            'mean': round(statistics.mean(latenze), 3) if latenze else 0.0,
+            'p50': round(percentile(latenze, 50), 3),
+            'p95': round(percentile(latenze, 95), 3),
+            'p99': round(percentile(latenze, 99), 3),
+        },
+        'first_byte_p50_s': round(percentile(risultati['primo_byte'], 50), 3),
+    }
+
+    if args.json:
+        print(json.dumps(riepilogo, indent=2))
+        return
+
+    print(f"Utenti simultanei: {riepilogo['users']}  durata: {riepilogo['duration_s']}s")
+    print(f"Richieste: {riepilogo['requests']}  riuscite: {riepilogo['ok']}  ({riepilogo['throughput_rps']} req/s)")
+    print(f"Stati: {riepilogo['status']}")
+    lat = riepilogo['latency_s']
+    print(f"Latenza: media {lat['mean']}s  p50 {lat['p50']}s  p95 {lat['p95']}s  p99 {lat['p99']}s")
+    print(f"Primo byte (p50): {riepilogo['first_byte_p50_s']}s")
+
+
+if __name__ == '__main__':
+    main()
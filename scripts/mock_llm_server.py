@@ -0,0 +1,109 @@
+"""Server LLM di prova compatibile con l'API chat completions di OpenAI.
+
+Risponde dopo una latenza configurabile, anche in streaming (stream=True),
+senza chiamare servizi esterni. Da usare con:
+
+    LLM_BACKEND=openai OPENAI_API_KEY=test OPENAI_BASE_URL=http://127.0.0.1:8001/v1
+"""
+import argparse
+import json
+import sys
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from llm import risposta_di_prova  # noqa: E402
+
+
+class MockLLMHandler(BaseHTTPRequestHandler):
+    latenza = 0.5
+    latenza_token = 0.02
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self.send_error(404)
+            return
+
+        richiesta = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        testo = risposta_di_prova(richiesta.get('messages', []), richiesta.get('response_format'))
+        time.sleep(self.latenza)
+
+        if richiesta.get('stream'):
+            self._invia_stream(richiesta, testo)
+        else:
+            self._invia_json(richiesta, testo)
+
+    def _invia_json(self, richiesta, testo):
+        corpo = json.dumps({
+            'id': f"chatcmpl-{uuid.uuid4().hex}",
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': richiesta.get('model', 'mock'),
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': testo},
+                'finish_reason': 'stop'
+            }],
+            'usage': {'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0}
+        }).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def _invia_stream(self, richiesta, testo):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+
+        identificativo = f"chatcmpl-{uuid.uuid4().hex}"
+        parole = testo.split(' ')
+        for i, parola in enumerate(parole):
+            time.sleep(self.latenza_token)
+            chunk = {
+                'id': identificativo,
+                'object': 'chat.completion.chunk',
+                'created': int(time.time()),
+                'model': richiesta.get('model', 'mock'),
+                'choices': [{
+                    'index': 0,
+                    'delta': {'content': parola + (' ' if i < len(parole) - 1 else '')},
+                    'finish_reason': None
+                }]
+            }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            self.wfile.flush()
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--latency-ms', type=int, default=500, help='attesa prima della risposta')
+    parser.add_argument('--token-ms', type=int, default=20, help='attesa tra i token in streaming')
+    args = parser.parse_args()
+
+    MockLLMHandler.latenza = args.latency_ms / 1000
+    MockLLMHandler.latenza_token = args.token_ms / 1000
+
+    server = ThreadingHTTPServer((args.host, args.port), MockLLMHandler)
+    server.daemon_threads = True
+    print(f"Mock LLM in ascolto su http://{args.host}:{args.port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+import json
+import re
+
+NUMERO_RE = re.compile(r'\d+')
+
+
+# Estrae gli oggetti JSON da un testo che arriva a frammenti (stream del modello),
+# tollerando testo prima e dopo, blocchi ```json, un oggetto contenitore o una
+# lista, e output troncato: ogni oggetto viene restituito appena si chiude.
+# Solo gli oggetti che contengono la chiave richiesta vengono restituiti
+class ParserJSONIncrementale:
+    def __init__(self, chiave='id', max_preambolo=300):
+        self.chiave = chiave
+        self.max_preambolo = max_preambolo
+        self._buffer = []
+        self._lunghezza = 0
+        self._aperture = []
+        self._in_stringa = False
+        self._escape = False
+        self._inizio_json = None
+
+    # Vero se dopo max_preambolo caratteri non è ancora comparso JSON: la risposta
+    # non è nel formato richiesto ed è inutile attendere il resto
+    @property
+    def malformato(self):
+        return self._inizio_json is None and self._lunghezza > self.max_preambolo
+
+    def feed(self, frammento):
+        trovati = []
+        for carattere in frammento:
+            posizione = self._lunghezza
+            self._buffer.append(carattere)
+            self._lunghezza += 1
+
+            if self._in_stringa:
+                if self._escape:
+                    self._escape = False
+                elif carattere == '\\':
+                    self._escape = True
+                elif carattere == '"':
+                    self._in_stringa = False
+                continue
+
+            if carattere == '"' and self._aperture:
+                self._in_stringa = True
+            elif carattere in '{[':
+                if self._inizio_json is None:
+                    self._inizio_json = posizione
+                self._aperture.append((carattere, posizione))
+            elif carattere in '}]' and self._aperture:
+                apertura, inizio = self._aperture.pop()
+                if apertura == '{' and carattere == '}':
+                    oggetto = self._decodifica(inizio, posizione + 1)
+                    if oggetto is not None:
+                        trovati.append(oggetto)
+        return trovati
+
+    def _decodifica(self, inizio, fine):
+        try:
+            oggetto = json.loads(''.join(self._buffer[inizio:fine]))
+        except ValueError:
+            return None
+        if isinstance(oggetto, dict) and self.chiave in oggetto:
+            return oggetto
+        return None
+
+
+# Tutti gli oggetti con la chiave richiesta presenti in un testo completo
+def estrai_oggetti(testo, chiave='id'):
+    return ParserJSONIncrementale(chiave, max_preambolo=len(testo or '') + 1).feed(testo or '')
+
+
+# Identificativo numerico da valori come 12, "12", "ID: 12"
+def normalizza_id(valore):
+    if isinstance(valore, bool):
+        return None
+    if isinstance(valore, int):
+        return valore
+    corrispondenza = NUMERO_RE.search(str(valore or ''))
+    return int(corrispondenza.group(0)) if corrispondenza else None
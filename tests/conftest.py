@@ -0,0 +1,67 @@
+import os
+import sqlite3
+import sys
+from pathlib import Path
+
+import pytest
+
+RADICE = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(RADICE))
+
+# Configurazione letta da app.py all'importazione: niente migrazioni su data/,
+# niente profiler, modello sostituito nei singoli test da llm.FakeBackend
+os.environ.update({
+    'AUTO_MIGRATE': 'False',
+    'PROFILER_ENABLED': 'False',
+    'ENABLE_AI': 'False',
+    'CHATBOT_CACHE_ENABLED': 'False',
+    'SUGGESTIONS_CACHE_ENABLED': 'False',
+})
+
+
+@pytest.fixture(scope='session')
+def app_module():
+    import app
+
+    app.app.testing = True
+    return app
+
+
+# Database RIZA e Admin nuovi e migrati in una cartella temporanea, con un docente
+@pytest.fixture
+def databases(app_module, tmp_path, monkeypatch):
+    monkeypatch.setattr(app_module, 'DB_PATH', str(tmp_path / 'riza.db'))
+    monkeypatch.setattr(app_module, 'ADMIN_DB_PATH', str(tmp_path / 'admin.db'))
+    app_module.init_databases()
+
+    conn = sqlite3.connect(app_module.ADMIN_DB_PATH)
+    conn.execute(
+        "INSERT INTO users (name, email, password, role) VALUES ('Docente', 'docente@test.local', 'test', 'docente')"
+    )
+    conn.commit()
+    conn.close()
+
+    yield app_module
+    app_module.activity_logger.flush()
+    app_module.db_manager.chiudi_tutte()
+
+
+@pytest.fixture
+def client(databases):
+    client = databases.app.test_client()
+    client.post('/login', data={'email': 'docente@test.local', 'password': 'test'})
+    return client
+
+
+# Abilita l'AI con un FakeBackend: fake_llm(latenza_ms=..., risponditore=...)
+@pytest.fixture
+def fake_llm(app_module, monkeypatch):
+    from llm import FakeBackend
+
+    def installa(**opzioni):
+        backend = FakeBackend(**opzioni)
+        monkeypatch.setattr(app_module, 'ENABLE_AI', True)
+        monkeypatch.setattr(app_module, 'llm_backend', backend)
+        return backend
+
+    return installa
@@ -0,0 +1,28 @@
+import sqlite3
+
+
+def test_dashboard_con_dettagli_delle_attivita(databases):
+    conn = sqlite3.connect(databases.ADMIN_DB_PATH)
+    conn.execute(
+        "INSERT INTO users (name, email, password, role) VALUES ('Admin', 'admin@test.local', 'test', 'admin')"
+    )
+    conn.executemany(
+        "INSERT INTO activities (user_id, user_name, activity_type, details) VALUES (1, 'Docente', ?, ?)",
+        [
+            ('save_observation', '{"allievo": "Anna", "disciplina": "Matematica"}'),
+            ('page_view', '{"page": "home"}'),
+            ('chatbot_query', 'testo non JSON'),
+        ],
+    )
+    conn.commit()
+    conn.close()
+
+    client = databases.app.test_client()
+    client.post('/login', data={'email': 'admin@test.local', 'password': 'test'})
+    risposta = client.get('/admin/dashboard')
+
+    corpo = risposta.get_data(as_text=True)
+    assert risposta.status_code == 200
+    assert not corpo.startswith('Errore'), corpo
+    assert 'Allievo: Anna, Disciplina: Matematica' in corpo
+    assert 'Pagina: home' in corpo
@@ -0,0 +1,124 @@
+import json
+import time
+
+from chatbot import MODE_ASYNC, MODE_MERGED, MODE_SERIAL, genera_risposta_e_suggerimenti
+from llm import FakeBackend
+
+LATENZA_MS = 150
+
+
+def chiedi(client, domanda='Come valuto il lavoro di gruppo?'):
+    risposta = client.post('/chatbot_query', json={'query': domanda})
+    assert risposta.status_code == 200
+    return risposta.json
+
+
+# Eventi Server-Sent Events del corpo: ogni blocco è "event: nome" e "data: json",
+# terminato da una riga vuota
+def leggi_eventi(risposta):
+    assert risposta.status_code == 200
+    assert risposta.mimetype == 'text/event-stream'
+    corpo = risposta.get_data(as_text=True)
+    assert corpo.endswith('\n\n')
+
+    eventi = []
+    for blocco in corpo[:-2].split('\n\n'):
+        righe = blocco.split('\n')
+        assert len(righe) == 2 and righe[0].startswith('event: ') and righe[1].startswith('data: '), blocco
+        eventi.append((righe[0][len('event: '):], json.loads(righe[1][len('data: '):])))
+    return eventi
+
+
+def test_merged_una_sola_chiamata_con_risposta_e_domande(client, fake_llm, monkeypatch, app_module):
+    monkeypatch.setattr(app_module, 'CHATBOT_MODE', MODE_MERGED)
+    backend = fake_llm(latenza_ms=LATENZA_MS)
+
+    dati = chiedi(client)
+
+    assert backend.chiamate == 1
+    assert dati['response'].startswith('Risposta di prova')
+    assert dati['suggestions'] == [f"Domanda correlata di prova {i}" for i in range(1, 6)]
+
+
+def test_merged_json_non_valido_diventa_la_risposta(client, fake_llm, monkeypatch, app_module):
+    monkeypatch.setattr(app_module, 'CHATBOT_MODE', MODE_MERGED)
+    fake_llm(risponditore=lambda messages, response_format: 'Testo libero {"risposta": ')
+
+    dati = chiedi(client)
+
+    assert dati['response'] == 'Testo libero {"risposta": '
+    assert dati['suggestions'] == []
+
+
+def test_merged_json_senza_campi_attesi():
+    backend = FakeBackend(risponditore=lambda messages, response_format: '{"altro": 1}')
+    risposta, suggerimenti = genera_risposta_e_suggerimenti(backend, 'domanda', 'modello', 100, 0.7)
+    assert risposta == '{"altro": 1}'
+    assert suggerimenti == []
+
+
+def test_async_token_e_long_poll(client, fake_llm, monkeypatch, app_module):
+    monkeypatch.setattr(app_module, 'CHATBOT_MODE', MODE_ASYNC)
+    fake_llm(latenza_ms=LATENZA_MS)
+
+    dati = chiedi(client)
+    assert dati['response'].startswith('Risposta di prova')
+    assert dati['suggestions'] == []
+    token = dati['suggestions_token']
+
+    # Subito dopo la risposta le domande sono ancora in generazione
+    assert client.get(f'/chatbot_suggestions/{token}').json == {'ready': False, 'suggestions': []}
+
+    pronte = client.get(f'/chatbot_suggestions/{token}?wait=5').json
+    assert pronte['ready'] is True
+    assert len(pronte['suggestions']) == 5
+
+    # Il risultato viene consegnato una sola volta
+    assert 'error' in client.get(f'/chatbot_suggestions/{token}').json
+
+
+def test_long_poll_con_wait_non_numerico(client):
+    risposta = client.get('/chatbot_suggestions/sconosciuto?wait=abc')
+    assert risposta.status_code == 200
+    assert risposta.json['ready'] is True
+    assert risposta.json['suggestions'] == []
+
+
+def test_merged_piu_veloce_di_serial(client, fake_llm, monkeypatch, app_module):
+    fake_llm(latenza_ms=LATENZA_MS)
+    durate = {}
+    for modalita in (MODE_SERIAL, MODE_MERGED):
+        monkeypatch.setattr(app_module, 'CHATBOT_MODE', modalita)
+        inizio = time.perf_counter()
+        dati = chiedi(client, f'Domanda in modalità {modalita}')
+        durate[modalita] = time.perf_counter() - inizio
+        assert len(dati['suggestions']) == 5
+
+    # serial: due chiamate in sequenza; merged: una sola
+    assert durate[MODE_SERIAL] >= 2 * LATENZA_MS / 1000
+    assert durate[MODE_MERGED] < durate[MODE_SERIAL] - LATENZA_MS / 1000 / 2
+
+
+def test_stream_token_per_token(client, fake_llm, monkeypatch, app_module):
+    monkeypatch.setattr(app_module, 'CHATBOT_MODE', MODE_SERIAL)
+    fake_llm(latenza_token_ms=0)
+    domanda = 'Come valuto il lavoro di gruppo?'
+
+    eventi = leggi_eventi(client.post('/chatbot_query_stream', json={'query': domanda}))
+
+    nomi = [nome for nome, _ in eventi]
+    token = [dati['text'] for nome, dati in eventi if nome == 'token']
+    assert len(token) > 1
+    assert nomi == ['token'] * len(token) + ['suggestions', 'done']
+    assert ''.join(token) == f"Risposta di prova alla domanda: {domanda}"
+    assert eventi[-2][1]['suggestions'] == [f"Domanda correlata di prova {i}" for i in range(1, 6)]
+    assert eventi[-1][1] == {}
+
+
+def test_stream_errore_del_modello(client, fake_llm):
+    fake_llm(latenza_token_ms=0, tasso_errori=1.0)
+
+    eventi = leggi_eventi(client.post('/chatbot_query_stream', json={'query': 'Domanda'}))
+
+    assert [nome for nome, _ in eventi] == ['error']
+    assert 'Errore simulato' in eventi[0][1]['error']
@@ -0,0 +1,39 @@
+import os
+
+import numpy as np
+
+from embedding_index import LUNGHEZZA_IMPRONTA, EmbeddingIndex, HashedEmbedder
+from text_analysis import TextAnalyzer
+
+
+def indice(tmp_path, dim=8):
+    return EmbeddingIndex(None, str(tmp_path / 'descrittori.emb'), HashedEmbedder(TextAnalyzer(), dim=dim))
+
+
+def test_salva_e_carica_con_impronta_nel_file(tmp_path):
+    idx = indice(tmp_path)
+    vettori = np.arange(24, dtype=np.float32).reshape(3, 8)
+
+    salvati = idx._salva(vettori, 'a' * LUNGHEZZA_IMPRONTA)
+
+    assert np.array_equal(salvati, vettori)
+    assert np.array_equal(idx._carica('a' * LUNGHEZZA_IMPRONTA, 3), vettori)
+    assert os.listdir(tmp_path) == ['descrittori.emb']
+
+
+def test_vettori_di_un_altra_versione_sono_ricalcolati(tmp_path):
+    idx = indice(tmp_path)
+    idx._salva(np.ones((3, 8), dtype=np.float32), 'a' * LUNGHEZZA_IMPRONTA)
+
+    # Impronta diversa, numero di righe diverso, file troncato
+    assert idx._carica('b' * LUNGHEZZA_IMPRONTA, 3) is None
+    assert idx._carica('a' * LUNGHEZZA_IMPRONTA, 4) is None
+    with open(idx.path, 'r+b') as f:
+        f.truncate(LUNGHEZZA_IMPRONTA + 10)
+    assert idx._carica('a' * LUNGHEZZA_IMPRONTA, 3) is None
+
+
+def test_nessun_descrittore(tmp_path):
+    idx = indice(tmp_path)
+    idx._salva(np.zeros((0, 8), dtype=np.float32), 'c' * LUNGHEZZA_IMPRONTA)
+    assert idx._carica('c' * LUNGHEZZA_IMPRONTA, 0).shape == (0, 8)
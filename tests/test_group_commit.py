@@ -0,0 +1,179 @@
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+import pytest
+
+from group_commit import ScritturaInCorsoError, ScrittoreRaggruppato
+
+INSERT = "INSERT INTO note (testo) VALUES (?)"
+
+
+@pytest.fixture
+def percorso(tmp_path):
+    percorso = str(tmp_path / 'note.db')
+    conn = sqlite3.connect(percorso)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("CREATE TABLE note (id INTEGER PRIMARY KEY, testo TEXT)")
+    conn.close()
+    return percorso
+
+
+# Connessione come quelle del pool: WAL, fsync a ogni commit, attesa del lock
+def connessione(percorso):
+    conn = sqlite3.connect(percorso, timeout=30)
+    conn.execute("PRAGMA synchronous = FULL")
+    return conn
+
+
+# Connessione il cui commit fallisce, e con rotto=True anche il rollback
+class ConnessioneGuasta(sqlite3.Connection):
+    rotto = False
+
+    def commit(self):
+        raise sqlite3.OperationalError('disk I/O error')
+
+    def rollback(self):
+        if self.rotto:
+            raise sqlite3.OperationalError('rollback fallito')
+        super().rollback()
+
+
+def righe(percorso):
+    conn = sqlite3.connect(percorso)
+    try:
+        return [r[0] for r in conn.execute("SELECT testo FROM note ORDER BY id")]
+    finally:
+        conn.close()
+
+
+def test_scritture_concorrenti_in_meno_transazioni(percorso):
+    n = 50
+    scrittore = ScrittoreRaggruppato(lambda: sqlite3.connect(percorso), finestra_ms=20)
+    partenza = threading.Barrier(n)
+
+    def scrivi(i):
+        partenza.wait()
+        return scrittore.esegui(INSERT, (f'nota {i}',))
+
+    with ThreadPoolExecutor(max_workers=n) as pool:
+        ids = list(pool.map(scrivi, range(n)))
+
+    assert len(set(ids)) == n
+    assert sorted(righe(percorso)) == sorted(f'nota {i}' for i in range(n))
+    statistiche = scrittore.statistiche()
+    assert statistiche['scritture'] == n
+    assert statistiche['transazioni'] < n
+
+
+# Stesso carico concorrente (thread x salvataggi) con una transazione per
+# richiesta e con il group commit: raggruppando i commit il carico finisce prima
+def test_group_commit_piu_veloce_delle_transazioni_per_richiesta(percorso):
+    thread, salvataggi = 32, 10
+    scrittore = ScrittoreRaggruppato(lambda: connessione(percorso), finestra_ms=2)
+
+    def per_richiesta(i):
+        for j in range(salvataggi):
+            conn = connessione(percorso)
+            conn.execute(INSERT, (f'{i}-{j}',))
+            conn.commit()
+            conn.close()
+
+    def raggruppato(i):
+        for j in range(salvataggi):
+            scrittore.esegui(INSERT, (f'{i}-{j}',))
+
+    durate = {}
+    for modalita in (per_richiesta, raggruppato):
+        inizio = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=thread) as pool:
+            list(pool.map(modalita, range(thread)))
+        durate[modalita.__name__] = time.perf_counter() - inizio
+
+    assert len(righe(percorso)) == 2 * thread * salvataggi
+    assert durate['raggruppato'] < durate['per_richiesta'], durate
+
+
+def test_timeout_non_duplica_la_scrittura(percorso):
+    presa, sblocca = threading.Event(), threading.Event()
+
+    # Il writer resta fermo sulla prima scrittura finché il test non lo sblocca
+    def connessione_lenta():
+        presa.set()
+        sblocca.wait(5)
+        return sqlite3.connect(percorso)
+
+    # La scrittura già presa ha 2 x timeout per finire dopo lo sblocco
+    scrittore = ScrittoreRaggruppato(connessione_lenta, finestra_ms=0, timeout=0.3)
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        in_corso = pool.submit(scrittore.esegui, INSERT, ('già presa',))
+        assert presa.wait(5)
+
+        # Ancora in coda allo scadere del timeout: viene annullata
+        with pytest.raises(FutureTimeoutError):
+            scrittore.esegui(INSERT, ('in coda',))
+
+        sblocca.set()
+        # Già presa dal writer: si attende l'esito oltre il timeout
+        assert in_corso.result(5) is not None
+
+    scrittore.esegui(INSERT, ('nuovo tentativo',))
+    assert righe(percorso) == ['già presa', 'nuovo tentativo']
+
+
+def test_attesa_limitata_se_il_writer_resta_bloccato(percorso):
+    presa, sblocca = threading.Event(), threading.Event()
+
+    def connessione_bloccata():
+        presa.set()
+        sblocca.wait(5)
+        return sqlite3.connect(percorso)
+
+    scrittore = ScrittoreRaggruppato(connessione_bloccata, finestra_ms=0, timeout=0.1)
+    inizio = time.monotonic()
+    with pytest.raises(ScritturaInCorsoError):
+        scrittore.esegui(INSERT, ('bloccata',))
+    assert time.monotonic() - inizio < 1
+    assert presa.is_set()
+    sblocca.set()
+
+
+@pytest.mark.parametrize('rollback_rotto', [False, True])
+def test_transazione_fallita_risolve_tutte_le_scritture(percorso, rollback_rotto):
+    guasta = {'attiva': True}
+
+    def connessione_guasta():
+        if guasta['attiva']:
+            conn = sqlite3.connect(percorso, factory=ConnessioneGuasta)
+            conn.rotto = rollback_rotto
+            return conn
+        return sqlite3.connect(percorso)
+
+    scrittore = ScrittoreRaggruppato(connessione_guasta, finestra_ms=20, timeout=2)
+    with ThreadPoolExecutor(max_workers=5) as pool:
+        esiti = [pool.submit(scrittore.esegui, INSERT, (f'nota {i}',)) for i in range(5)]
+        for esito in esiti:
+            with pytest.raises(sqlite3.OperationalError):
+                esito.result(5)
+
+    # Il writer resta attivo dopo il batch fallito
+    guasta['attiva'] = False
+    scrittore.esegui(INSERT, ('dopo il guasto',))
+    assert righe(percorso) == ['dopo il guasto']
+    assert scrittore.statistiche()['errori'] == 5
+
+
+def test_errore_imprevisto_del_writer_non_lascia_chiamanti_in_attesa(percorso, monkeypatch):
+    scrittore = ScrittoreRaggruppato(lambda: sqlite3.connect(percorso), finestra_ms=0, timeout=2)
+
+    def guasto(batch):
+        raise RuntimeError('errore imprevisto')
+
+    monkeypatch.setattr(scrittore, '_transazione', guasto)
+    with pytest.raises(RuntimeError, match='errore imprevisto'):
+        scrittore.esegui(INSERT, ('persa',))
+
+    monkeypatch.undo()
+    scrittore.esegui(INSERT, ('salvata',))
+    assert righe(percorso) == ['salvata']
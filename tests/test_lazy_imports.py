@@ -0,0 +1,54 @@
+import importlib.util
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+RADICE = Path(__file__).resolve().parent.parent
+
+MODULI_PESANTI = ('sklearn', 'scipy', 'numpy', 'openai')
+
+
+# In un processo separato (con la configurazione di conftest): nella sessione
+# di test NumPy può essere già stato importato da altri test
+def test_import_app_non_carica_i_moduli_pesanti():
+    codice = (
+        "import json, sys\n"
+        "import app\n"
+        f"print(json.dumps([m for m in {MODULI_PESANTI!r} if m in sys.modules]))\n"
+    )
+    esito = subprocess.run(
+        [sys.executable, '-c', codice], cwd=RADICE, env=dict(os.environ),
+        capture_output=True, text=True, timeout=60,
+    )
+    assert esito.returncode == 0, esito.stderr
+    assert json.loads(esito.stdout.strip().splitlines()[-1]) == []
+
+
+def carica_check_import_time():
+    spec = importlib.util.spec_from_file_location('check_import_time', RADICE / 'scripts' / 'check_import_time.py')
+    modulo = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(modulo)
+    return modulo
+
+
+# Tempo cumulativo di "import app" misurato con python -X importtime (mediana di
+# tre processi puliti) entro il budget di scripts/check_import_time.py.
+# IMPORT_TIME_BUDGET_MS alza il budget, IMPORT_TIME_BUDGET_MS=0 salta il controllo
+def test_tempo_di_importazione_entro_il_budget():
+    check = carica_check_import_time()
+    if check.BUDGET_MS <= 0:
+        pytest.skip('controllo del tempo di importazione disattivato (IMPORT_TIME_BUDGET_MS=0)')
+
+    esecuzioni = [check.misura('app') for _ in range(3)]
+    mediana = statistics.median(tempi['app'] / 1000 for tempi in esecuzioni)
+
+    lenti = sorted(((v, k) for k, v in esecuzioni[-1].items() if k != 'app'), reverse=True)[:5]
+    assert mediana <= check.BUDGET_MS, (
+        f"import app: {mediana:.0f} ms, budget {check.BUDGET_MS:.0f} ms; più lenti: "
+        + ', '.join(f"{nome} {tempo / 1000:.0f} ms" for tempo, nome in lenti)
+    )
@@ -0,0 +1,56 @@
+import sqlite3
+
+from migrations import RIZA_MIGRAZIONI, applica_migrazioni
+from observation_search import costruisci_ricerca, tutte_le_osservazioni
+
+
+def test_paginazione_keyset_include_data_creazione_null(tmp_path):
+    percorso = str(tmp_path / 'riza.db')
+    applica_migrazioni(percorso, RIZA_MIGRAZIONI)
+    conn = sqlite3.connect(percorso)
+    conn.executemany(
+        "INSERT INTO osservazioni (allievo, classe, disciplina, osservazione, data_creazione) "
+        "VALUES ('Anna', '3A', 'Matematica', ?, ?)",
+        [(f'nota {i}', None if i % 3 == 0 else f'2024-01-{i + 1:02d} 10:00:00') for i in range(20)],
+    )
+    conn.commit()
+    conn.close()
+
+    def connessione():
+        conn = sqlite3.connect(percorso)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    righe = list(tutte_le_osservazioni(connessione, {}, blocco=4))
+
+    assert len(righe) == 20
+    assert len({r['id'] for r in righe}) == 20
+    # Le righe senza data in fondo, dalla più recente
+    assert [r['data_creazione'] for r in righe[-7:]] == [None] * 7
+    assert [r['id'] for r in righe[-7:]] == sorted((r['id'] for r in righe[-7:]), reverse=True)
+
+
+def test_pagina_successiva_usa_l_indice(tmp_path):
+    percorso = str(tmp_path / 'riza.db')
+    applica_migrazioni(percorso, RIZA_MIGRAZIONI)
+    conn = sqlite3.connect(percorso)
+    try:
+        for filtri in ({}, {'disciplina': 'Matematica'}, {'dimensione': 'Azione'}):
+            query, params = costruisci_ricerca(**filtri, cursore={'data_creazione': '', 'id': 5}, limite=51)
+            piano = ' | '.join(r[3] for r in conn.execute(f"EXPLAIN QUERY PLAN {query}", params))
+            assert 'USING INDEX idx_osservazioni_' in piano, piano
+            assert 'TEMP B-TREE' not in piano, piano
+    finally:
+        conn.close()
+
+
+def test_api_observations_parametri_non_validi(client):
+    for parametri in ('limit=0', 'limit=-5', 'cursor=non-valido'):
+        risposta = client.get(f'/api/observations?{parametri}')
+        assert risposta.status_code == 400, parametri
+        assert risposta.json['success'] is False
+
+    # limit non numerico: pagina predefinita, nessun errore interno restituito
+    risposta = client.get('/api/observations?limit=abc')
+    assert risposta.status_code == 200
+    assert risposta.json['success'] is True
@@ -0,0 +1,50 @@
+import threading
+import time
+
+from profiler import SamplingProfiler
+
+
+def attesa_attiva(secondi):
+    fine = time.perf_counter() + secondi
+    while time.perf_counter() < fine:
+        pass
+
+
+def test_richiesta_lenta_salvata_in_formato_folded(tmp_path):
+    profiler = SamplingProfiler(str(tmp_path), soglia_ms=0, intervallo_ms=1)
+    profiler.inizia()
+    attesa_attiva(0.1)
+    percorso = profiler.termina(0.1, 'prova/lenta')
+
+    with open(percorso) as f:
+        righe = f.read().splitlines()
+    assert righe
+    for riga in righe:
+        stack, conteggio = riga.rsplit(' ', 1)
+        assert int(conteggio) > 0
+    assert any('attesa_attiva' in riga for riga in righe)
+
+
+# Molte richieste brevi in parallelo con il campionatore sempre attivo: termina()
+# non deve mai leggere un contatore che il campionatore sta modificando
+def test_termina_mentre_il_campionatore_aggiorna(tmp_path):
+    profiler = SamplingProfiler(str(tmp_path), soglia_ms=0, intervallo_ms=0, max_file=10**6)
+    errori = []
+
+    def richieste():
+        try:
+            for _ in range(200):
+                profiler.inizia()
+                attesa_attiva(0.0005)
+                profiler.termina(1, 'concorrente')
+        except Exception as e:
+            errori.append(e)
+
+    thread = [threading.Thread(target=richieste) for _ in range(4)]
+    for t in thread:
+        t.start()
+    for t in thread:
+        t.join()
+
+    assert errori == []
+    assert profiler.salvati > 0
@@ -0,0 +1,20 @@
+import sqlite3
+
+import pytest
+
+from migrations import QUERY_CRITICHE_ADMIN, QUERY_CRITICHE_RIZA, verifica_piani
+
+QUERY = [('DB_PATH', nome) for nome in QUERY_CRITICHE_RIZA] + [('ADMIN_DB_PATH', nome) for nome in QUERY_CRITICHE_ADMIN]
+
+
+# Ogni query critica, sui database appena migrati, usa un indice e non ordina
+# con un B-tree temporaneo (come flask check-query-plans)
+@pytest.mark.parametrize('percorso, nome', QUERY)
+def test_piano_query_critica(databases, percorso, nome):
+    query = QUERY_CRITICHE_RIZA if percorso == 'DB_PATH' else QUERY_CRITICHE_ADMIN
+    conn = sqlite3.connect(getattr(databases, percorso))
+    try:
+        ok, piano = verifica_piani(conn, {nome: query[nome]})[nome]
+    finally:
+        conn.close()
+    assert ok, ' | '.join(piano)
@@ -0,0 +1,28 @@
+def chiedi_batch(client, **dati):
+    risposta = client.post('/get_suggestions_batch', json={
+        'osservazioni': ['Risolve il problema da solo', 'Chiede aiuto ai compagni'],
+        'disciplina': 'Matematica',
+        **dati,
+    })
+    assert risposta.status_code == 200
+    return risposta.json
+
+
+def test_top_k_non_numerico(client):
+    dati = chiedi_batch(client, top_k='molti')
+    assert 'error' in dati
+    assert dati['results'] == []
+
+
+def test_top_k_limitato(client, app_module, monkeypatch):
+    richiesti = []
+    monkeypatch.setattr(
+        app_module.matcher, 'cerca_batch',
+        lambda disciplina, testi, top_k: richiesti.append(top_k) or [[] for _ in testi],
+    )
+
+    for top_k, atteso in ((10**9, app_module.BATCH_MAX_TOP_K), (0, 1), (-3, 1), ('7', 7)):
+        dati = chiedi_batch(client, top_k=top_k)
+        assert 'error' not in dati
+        assert len(dati['results']) == 2
+        assert richiesti.pop() == atteso
@@ -0,0 +1,103 @@
+import re
+import threading
+import unicodedata
+
+# Parole funzionali italiane (articoli, preposizioni, pronomi, ausiliari, congiunzioni):
+# non aiutano a distinguere i descrittori e gonfiano solo il vocabolario
+STOP_WORDS_ITALIANO = frozenset("""
+a ad agli ai al all alla alle allo anche avere aveva avevano c che chi ci coi col come con contro cui
+da dagli dai dal dall dalla dalle dallo degli dei del dell della delle dello dentro di dov dove e ed
+essere fra gli ha hanno ho i il in io l la le lei li lo loro lui ma me mi mia mie miei mio ne negli nei
+nel nell nella nelle nello noi non nostra nostre nostri nostro o per perche piu po poi quale quali quando
+quanto quella quelle quelli quello questa queste questi questo se sei si sia siamo siano sono su sua sue
+sugli sui sul sull sulla sulle sullo suo suoi ti tra tu tua tue tuo tuoi tutti tutto un una uno vi voi
+e' era erano essa esse essi esso fa fanno fare fu gia molto nostri ogni oppure pero puo qui senza
+sempre solo stato sta stanno tale tali tanto te tutte tuttavia uno verso via vostro
+""".split())
+
+# Suffissi rimossi dallo stemmer leggero, dal più lungo al più corto
+SUFFISSI = (
+    'amenti', 'imenti', 'amento', 'imento', 'azioni', 'azione', 'uzioni', 'uzione',
+    'mente', 'zioni', 'zione', 'abili', 'abile', 'ibili', 'ibile', 'ismi', 'ismo', 'iste', 'isti', 'ista',
+    'ando', 'endo', 'ante', 'anti', 'ente', 'enti',
+    'are', 'ere', 'ire', 'ato', 'ata', 'ati', 'ate', 'uto', 'uta', 'uti', 'ute', 'ito', 'ita', 'iti', 'ite',
+    'ano', 'ono',
+    'i', 'e', 'a', 'o',
+)
+
+LUNGHEZZA_MINIMA_RADICE = 3
+
+TOKEN_RE = re.compile(r"[^\W\d_]+", re.UNICODE)
+
+
+# Rimuove gli accenti (è -> e, perché -> perche)
+def rimuovi_accenti(testo):
+    decomposto = unicodedata.normalize('NFKD', testo)
+    return ''.join(c for c in decomposto if not unicodedata.combining(c))
+
+
+# Stemmer leggero per l'italiano: elimina desinenze e suffissi derivativi frequenti
+def stem_italiano(parola):
+    for suffisso in SUFFISSI:
+        if parola.endswith(suffisso) and len(parola) - len(suffisso) >= LUNGHEZZA_MINIMA_RADICE:
+            return parola[:-len(suffisso)]
+    return parola
+
+
+# Pipeline di analisi del testo configurabile e collegabile al TfidfVectorizer
+class TextAnalyzer:
+    def __init__(self, stop_words=STOP_WORDS_ITALIANO, stemming=True, rimuovi_accenti=True,
+                 char_ngrams=None, max_cache=10000):
+        self.stop_words = frozenset(rimuovi_accenti_parola(w) for w in stop_words) if stop_words else frozenset()
+        self.stemming = stemming
+        self.rimuovi_accenti = rimuovi_accenti
+        self.char_ngrams = char_ngrams
+        self.max_cache = max_cache
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def analizza(self, testo):
+        testo = (testo or '').lower()
+        if self.rimuovi_accenti:
+            testo = rimuovi_accenti(testo)
+
+        tokens = [t for t in TOKEN_RE.findall(testo) if len(t) > 1 and t not in self.stop_words]
+        if self.stemming:
+            tokens = [stem_italiano(t) for t in tokens]
+
+        if self.char_ngrams:
+            # N-grammi di caratteri per parola (come char_wb), utili con refusi e flessioni
+            min_n, max_n = self.char_ngrams
+            ngrams = []
+            for t in tokens:
+                parola = f' {t} '
+                for n in range(min_n, max_n + 1):
+                    ngrams.extend(parola[i:i + n] for i in range(max(len(parola) - n + 1, 1)))
+            return ngrams
+
+        return tokens
+
+    # Versione con cache per i descrittori: ogni testo viene analizzato una sola volta,
+    # anche attraverso le ricostruzioni dell'indice
+    def analizza_descrittore(self, testo):
+        tokens = self._cache.get(testo)
+        if tokens is None:
+            tokens = self.analizza(testo)
+            with self._lock:
+                if len(self._cache) >= self.max_cache:
+                    self._cache.clear()
+                self._cache[testo] = tokens
+        return tokens
+
+
+def rimuovi_accenti_parola(parola):
+    return rimuovi_accenti(parola.lower())
+
+
+# Legge il range di n-grammi da una stringa tipo "3-5" (vuota o "0" = disattivati)
+def parse_char_ngrams(valore):
+    valore = (valore or '').strip()
+    if not valore or valore == '0':
+        return None
+    min_n, _, max_n = valore.partition('-')
+    return int(min_n), int(max_n or min_n)